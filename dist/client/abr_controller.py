@@ -0,0 +1,201 @@
+"""
+Bitrate selection for one playback session.
+
+AbrController holds the state of the rate adaptation of a session (download
+history, SARA weighted mean, Netflix rate estimate and rate map, MCOM
+selection) and calls the modules in adaptation/. It does not download
+anything, so the same dispatch is used by the client
+(dash_client.start_playback_smart), the trace driven simulation
+(simulation.py) and the load generator.
+
+    abr = AbrController(dp_object, "NETFLIX", segment_count=len(segments))
+    adaptation_set_id, bitrate, vmaf, delay = abr.next_segment(segment_number, dash_player)
+    ...
+    abr.update(segment_size, segment_download_time)
+"""
+from __future__ import division
+from adaptation import basic_dash, basic_dash2, bola_paper, weighted_dash, netflix_dash, mcom_dash, medusa
+from adaptation.estimators import HarmonicMean, Ewma
+from adaptation.segment_matrix import get_segment_matrix
+import config_dash
+import time
+
+PLAYBACK_TYPES = ['BASIC', 'BOLA', 'SMART', 'NETFLIX', 'MEDUSA']
+
+
+def get_segment_sizes(dp_object, segment_number):
+    """ Module to get the segment sizes for the segment_number
+    :param dp_object: The AdaptationSet
+    :param segment_number:
+    :return: Sizes aligned with the bitrates of get_segment_matrix(dp_object).ladder(dp_object.id), or None
+    """
+    try:
+        segment_sizes = get_segment_matrix(dp_object).segment_sizes(dp_object.id, segment_number)
+    except IndexError:
+        config_dash.LOG.error("Unable to get the segment sizes")
+        return None
+    config_dash.LOG.debug("The segment sizes of {} are {}".format(segment_number, segment_sizes))
+    return segment_sizes
+
+
+def get_average_segment_sizes(dp_object):
+    """
+    Module to get the avearge segment sizes for each bitrate
+    :param dp_object: The AdaptationSet
+    :return: The aveage segment sizes aligned with the bitrates of get_segment_matrix(dp_object).ladder(dp_object.id)
+    """
+    average_segment_sizes = get_segment_matrix(dp_object).average_segment_sizes(dp_object.id)
+    config_dash.LOG.info("The avearge segment size for is {}".format(average_segment_sizes))
+    return average_segment_sizes
+
+
+def get_segment_count(dp_object):
+    """ Module to get the number of segments (including the initialization segment) of the longest representation
+    :param dp_object: The DASH-playback object
+    """
+    return max([len(media.url_list) + 1 for adaptationSet in dp_object.adaptationSets
+                for media in adaptationSet.video.values()] or [0])
+
+
+class AbrController:
+    """ Per-session state of the rate adaptation """
+    def __init__(self, dp_object, playback_type, multi_codec=False, adaptation_set_id=None, segment_count=None,
+                 clock=time):
+        """
+        :param dp_object: The DASH-playback object
+        :param playback_type: 'BASIC', 'BOLA', 'SMART', 'NETFLIX' or 'MEDUSA'
+        :param multi_codec: Refine the decisions with the MCOM plugin
+        :param adaptation_set_id: Id of the AdaptationSet used by the ABR logic
+        :param segment_count: Number of segments (including the initialization segment)
+        :param clock: Object with a sleep(seconds) function, used for the waits of BOLA. Default: the time module
+        """
+        if adaptation_set_id is None:
+            adaptation_set_id = config_dash.ADAPTATION_SET_ID
+        self.dp_object = dp_object
+        self.clock = clock
+        self.playback_type = playback_type.upper()
+        self.multi_codec = multi_codec
+        self.adaptation_set_id = adaptation_set_id
+        self.adaptation_set = dp_object.getAdaptationSetFromId(adaptation_set_id)
+        # Bitrates in increasing order, shared with the segment matrix
+        self.bitrates = get_segment_matrix(self.adaptation_set).ladder(self.adaptation_set.id)
+        self.start = self.adaptation_set.video[self.bitrates[0]].start
+        self.segment_count = segment_count
+        self.average_dwn_time = 0
+        # Sizes and download times of the last BASIC_DELTA_COUNT segments (BASIC and BOLA)
+        self.download_history = HarmonicMean(config_dash.BASIC_DELTA_COUNT)
+        # Created with the first SARA decision, so the initialization segment is not averaged
+        self.weighted_mean = None
+        self.netflix_rate = Ewma.from_half_life(config_dash.NETFLIX_RATE_HALF_LIFE)
+        self.current_bitrate = self.bitrates[0]
+        self.mcom_current_bitrate = self.bitrates[0]
+        self.mcom_adaptation_set_id = adaptation_set_id
+        self.vmaf = None
+        self.last_throughput = None
+        self.segment_size = self.segment_download_time = None
+        self.average_segment_sizes = self.netflix_rate_map = None
+        self.netflix_state = "INITIAL"
+        self.bola_state = bola_paper.BolaState()
+        # Set when the ABR logic asks to stop the playback (Netflix after the last segment)
+        self.completed = False
+
+    def in_range(self, segment_number):
+        """ Checking the segment number is in acceptable range """
+        return self.segment_count is None or segment_number < self.segment_count - 1 + self.start
+
+    def next_segment(self, segment_number, dash_player):
+        """ Select the representation of the next segment
+        :param segment_number: Number of the segment (start - 1 for the initialization segment)
+        :param dash_player: Object with the interface of dash_buffer.DashPlayer
+        :return: adaptation_set_id, bitrate, vmaf, delay (in segments)
+        """
+        delay = 0
+        if segment_number == self.start - 1:
+            self.current_bitrate = self.bitrates[0]
+        elif self.playback_type == "MEDUSA":
+            self.mcom_current_bitrate, self.mcom_adaptation_set_id, self.vmaf = medusa.medusa_dash(
+                self.dp_object, dash_player, self.last_throughput, segment_number)
+        else:
+            delay = self.select_bitrate(segment_number, dash_player)
+        config_dash.LOG.info("{}: Selected {} for the segment {}".format(self.playback_type, self.current_bitrate,
+                                                                         segment_number))
+        if self.uses_mcom():
+            config_dash.LOG.info("MCOM results: Adaptation set id {} -> bitrate = {}".format(
+                self.mcom_adaptation_set_id, self.mcom_current_bitrate))
+        if self.uses_mcom() and self.mcom_current_bitrate and self.mcom_adaptation_set_id:
+            return self.mcom_adaptation_set_id, self.mcom_current_bitrate, self.vmaf, delay
+        return self.adaptation_set_id, self.current_bitrate, None, delay
+
+    def uses_mcom(self):
+        return self.multi_codec or self.playback_type == "MEDUSA"
+
+    def select_bitrate(self, segment_number, dash_player):
+        """ Run the single-codec ABR logic, refined by the MCOM plugin when multi_codec is set.
+            Returns the delay (in segments) requested by SARA
+        """
+        delay = 0
+        if self.playback_type == "BASIC":
+            self.current_bitrate, self.average_dwn_time = basic_dash2.basic_dash2(
+                segment_number, self.bitrates, self.average_dwn_time, self.download_history,
+                self.current_bitrate)
+            self.refine_bitrate(segment_number, dash_player)
+        elif self.playback_type == "BOLA":
+            self.current_bitrate = bola_paper.bola_dash(
+                segment_number, dash_player, self.bitrates, self.average_dwn_time, self.download_history,
+                self.current_bitrate, self.bola_state, self.clock)
+            self.refine_bitrate(segment_number, dash_player)
+        elif self.playback_type == "SMART":
+            if self.weighted_mean is None:
+                # SARA averages the last SARA_SAMPLE_COUNT + 1 segments
+                self.weighted_mean = HarmonicMean(config_dash.SARA_SAMPLE_COUNT + 1)
+                config_dash.LOG.debug("Initializing the weighted Mean object")
+            if self.in_range(segment_number):
+                try:
+                    self.current_bitrate, delay = weighted_dash.weighted_dash(
+                        self.bitrates, dash_player, self.weighted_mean.value,
+                        self.current_bitrate, get_segment_sizes(self.adaptation_set, segment_number))
+                    self.refine_bitrate(segment_number, dash_player)
+                except IndexError as e:
+                    config_dash.LOG.error(e)
+        elif self.playback_type == "NETFLIX":
+            if not self.average_segment_sizes:
+                self.average_segment_sizes = get_average_segment_sizes(self.adaptation_set)
+            if self.in_range(segment_number):
+                try:
+                    self.current_bitrate, self.netflix_rate_map, self.netflix_state = netflix_dash.netflix_dash(
+                        self.bitrates, dash_player, self.netflix_rate.value or 0, self.current_bitrate,
+                        self.average_segment_sizes, self.netflix_rate_map, self.netflix_state)
+                    self.refine_bitrate(segment_number, dash_player)
+                except IndexError as e:
+                    config_dash.LOG.error(e)
+            else:
+                config_dash.LOG.critical("Completed segment playback for Netflix")
+                self.completed = True
+        else:
+            config_dash.LOG.error("Unknown playback type:{}. Continuing with basic playback".format(self.playback_type))
+            self.current_bitrate, self.average_dwn_time = basic_dash.basic_dash(
+                segment_number, self.bitrates, self.average_dwn_time, self.segment_download_time,
+                self.current_bitrate)
+        return delay
+
+    def refine_bitrate(self, segment_number, dash_player):
+        """ Replace the result of the ABR logic with the MCOM plugin result """
+        if self.multi_codec:
+            self.mcom_current_bitrate, self.mcom_adaptation_set_id, self.vmaf = mcom_dash.mcom_dash(
+                self.dp_object, dash_player, self.last_throughput, self.current_bitrate,
+                self.adaptation_set_id, segment_number)
+
+    def update(self, segment_size, segment_download_time):
+        """ Update the download history after a segment
+        :param segment_size: Size of the segment in bytes
+        :param segment_download_time: Transfer time of the segment in seconds, from the first to the last byte.
+                                      The connection setup and the request round trip are not included
+        """
+        self.segment_size = segment_size
+        self.segment_download_time = segment_download_time
+        self.download_history.update(segment_size, segment_download_time)
+        if self.playback_type == "SMART" and self.weighted_mean is not None:
+            self.weighted_mean.update(segment_size, segment_download_time)
+        if segment_download_time:
+            self.netflix_rate.update(segment_size / segment_download_time)
+            self.last_throughput = segment_size * 8 / 1000 / segment_download_time
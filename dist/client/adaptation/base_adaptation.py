@@ -5,6 +5,7 @@ Adaptation algorithms
 """
 
 from __future__ import division
+from .estimators import HarmonicMean
 
 
 def calculate_rate_index(bitrates, curr_rate):
@@ -28,21 +29,21 @@ class WeightedMean:
         The weights are the sizes of the segments
     """
     def __init__(self, sample_count):
-        # List of (size, download_rate)
-        self.segment_info = list()
+        # The last sample_count + 1 segments are averaged
+        self.harmonic_mean = HarmonicMean(sample_count + 1)
         self.weighted_mean_rate = 0
         self.sample_count = sample_count
 
+    @property
+    def segment_info(self):
+        """ List of (size, download_rate) """
+        return [(size, size / download_time) for size, download_time in self.harmonic_mean.samples]
+
     def update_weighted_mean(self, segment_size, segment_download_time):
         """ Method to update the weighted harmonic mean for the segments.
             segment_size is in bytes
             segment_download_time is in seconds
             http://en.wikipedia.org/wiki/Harmonic_mean#Weighted_harmonic_mean
         """
-        segment_download_rate = segment_size / segment_download_time
-        while len(self.segment_info) > self.sample_count:
-            self.segment_info.pop(0)
-        self.segment_info.append((segment_size, segment_download_rate))
-        self.weighted_mean_rate = sum([size for size, _ in self.segment_info]) / sum([s/r for s, r in self.segment_info])
+        self.weighted_mean_rate = self.harmonic_mean.update(segment_size, segment_download_time)
         return self.weighted_mean_rate
-
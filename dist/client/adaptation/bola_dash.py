@@ -60,16 +60,23 @@ def clearBolaStateOnSeek(bolaState):
     bolaState.lastCallTimeMs = None
 
 
-def getBolaState(bitrates, stableBufferTime, segmentDuration):
+def getBolaState(bitrates, stableBufferTime, segmentDuration, sessionState=None):
+    """
+    Return the BOLA state of the playback session, initializing it on the first call.
+    Without sessionState the module-level state (one session per process) is used.
+    """
     global bolaState
-    if bolaState is None:
-        bolaState = BolaState()
-        bolaState.initializeBolaState(bitrates, stableBufferTime)
-        bolaState.lastSegmentDurationS = segmentDuration
+    if sessionState is None:
+        if bolaState is None:
+            bolaState = BolaState()
+        sessionState = bolaState
+    if sessionState.state is None:
+        sessionState.initializeBolaState(bitrates, stableBufferTime)
+        sessionState.lastSegmentDurationS = segmentDuration
     else:
-        if bolaState.lastSegmentDurationS is None:
-            bolaState.lastSegmentDurationS = segmentDuration
-    return bolaState
+        if sessionState.lastSegmentDurationS is None:
+            sessionState.lastSegmentDurationS = segmentDuration
+    return sessionState
 
 
 def utilitiesFromBitrates(bitrates):
@@ -145,7 +152,7 @@ def getQualityFromBufferLevel(bolaState, bufferLevel):
 
     for i in range(bitrateCount):
         s = (bolaState.Vp * (bolaState.utilities[i] + bolaState.gp) - bufferLevel) / bolaState.bitrates[i]
-        print("Score for quality {} is {}".format(i, s))
+        config_dash.LOG.debug("Score for quality {} is {}".format(i, s))
 
         if score is None or s >= score:
             score = s
@@ -178,20 +185,22 @@ def minBufferLevelForQuality(bolaState, quality):
     return minV
 
 
-def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_download_sizes, previous_segment_times, current_bitrate):
+def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, download_history, current_bitrate,
+              sessionState=None):
     """
     Module to predict the next_bitrate using the bola_dash algorithm. Selects the bitrate based on Lyapunov optimization.
     :param segment_number: Current segment number
     :param dash_player: Instance of the DashPlayer class
     :param bitrates: A tuple/list of available bitrates
     :param average_dwn_time: Average download time observed so far
-    :param segment_download_time:  Time taken to download the current segment
+    :param download_history: HarmonicMean of the last config_dash.BASIC_DELTA_COUNT segments
+    :param sessionState: BolaState of the playback session. Default: the module-level state
     :return: next_rate : Bitrate for the next segment
     :return: updated_dwn_time: Updated average download time
     """
 
     stableBufferTime = config_dash.STABLE_BUFFER_TIME  # in seconds
-    bolaState = getBolaState(bitrates, stableBufferTime, dash_player.segment_duration)
+    bolaState = getBolaState(bitrates, stableBufferTime, dash_player.segment_duration, sessionState)
 
     if bolaState.state == config_dash.BOLA_STATE_ONE_BITRATE:
         # shouldn't even have been called
@@ -208,7 +217,7 @@ def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_do
         delayS = 0
         if bolaState.state == config_dash.BOLA_STATE_STARTUP:
             config_dash.LOG.info('BOLA state STARTUP.')
-            quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, recent_download_sizes, previous_segment_times, current_bitrate)
+            quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, download_history, current_bitrate)
             quality = bitrates.index(quality_b)
             bolaState.placeholderBuffer = max([0, minBufferLevelForQuality(bolaState, quality) - bufferLevel])
             bolaState.lastQuality = quality
@@ -222,19 +231,19 @@ def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_do
             #     This might lead BOLA to be too optimistic and to choose a bitrate that would lead to rebuffering -
             #     if the real buffer bufferLevel runs out, the placeholder buffer cannot prevent rebuffering.
             #     However, the InsufficientBufferRule takes care of this scenario.
-            print("Buffer level -> {} s".format(bufferLevel))
+            config_dash.LOG.debug("Buffer level -> {} s".format(bufferLevel))
             updatePlaceholderBuffer(bolaState, stableBufferTime, bufferLevel)
             quality = getQualityFromBufferLevel(bolaState, bufferLevel + bolaState.placeholderBuffer)  # we want to avoid oscillations
-            print("getQualityFromBufferLevel -> {}".format(quality))
+            config_dash.LOG.debug("getQualityFromBufferLevel -> {}".format(quality))
             # We implement the "BOLA-O" variant: when network bandwidth lies between two encoded bitrate levels, stick to the lowest level.
 
-            quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, recent_download_sizes, previous_segment_times, current_bitrate)
+            quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, download_history, current_bitrate)
             qualityForThroughput = bitrates.index(quality_b)
             if quality > bolaState.lastQuality and quality > qualityForThroughput:
                 # only intervene if we are trying to *increase* quality to an *unsustainable* level
                 # we are only avoid oscillations - do not drop below last quality
                 quality = max([qualityForThroughput, bolaState.lastQuality])
-                print("Final quality -> {}".format(quality))
+                config_dash.LOG.debug("Final quality -> {}".format(quality))
             # We do not want to overfill buffer with low quality chunks.
             # Note that there will be no delay if buffer level is below MINIMUM_BUFFER_S, probably even with some margin higher than MINIMUM_BUFFER_S.
 
@@ -251,7 +260,7 @@ def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_do
                 if quality < qualityForThroughput:
                     # At top quality, allow schedule controller to decide how far to fill buffer.
                     # scheduleController.setTimeToLoadDelay(1000 * delayS)
-                    print("scheduleController.setTimeToLoadDelay(1000 * delayS)")
+                    config_dash.LOG.debug("scheduleController.setTimeToLoadDelay(1000 * delayS)")
                 else:
                     delayS = 0
 
@@ -260,7 +269,7 @@ def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_do
             # BOLA_STATE_STEADY
         else:
             config_dash.LOG.info('BOLA ABR rule invoked in bad state.')
-            quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, recent_download_sizes, previous_segment_times, current_bitrate)
+            quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, download_history, current_bitrate)
             quality = bitrates.index(quality_b)
             bolaState.state = config_dash.BOLA_STATE_STARTUP
             clearBolaStateOnSeek(bolaState)
@@ -18,6 +18,7 @@ class BolaState:
         self.Vp = None
         self.gp = None
         self.lastQuality = None
+        self.lastSegmentDurationS = None
 
     def initializeBolaState(self, bitrates, stableBufferTime):
         utilities = utilitiesFromBitrates(bitrates)
@@ -38,31 +39,31 @@ class BolaState:
             self.lastQuality = 0
 
 
-def getThroughput(previous_segment_times, recent_download_sizes):
-    # Truncating the list of download times and segment sizes
-    while len(previous_segment_times) > config_dash.BASIC_DELTA_COUNT:
-        previous_segment_times.pop(0)
-    while len(recent_download_sizes) > config_dash.BASIC_DELTA_COUNT:
-        recent_download_sizes.pop(0)
-    if len(previous_segment_times) == 0 or len(recent_download_sizes) == 0:
+def getThroughput(download_history):
+    if len(download_history.samples) == 0:
         return None
 
-    updated_dwn_time = sum(previous_segment_times) / len(previous_segment_times)
+    # Running download_rate in bps for the most recent segments
+    return download_history.value * 8
 
-    # Calculate the running download_rate in Kbps for the most recent segments
-    return sum(recent_download_sizes) * 8 / (updated_dwn_time * len(previous_segment_times))
 
-
-def getBolaState(bitrates, stableBufferTime, segmentDuration):
+def getBolaState(bitrates, stableBufferTime, segmentDuration, sessionState=None):
+    """
+    Return the BOLA state of the playback session, initializing it on the first call.
+    Without sessionState the module-level state (one session per process) is used.
+    """
     global bolaState
-    if bolaState is None:
-        bolaState = BolaState()
-        bolaState.initializeBolaState(bitrates, stableBufferTime)
-        bolaState.lastSegmentDurationS = segmentDuration
+    if sessionState is None:
+        if bolaState is None:
+            bolaState = BolaState()
+        sessionState = bolaState
+    if sessionState.state is None:
+        sessionState.initializeBolaState(bitrates, stableBufferTime)
+        sessionState.lastSegmentDurationS = segmentDuration
     else:
-        if bolaState.lastSegmentDurationS is None:
-            bolaState.lastSegmentDurationS = segmentDuration
-    return bolaState
+        if sessionState.lastSegmentDurationS is None:
+            sessionState.lastSegmentDurationS = segmentDuration
+    return sessionState
 
 
 def utilitiesFromBitrates(bitrates):
@@ -101,7 +102,7 @@ def getQualityFromBufferLevel(bolaState, bufferLevel):
 
     for i in range(bitrateCount):
         s = (bolaState.Vp * (bolaState.utilities[i] + bolaState.gp) - bufferLevel) / bolaState.bitrates[i]
-        print("Score for quality {} is {}".format(i, s))
+        config_dash.LOG.debug("Score for quality {} is {}".format(i, s))
 
         if score is None or s >= score:
             score = s
@@ -134,22 +135,25 @@ def minBufferLevelForQuality(bolaState, quality):
     return minV
 
 
-def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_download_sizes, previous_segment_times, current_bitrate):
+def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, download_history, current_bitrate,
+              sessionState=None, clock=time):
     """
     Module to predict the next_bitrate using the bola_dash algorithm. Selects the bitrate based on Lyapunov optimization.
     :param segment_number: Current segment number
     :param dash_player: Instance of the DashPlayer class
     :param bitrates: A tuple/list of available bitrates
     :param average_dwn_time: Average download time observed so far
-    :param segment_download_time:  Time taken to download the current segment
+    :param download_history: HarmonicMean of the last config_dash.BASIC_DELTA_COUNT segments
+    :param sessionState: BolaState of the playback session. Default: the module-level state
+    :param clock: Object with a sleep(seconds) function used to wait (eg: the virtual clock of the simulation)
     :return: next_rate : Bitrate for the next segment
     :return: updated_dwn_time: Updated average download time
     """
 
-    throughput = getThroughput(previous_segment_times, recent_download_sizes)
+    throughput = getThroughput(download_history)
 
     stableBufferTime = config_dash.STABLE_BUFFER_TIME  # in seconds
-    bolaState = getBolaState(bitrates, stableBufferTime, dash_player.segment_duration)
+    bolaState = getBolaState(bitrates, stableBufferTime, dash_player.segment_duration, sessionState)
 
     if bolaState.state == config_dash.BOLA_STATE_ONE_BITRATE:
         # shouldn't even have been called
@@ -162,12 +166,12 @@ def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_do
 
     if bufferLevel < 2 * dash_player.segment_duration:
         config_dash.LOG.info('BOLA state STARTUP.')
-        quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, recent_download_sizes, previous_segment_times, current_bitrate)
+        quality_b, _ = basic_dash2(segment_number, bitrates, average_dwn_time, download_history, current_bitrate)
         quality = bitrates.index(quality_b)
         bolaState.lastQuality = quality
     else:
         config_dash.LOG.info('BOLA state STEADY.')
-        print("Buffer level -> {} s".format(bufferLevel))
+        config_dash.LOG.debug("Buffer level -> {} s".format(bufferLevel))
         quality = getQualityFromBufferLevel(bolaState, bufferLevel)  # we want to avoid oscillations
         # print("getQualityFromBufferLevel -> {}".format(quality))
         if quality > bolaState.lastQuality:
@@ -184,7 +188,7 @@ def bola_dash(segment_number, dash_player, bitrates, average_dwn_time, recent_do
         delay = max([0, bufferLevel - maxBufferLevelForQuality(bolaState, quality)])  # First reduce placeholder buffer, then tell schedule controller to pause.
         if delay > 0:
             config_dash.LOG.info("Sleeping for {} s".format(delay))
-            time.sleep(delay)
+            clock.sleep(delay)
         bolaState.lastQuality = quality  # keep bolaState.state === BOLA_STATE_STEADY
 
     return bitrates[quality]
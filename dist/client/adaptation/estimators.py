@@ -0,0 +1,207 @@
+"""
+Throughput estimators shared by the adaptation modules.
+
+Every estimator updates its result in O(1) per segment (O(log n) for the
+percentile), instead of popping from the front of a list and summing the
+whole window again:
+    HarmonicMean(window)            size weighted harmonic mean of the download rates (BASIC, BOLA, SARA)
+    SlidingAverage(window)          arithmetic mean of the last samples
+    SlidingPercentile(window, p)    p-th percentile (nearest-rank) of the last samples
+    Ewma(alpha)                     exponentially weighted moving average (Netflix startup rate)
+nearest_rank is the percentile of a sorted list (load generator report).
+
+The running sums are recomputed exactly each time the window wraps around,
+so the floating point error does not accumulate over long sessions.
+"""
+
+from __future__ import division
+import heapq
+import math
+
+
+def nearest_rank(sorted_values, percentile):
+    """ percentile (0-100) of a sorted list, nearest-rank method: the value of rank ceil(percentile / 100 * n) """
+    # percentile * n / 100 (not percentile / 100 * n) is exact for integer percentiles, eg: 7 / 100 * 100 > 7
+    rank = int(math.ceil(percentile * len(sorted_values) / 100))
+    return sorted_values[min(max(rank - 1, 0), len(sorted_values) - 1)]
+
+
+class RingBuffer:
+    """ The last capacity values, in insertion order """
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1")
+        self.capacity = capacity
+        self.values = [None] * capacity
+        # Position of the next write
+        self.position = 0
+        self.count = 0
+
+    def append(self, value):
+        """ Add a value. Returns the value that was dropped to make room or None """
+        evicted = self.values[self.position] if self.count == self.capacity else None
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        return evicted
+
+    def wrapped(self):
+        """ True when the last append completed a full turn of the buffer """
+        return self.count == self.capacity and self.position == 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        start = self.position if self.count == self.capacity else 0
+        for index in range(self.count):
+            yield self.values[(start + index) % self.capacity]
+
+
+class SlidingAverage:
+    """ Arithmetic mean of the last window samples """
+    def __init__(self, window):
+        self.samples = RingBuffer(window)
+        self.total = 0
+        self.value = None
+
+    def update(self, sample):
+        evicted = self.samples.append(sample)
+        if self.samples.wrapped():
+            self.total = math.fsum(self.samples)
+        else:
+            self.total += sample - (evicted or 0)
+        self.value = self.total / len(self.samples)
+        return self.value
+
+
+class HarmonicMean:
+    """ Harmonic mean of the download rates of the last window segments.
+        The weights are the sizes of the segments, so the mean is the total size over the total download time.
+        http://en.wikipedia.org/wiki/Harmonic_mean#Weighted_harmonic_mean
+    """
+    def __init__(self, window):
+        # (size, download_time)
+        self.samples = RingBuffer(window)
+        self.total_size = 0
+        self.total_time = 0
+        self.value = 0
+
+    def update(self, segment_size, segment_download_time):
+        """ segment_size in bytes, segment_download_time in seconds. Returns the mean rate in bytes per second """
+        evicted = self.samples.append((segment_size, segment_download_time))
+        if self.samples.wrapped():
+            self.total_size = math.fsum(size for size, _ in self.samples)
+            self.total_time = math.fsum(download_time for _, download_time in self.samples)
+        else:
+            self.total_size += segment_size
+            self.total_time += segment_download_time
+            if evicted:
+                self.total_size -= evicted[0]
+                self.total_time -= evicted[1]
+        if self.total_time > 0:
+            self.value = self.total_size / self.total_time
+        return self.value
+
+    def average_time(self):
+        """ Mean download time of the segments in the window (in seconds) """
+        return self.total_time / len(self.samples)
+
+
+class SlidingPercentile:
+    """ percentile (0-100) of the last window samples, nearest-rank method (as nearest_rank).
+        The samples of rank <= k are in a max-heap and the others in a min-heap. The evicted samples are only
+        removed when they reach the top of their heap, and the heaps are rebuilt once they hold more stale
+        entries than live ones, so an update costs O(log window).
+    """
+    def __init__(self, window, percentile=50):
+        # (sample, sequence number): the sequence number tells the copies of a value apart
+        self.samples = RingBuffer(window)
+        self.percentile = percentile
+        # Max-heap of (-sample, -sequence) and min-heap of (sample, sequence)
+        self.lower = list()
+        self.upper = list()
+        self.lower_count = self.upper_count = 0
+        # Sequence numbers of the evicted samples still in a heap
+        self.stale = set()
+        self.sequence = 0
+        self.value = None
+
+    def update(self, sample):
+        entry = (sample, self.sequence)
+        self.sequence += 1
+        evicted = self.samples.append(entry)
+        if self.lower_count and entry < self.lower_top():
+            heapq.heappush(self.lower, (-sample, -entry[1]))
+            self.lower_count += 1
+        else:
+            heapq.heappush(self.upper, entry)
+            self.upper_count += 1
+        if evicted is not None:
+            # Compared while still live, so that lower_top() does not drop it
+            if self.lower_count and evicted <= self.lower_top():
+                self.lower_count -= 1
+            else:
+                self.upper_count -= 1
+            self.stale.add(evicted[1])
+        rank = int(math.ceil(self.percentile * len(self.samples) / 100))
+        rank = min(max(rank, 1), len(self.samples))
+        while self.lower_count > rank:
+            heapq.heappush(self.upper, self.lower_top())
+            heapq.heappop(self.lower)
+            self.lower_count -= 1
+            self.upper_count += 1
+        while self.lower_count < rank:
+            sample, sequence = self.upper_top()
+            heapq.heappop(self.upper)
+            heapq.heappush(self.lower, (-sample, -sequence))
+            self.upper_count -= 1
+            self.lower_count += 1
+        self.value = self.lower_top()[0]
+        if len(self.lower) + len(self.upper) > 2 * self.samples.capacity:
+            self.compact()
+        return self.value
+
+    def lower_top(self):
+        """ Largest live entry of the lower heap, as (sample, sequence) """
+        while -self.lower[0][1] in self.stale:
+            self.stale.discard(-heapq.heappop(self.lower)[1])
+        return -self.lower[0][0], -self.lower[0][1]
+
+    def upper_top(self):
+        """ Smallest live entry of the upper heap """
+        while self.upper[0][1] in self.stale:
+            self.stale.discard(heapq.heappop(self.upper)[1])
+        return self.upper[0]
+
+    def compact(self):
+        """ Drop the stale entries from both heaps """
+        self.lower = [entry for entry in self.lower if -entry[1] not in self.stale]
+        self.upper = [entry for entry in self.upper if entry[1] not in self.stale]
+        heapq.heapify(self.lower)
+        heapq.heapify(self.upper)
+        self.stale.clear()
+
+
+class Ewma:
+    """ Exponentially weighted moving average.
+        With bias correction (as dash.js), the first samples are not pulled towards 0.
+    """
+    def __init__(self, alpha):
+        """ :param alpha: weight of the new sample, between 0 and 1 """
+        self.alpha = alpha
+        self.estimate = 0
+        self.total_weight = 0
+        self.value = None
+
+    @classmethod
+    def from_half_life(cls, half_life):
+        """ EWMA where a sample weighs half after half_life samples """
+        return cls(1 - math.pow(0.5, 1 / half_life))
+
+    def update(self, sample):
+        self.estimate = self.alpha * sample + (1 - self.alpha) * self.estimate
+        self.total_weight = self.alpha + (1 - self.alpha) * self.total_weight
+        self.value = self.estimate / self.total_weight
+        return self.value
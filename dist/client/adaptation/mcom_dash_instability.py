@@ -1,45 +1,28 @@
 __author__ = 'danizenzi'
 
 import config_dash
+from adaptation.segment_matrix import get_segment_matrix, SEGMENT_SIZE, VMAF
 
 
-## Check segment number and indexes of VMAF and segment size array -> indexes are 1 or 2 cells further
 def get_bitrates_for_mcom(dp_object, current_bitrate, adaptationSetIdx):
     """
     Fetch the bitrates related to the bitrate level corresponding to current_bitrate for each adaptation set included in dash_playback object
     :param dp_object: dash_plyback object instance
     :param current_bitrate: current bitrate
     :param adaptationSetIdx: id of the adaptation set corresponding to current_bitrate
-    :return: bitrates: bitrates dictionary {int(adaptationSetId): int(bitrate)}
+    :return: bitrates: int(bitrate) of each adaptation set, indexed by int(adaptationSetId) (shared row of the segment matrix)
     """
-    bitrates = dict()
-    current_bitrate_idx = 0
-    for adaptation in dp_object.adaptationSets:
-        config_dash.LOG.info("Bitrates for adaptation {}: {}".format(adaptation.id, adaptation.video.keys()))
-        if int(adaptation.id) == adaptationSetIdx:
-            current_bitrate_idx = list(adaptation.video.keys()).index(current_bitrate)
-            config_dash.LOG.info("Bitrate index is: {}".format(current_bitrate_idx))
-    for adaptation in dp_object.adaptationSets:
-        bitrates[int(adaptation.id)] = int(list(adaptation.video.keys())[current_bitrate_idx])
-    return bitrates
+    return get_segment_matrix(dp_object).level_bitrates(current_bitrate, adaptationSetIdx)
 
 
 def get_vmafs_for_mcom(dp_object, current_bitrate, adaptationSetIdx, segment_number):
-    vmafs = dict()
-    current_bitrate_idx = 0
-    for adaptation in dp_object.adaptationSets:
-        if int(adaptation.id) == adaptationSetIdx:
-            current_bitrate_idx = list(adaptation.video.keys()).index(current_bitrate)
-    for adaptation in dp_object.adaptationSets:
-        if len(adaptation.video[(list(adaptation.video.keys())[current_bitrate_idx])].vmafs) == 0:
-            config_dash.LOG.debug("VMAF value not available for processing. Returning None")
-            return None
-        try:
-            vmafs[int(adaptation.id)] = float(adaptation.video[(list(adaptation.video.keys())[current_bitrate_idx])].vmafs[segment_number - 1])
-        except Exception as e:
-            config_dash.LOG.info("Could not fetch VMAF values. {}".format(e))
-            # return None
-            vmafs[int(adaptation.id)] = None
+    """
+    Fetch the VMAF related to the bitrate level corresponding to current_bitrate for the current segment_number and each adaptation set
+    :return: vmafs: float(vmaf) or None indexed by int(adaptationSetId), None when VMAF values are not available
+    """
+    vmafs = get_segment_matrix(dp_object).level_candidates(VMAF, current_bitrate, adaptationSetIdx, segment_number)
+    if vmafs is None:
+        config_dash.LOG.debug("VMAF value not available for processing. Returning None")
     return vmafs
 
 
@@ -50,23 +33,12 @@ def get_segment_sizes_for_mcom(dp_object, current_bitrate, adaptationSetIdx, seg
     :param current_bitrate: current bitrate
     :param adaptationSetIdx: id of the adaptation set corresponding to current_bitrate
     :param segment_number: number of segment in the reproduction timeline
-    :return: segment_sizes: segment size dictionary {int(adaptationSetId): float(segment_size)}
+    :return: segment_sizes: float(segment_size) or None indexed by int(adaptationSetId)
     """
-    segment_sizes = dict()
-    current_bitrate_idx = 0
-    for adaptation in dp_object.adaptationSets:
-        if int(adaptation.id) == adaptationSetIdx:
-            current_bitrate_idx = list(adaptation.video.keys()).index(current_bitrate)
-    for adaptation in dp_object.adaptationSets:
-        if len(adaptation.video[(list(adaptation.video.keys())[current_bitrate_idx])].segment_sizes) == 0:
-            config_dash.LOG.debug("Segment size value not available for processing. Returning None")
-            return None
-        try:
-            segment_sizes[int(adaptation.id)] = float(adaptation.video[(list(adaptation.video.keys())[current_bitrate_idx])].segment_sizes[segment_number - 1])
-        except Exception as e:
-            config_dash.LOG.info("Could not fetch segment sizes. {}".format(e))
-            # return None
-            segment_sizes[int(adaptation.id)] = None
+    segment_sizes = get_segment_matrix(dp_object).level_candidates(SEGMENT_SIZE, current_bitrate, adaptationSetIdx,
+                                                                   segment_number)
+    if segment_sizes is None:
+        config_dash.LOG.debug("Segment size value not available for processing. Returning None")
     return segment_sizes
 
 
@@ -1,63 +1,40 @@
 __author__ = 'danizenzi'
 
 import config_dash
+from adaptation.segment_matrix import get_segment_matrix, SEGMENT_SIZE, VMAF
 
 
-## Check segment number and indexes of VMAF and segment size array -> indexes are 1 or 2 cells further
 def get_bitrates_for_mcom(dp_object):
     """
-    Fetch the bitrates related to the bitrate level corresponding to current_bitrate for each adaptation set included in dash_playback object
+    Fetch the bitrates of each adaptation set included in dash_playback object
     :param dp_object: dash_plyback object instance
-    :param current_bitrate: current bitrate
-    :param adaptationSetIdx: id of the adaptation set corresponding to current_bitrate
-    :return: bitrates: bitrates dictionary {int(adaptationSetId): int(bitrate)}
+    :return: bitrates: bitrates dictionary {int(adaptationSetId): (bitrates in the order of the MPD)}
     """
-    bitrates = dict()
-    for adaptation in dp_object.adaptationSets:
-        config_dash.LOG.info("Bitrates for adaptation {}: {}".format(adaptation.id, adaptation.video.keys()))
-        bitrates[int(adaptation.id)] = list(adaptation.video.keys())
-    return bitrates
+    return get_segment_matrix(dp_object).ladder_by_id
 
 
 def get_vmafs_for_mcom(dp_object, segment_number):
-    vmafs = dict()
-    for adaptation in dp_object.adaptationSets:
-        # if len(adaptation.video[(list(adaptation.video.keys())[current_bitrate_idx])].vmafs) == 0:
-        #    config_dash.LOG.debug("VMAF value not available for processing. Returning None")
-        #    return None
-        vmafs[int(adaptation.id)] = dict()
-        for bitrate in adaptation.video.keys():
-            # bitrate = float(bitrate) / 1000  # Kbps
-            try:
-                print("Bitrate: {} -> VMAF: {}".format(bitrate, adaptation.video[bitrate].vmafs[segment_number - 1]))
-                vmafs[int(adaptation.id)][bitrate] = adaptation.video[bitrate].vmafs[segment_number - 1]
-            except Exception as e:
-                config_dash.LOG.info("Could not fetch VMAF values. {}".format(e))
-                return None
-                # vmafs[int(adaptation.id)][bitrate] = None
+    """
+    Fetch the VMAF of each bitrate for the current segment_number and each adaptation set
+    :return: vmafs[int(adaptationSetId)][level], level being the position of the bitrate in get_bitrates_for_mcom,
+             or None when a value is missing
+    """
+    vmafs = get_segment_matrix(dp_object).candidates(VMAF, segment_number)
+    if vmafs is None:
+        config_dash.LOG.info("Could not fetch VMAF values for the segment {}".format(segment_number))
     return vmafs
 
 
 def get_segment_sizes_for_mcom(dp_object, segment_number):
     """
-    Fetch the segment size related to the bitrate level corresponding to current_bitrate for the current segment_number and each adaptation set included in dash_playback object
+    Fetch the segment size of each bitrate for the current segment_number and each adaptation set included in dash_playback object
     :param dp_object: dash_playback object instance
-    :param current_bitrate: current bitrate
-    :param adaptationSetIdx: id of the adaptation set corresponding to current_bitrate
     :param segment_number: number of segment in the reproduction timeline
-    :return: segment_sizes: segment size dictionary {int(adaptationSetId): float(segment_size)}
+    :return: segment_sizes[int(adaptationSetId)][level] (float(segment_size)) or None when a value is missing
     """
-    segment_sizes = dict()
-    for adaptation in dp_object.adaptationSets:
-        segment_sizes[int(adaptation.id)] = dict()
-        for bitrate in adaptation.video.keys():
-            try:
-                print("Bitrate: {} -> Segment Sizes [bits]: {}".format(bitrate, adaptation.video[bitrate].segment_sizes[segment_number - 1]))
-                segment_sizes[int(adaptation.id)][bitrate] = adaptation.video[bitrate].segment_sizes[segment_number - 1]
-            except Exception as e:
-                config_dash.LOG.info("Could not fetch size values. {}".format(e))
-                return None
-                # segment_sizes[int(adaptation.id)][bitrate] = None
+    segment_sizes = get_segment_matrix(dp_object).candidates(SEGMENT_SIZE, segment_number)
+    if segment_sizes is None:
+        config_dash.LOG.info("Could not fetch size values for the segment {}".format(segment_number))
     return segment_sizes
 
 
@@ -110,15 +87,15 @@ def medusa_dash(dp_object, dash_player, throughput, segment_number):
         # Only AV1
         if int(adaptation) != 4:
             continue
-        for bitrate in ladder[adaptation]:
-            if segment_sizes[adaptation][bitrate] is None or vmafs[adaptation][bitrate] is None:
+        for level, bitrate in enumerate(ladder[adaptation]):
+            if segment_sizes[adaptation][level] is None or vmafs[adaptation][level] is None:
                 config_dash.LOG.info("Bitrate '{}' from adaptation with id '{}' has no size or VMAF values for segment {}".format(bitrate, adaptation, segment_number))
                 continue
                 
-            if vmafs[adaptation][bitrate] > maxVMAF:
-                maxVMAF = vmafs[adaptation][bitrate]
-            if segment_sizes[adaptation][bitrate] > maxSS:
-                maxSS = segment_sizes[adaptation][bitrate]
+            if vmafs[adaptation][level] > maxVMAF:
+                maxVMAF = vmafs[adaptation][level]
+            if segment_sizes[adaptation][level] > maxSS:
+                maxSS = segment_sizes[adaptation][level]
             
     # Selected Objective Function
     sel_objFunc = None
@@ -127,31 +104,31 @@ def medusa_dash(dp_object, dash_player, throughput, segment_number):
         # Only AV1
         if int(adaptation) != 4:
             continue
-        for bitrate in ladder[adaptation]:
-            temp_objFunc = alpha * vmafs[adaptation][bitrate] / maxVMAF - (1 - alpha) * segment_sizes[adaptation][bitrate] / maxSS
+        for level, bitrate in enumerate(ladder[adaptation]):
+            temp_objFunc = alpha * vmafs[adaptation][level] / maxVMAF - (1 - alpha) * segment_sizes[adaptation][level] / maxSS
                 
-            config_dash.LOG.info("Bitrate '{}' from adaptation with id '{}': segment size -> {} Bytes, VMAF = {}, Objective Function: {}".format(
-                bitrate, adaptation, float(segment_sizes[adaptation][bitrate]) / 8, vmafs[adaptation][bitrate], temp_objFunc))
+            config_dash.LOG.debug("Bitrate '{}' from adaptation with id '{}': segment size -> {} Bytes, VMAF = {}, Objective Function: {}".format(
+                bitrate, adaptation, float(segment_sizes[adaptation][level]) / 8, vmafs[adaptation][level], temp_objFunc))
             
             if sel_objFunc is None:
                 next_adaptation_id = adaptation
                 next_bitrate = bitrate
-                selSS = float(segment_sizes[next_adaptation_id][bitrate])
-                selVMAF = float(vmafs[next_adaptation_id][bitrate])
+                selSS = float(segment_sizes[next_adaptation_id][level])
+                selVMAF = float(vmafs[next_adaptation_id][level])
                 sel_objFunc = temp_objFunc
             elif temp_objFunc > sel_objFunc:
                 if dash_player.buffer.qsize() <= 2:
                     next_adaptation_id = adaptation
                     next_bitrate = bitrate
-                    selSS = float(segment_sizes[next_adaptation_id][bitrate])
-                    selVMAF = float(vmafs[next_adaptation_id][bitrate])
+                    selSS = float(segment_sizes[next_adaptation_id][level])
+                    selVMAF = float(vmafs[next_adaptation_id][level])
                     sel_objFunc = temp_objFunc
                     
-                elif (float(segment_sizes[adaptation][bitrate]) / 1000) / throughput < dash_player.segment_duration * (dash_player.buffer.qsize() - 2):
+                elif (float(segment_sizes[adaptation][level]) / 1000) / throughput < dash_player.segment_duration * (dash_player.buffer.qsize() - 2):
                     next_adaptation_id = adaptation
                     next_bitrate = bitrate
-                    selSS = float(segment_sizes[next_adaptation_id][bitrate])
-                    selVMAF = float(vmafs[next_adaptation_id][bitrate])
+                    selSS = float(segment_sizes[next_adaptation_id][level])
+                    selVMAF = float(vmafs[next_adaptation_id][level])
                     sel_objFunc = temp_objFunc
 
     config_dash.LOG.debug("The next_bitrate is assigned as {} from adaptation with id {}".format(next_bitrate, next_adaptation_id))
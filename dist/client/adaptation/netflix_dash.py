@@ -44,19 +44,14 @@ def get_rate_netflix(bitrates, current_buffer_occupancy, buffer_size=config_dash
     Ref. Fig. 6 from [1]
 
     :param current_buffer_occupancy: Current buffer occupancy in number of segments
-    :param bitrates: List of available bitrates [r_min, .... r_max]
+    :param bitrates: List of available bitrates [r_min, .... r_max] (SegmentMatrix.ladder)
     :return:the bitrate for the next segment
     """
     next_bitrate = None
-    try:
-        bitrates = [int(i) for i in bitrates]
-        bitrates.sort()
-    except ValueError:
-        config_dash.LOG.error("Unable to sort the bitrates. Assuming they are sorted")
     # Calculate the current buffer occupancy percentage
     try:
         buffer_percentage = current_buffer_occupancy/buffer_size
-        print(buffer_percentage)
+        config_dash.LOG.debug("Buffer percentage: {}".format(buffer_percentage))
     except ZeroDivisionError:
         config_dash.LOG.error("Buffer Size was found to be Zero")
         return None
@@ -79,6 +74,8 @@ def get_rate_netflix(bitrates, current_buffer_occupancy, buffer_size=config_dash
 def netflix_dash(bitrates, dash_player, segment_download_rate, curr_bitrate, average_segment_sizes, rate_map, state):
     """
     Netflix rate adaptation module
+    :param bitrates: Bitrates in increasing order (SegmentMatrix.ladder)
+    :param average_segment_sizes: Average segment sizes aligned with bitrates (SegmentMatrix.average_segment_sizes)
     """
     available_video_segments = dash_player.buffer.qsize() - dash_player.initial_buffer
     if not (curr_bitrate or rate_map or state):
@@ -89,11 +86,12 @@ def netflix_dash(bitrates, dash_player, segment_download_rate, curr_bitrate, ave
         # if the B increases by more than 0.875V s. Since B = V - ChunkSize/c[k],
         # B > 0:875V also means that the chunk is downloaded eight times faster than it is played
         next_bitrate = curr_bitrate
+        current_index = bitrates.index(curr_bitrate)
         # delta-B = V - ChunkSize/c[k]
-        delta_B = dash_player.segment_duration - average_segment_sizes[curr_bitrate]/segment_download_rate
+        delta_B = dash_player.segment_duration - average_segment_sizes[current_index]/segment_download_rate
         # Select the higher bitrate as long as delta B > 0.875 * V
         if delta_B > config_dash.NETFLIX_INITIAL_FACTOR * dash_player.segment_duration:
-            next_bitrate = bitrates[bitrates.index(curr_bitrate)+1]
+            next_bitrate = bitrates[current_index+1]
         # if the current buffer occupancy is less that NETFLIX_INITIAL_BUFFER, then do NOY use rate map
         if not available_video_segments < config_dash.NETFLIX_INITIAL_BUFFER:
 
@@ -0,0 +1,206 @@
+"""
+Segment sizes and VMAF values of every (adaptation set, bitrate, segment).
+
+The values are copied once from the MediaObject columns into tuples laid
+out the way the adaptation modules read them, so that a decision is a few
+index operations on shared, precomputed rows instead of walking the
+adaptation sets or building dicts on every segment:
+
+    matrix = get_segment_matrix(dp_object)
+    ladder = matrix.ladder(adaptation_set_id)                           (bitrate, ...) in increasing order
+    sizes = matrix.segment_sizes(adaptation_set_id, segment_number)     (size in bits, ...) aligned with the ladder
+    vmafs = matrix.candidates(VMAF, segment_number)                     vmafs[int(adaptation set id)][level]
+
+The rows are shared by every caller and must not be modified.
+Segment numbers follow the SegmentSize nodes: segment_number 1 is the first node.
+The level of a bitrate is its position in the adaptation set of the MPD (as
+listed, not sorted), the tables keyed by adaptation set are indexed by the
+integer id of the adaptation set (None for the ids that are not used).
+"""
+
+from __future__ import division
+
+SEGMENT_SIZE = 'segment_sizes'
+VMAF = 'vmafs'
+KINDS = [SEGMENT_SIZE, VMAF]
+
+
+class SegmentMatrix:
+    """ Precomputed rows of the values of every adaptation set, bitrate and segment.
+        Each table is built with zip() the first time it is read, so a session only pays for the tables of its
+        adaptation logic.
+    """
+    def __init__(self, adaptation_sets):
+        self.adaptation_sets = adaptation_sets
+        # Adaptation set id -> row. The ids are compared as strings, as DashPlayback.getAdaptationSetFromId
+        self.rows = dict()
+        self.adaptation_set_ids = list()
+        # Bitrates of each row in the order of the MPD, and bitrate -> level
+        self.bitrates = list()
+        self.levels = list()
+        # Bitrates of each row in increasing order, and the column of each of them
+        self.ladders = list()
+        self.ladder_columns = list()
+        for row, adaptation_set in enumerate(adaptation_sets):
+            bitrates = tuple(adaptation_set.video.keys())
+            self.rows[str(adaptation_set.id)] = row
+            self.adaptation_set_ids.append(adaptation_set.id)
+            self.bitrates.append(bitrates)
+            self.levels.append(dict((bitrate, level) for level, bitrate in enumerate(bitrates)))
+            columns = sorted(range(len(bitrates)), key=lambda column: bitrates[column])
+            self.ladders.append(tuple(bitrates[column] for column in columns))
+            self.ladder_columns.append(columns)
+        # Levels present in every adaptation set
+        self.level_count = min([len(bitrates) for bitrates in self.bitrates] or [0])
+        try:
+            self.slots = [int(adaptation_set_id) for adaptation_set_id in self.adaptation_set_ids]
+        except (TypeError, ValueError):
+            self.slots = None
+        if self.slots and min(self.slots) < 0:
+            self.slots = None
+        # int(adaptation set id) -> bitrates in the order of the MPD
+        self.ladder_by_id = dict(zip(self.slots or [], self.bitrates))
+        # The ids of the MPDs are usually consecutive: the tuples by slot are then a padding plus the row values
+        self.slot_padding = None
+        if self.slots and self.slots == list(range(self.slots[0], self.slots[0] + len(self.slots))):
+            self.slot_padding = (None,) * self.slots[0]
+        if self.slots:
+            self.level_bitrate_rows = [self.by_slot(tuple(int(bitrates[level]) for bitrates in self.bitrates))
+                                       for level in range(self.level_count)]
+            self.no_values = self.by_slot((None,) * len(self.bitrates))
+        # (table, kind) -> table, see get_table
+        self.tables = dict()
+
+    def get_table(self, name, kind):
+        """ Table name of the values kind, built on the first call by build_<name>(kind) """
+        table = self.tables.get((name, kind))
+        if table is None:
+            table = self.tables[(name, kind)] = getattr(self, 'build_' + name)(kind)
+        return table
+
+    def get_columns(self, kind):
+        """ [row][column] values of the kind, in the order of the MPD """
+        return [[getattr(adaptation_set.video[bitrate], kind) or [] for bitrate in bitrates]
+                for adaptation_set, bitrates in zip(self.adaptation_sets, self.bitrates)]
+
+    def build_averages(self, kind):
+        """ [row]: average of each bitrate, aligned with the ladder """
+        return [tuple(sum(row[column]) / len(row[column]) if len(row[column]) else 0 for column in order)
+                for row, order in zip(self.get_columns(kind), self.ladder_columns)]
+
+    def build_ladder_rows(self, kind):
+        """ [row][segment index]: values of the bitrates aligned with the ladder, for the segments that every
+            bitrate of the row has
+        """
+        return [list(zip(*[row[column] for column in order]))
+                for row, order in zip(self.get_columns(kind), self.ladder_columns)]
+
+    def build_candidate_rows(self, kind):
+        """ [segment index]: values by adaptation set then level, for the segments that every bitrate has """
+        return [self.by_slot(values) for values in zip(*[list(zip(*row)) for row in self.get_columns(kind)])]
+
+    def build_level_rows(self, kind):
+        """ [level][segment index]: value of each adaptation set (None when missing) or None when a representation
+            at this level has no values at all
+        """
+        columns = self.get_columns(kind)
+        tables = list()
+        for level in range(self.level_count):
+            level_columns = [row[level] for row in columns]
+            if not all(level_columns):
+                tables.append(None)
+                continue
+            table = [self.by_slot(values) for values in zip(*level_columns)]
+            for index in range(len(table), max(len(column) for column in level_columns)):
+                table.append(self.by_slot(tuple(column[index] if index < len(column) else None
+                                                for column in level_columns)))
+            tables.append(table)
+        return tables
+
+    def by_slot(self, values):
+        """ Tuple indexed by the integer id of the adaptation sets, from the tuple of the values of the rows """
+        if self.slot_padding is not None:
+            return self.slot_padding + values
+        result = [None] * (max(self.slots) + 1)
+        for slot, value in zip(self.slots, values):
+            result[slot] = value
+        return tuple(result)
+
+    def get_row(self, adaptation_set_id):
+        try:
+            return self.rows[str(adaptation_set_id)]
+        except KeyError:
+            raise KeyError("Unknown adaptation set {}".format(adaptation_set_id))
+
+    def get_level(self, current_bitrate, adaptation_set_id):
+        """ Position of current_bitrate in the adaptation set (0 for an unknown adaptation set) """
+        row = self.rows.get(str(adaptation_set_id))
+        if row is None:
+            return 0
+        try:
+            return self.levels[row][current_bitrate]
+        except KeyError:
+            raise ValueError("{} is not a bitrate of the adaptation set {}".format(current_bitrate,
+                                                                                   adaptation_set_id))
+
+    def check_slots(self):
+        if not self.slots:
+            raise TypeError("The adaptation set ids {} are not integers".format(self.adaptation_set_ids))
+
+    def ladder(self, adaptation_set_id):
+        """ Bitrates of the adaptation set in increasing order """
+        return self.ladders[self.get_row(adaptation_set_id)]
+
+    def segment_sizes(self, adaptation_set_id, segment_number):
+        """ Sizes (in bits) of the segment for each bitrate of the adaptation set
+            :return: (size, ...) aligned with ladder(adaptation_set_id)
+            :raise IndexError: when a bitrate does not have the segment
+        """
+        sizes = self.get_table('ladder_rows', SEGMENT_SIZE)[self.get_row(adaptation_set_id)]
+        if not 0 < segment_number <= len(sizes):
+            raise IndexError("No size for the segment {}".format(segment_number))
+        return sizes[segment_number - 1]
+
+    def average_segment_sizes(self, adaptation_set_id):
+        """ Average segment size (in bits) of each bitrate of the adaptation set. 0 without SegmentSize
+            :return: (size, ...) aligned with ladder(adaptation_set_id)
+        """
+        return self.get_table('averages', SEGMENT_SIZE)[self.get_row(adaptation_set_id)]
+
+    def candidates(self, kind, segment_number):
+        """ Values of the segment for every bitrate of every adaptation set
+            :return: values[int(adaptation set id)][level] or None when a value is missing
+        """
+        self.check_slots()
+        values = self.get_table('candidate_rows', kind)
+        return values[segment_number - 1] if 0 < segment_number <= len(values) else None
+
+    def level_candidates(self, kind, current_bitrate, adaptation_set_id, segment_number):
+        """ Values of the segment in every adaptation set, at the level of current_bitrate in the adaptation set
+            adaptation_set_id
+            :return: values[int(adaptation set id)] (None when missing) or None when a representation has no values
+                     at all
+            :raise IndexError: when an adaptation set does not have this level
+        """
+        self.check_slots()
+        values = self.get_table('level_rows', kind)[self.get_level(current_bitrate, adaptation_set_id)]
+        if values is None:
+            return None
+        return values[segment_number - 1] if 0 < segment_number <= len(values) else self.no_values
+
+    def level_bitrates(self, current_bitrate, adaptation_set_id):
+        """ Bitrate of every adaptation set at the level of current_bitrate
+            :return: bitrates[int(adaptation set id)]
+            :raise IndexError: when an adaptation set does not have this level
+        """
+        self.check_slots()
+        return self.level_bitrate_rows[self.get_level(current_bitrate, adaptation_set_id)]
+
+
+def get_segment_matrix(dp_object):
+    """ SegmentMatrix of a DashPlayback (or of a single AdaptationSet), built on the first call """
+    matrix = getattr(dp_object, 'segment_matrix', None)
+    if matrix is None:
+        adaptation_sets = dp_object.adaptationSets if hasattr(dp_object, 'adaptationSets') else [dp_object]
+        matrix = dp_object.segment_matrix = SegmentMatrix(adaptation_sets)
+    return matrix
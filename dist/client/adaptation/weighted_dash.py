@@ -6,14 +6,12 @@ import config_dash
 def weighted_dash(bitrates, dash_player, weighted_dwn_rate, curr_bitrate, next_segment_sizes):
     """
     Module to predict the next_bitrate using the weighted_dash algorithm
-    :param bitrates: List of bitrates
+    :param bitrates: Bitrates in increasing order (SegmentMatrix.ladder)
     :param weighted_dwn_rate:
     :param curr_bitrate:
-    :param next_segment_sizes: A dict mapping bitrate: size of next segment
+    :param next_segment_sizes: Sizes of the next segment aligned with bitrates (SegmentMatrix.segment_sizes)
     :return: next_bitrate, delay
     """
-    bitrates = [int(i) for i in bitrates]
-    bitrates.sort()
     # Waiting time before downloading the next segment
     delay = 0
     next_bitrate = None
@@ -33,40 +31,43 @@ def weighted_dash(bitrates, dash_player, weighted_dwn_rate, curr_bitrate, next_s
     # If time to download the next segment with current bitrate is longer than current - initial,
     # switch to a lower suitable bitrate
 
-    elif float(next_segment_sizes[curr_bitrate])/weighted_dwn_rate > available_video_duration:
+    elif float(next_segment_sizes[bitrates.index(curr_bitrate)])/weighted_dwn_rate > available_video_duration:
         config_dash.LOG.info("next_segment_sizes[curr_bitrate]) weighted_dwn_rate > available_video")
-        for bitrate in reversed(bitrates):
+        for index in range(len(bitrates) - 1, -1, -1):
+            bitrate = bitrates[index]
             if bitrate < curr_bitrate:
-                if float(next_segment_sizes[bitrate])/weighted_dwn_rate < available_video_duration:
+                if float(next_segment_sizes[index])/weighted_dwn_rate < available_video_duration:
                     next_bitrate = bitrate
                     break
         if not next_bitrate:
             next_bitrate = bitrates[0]
     elif available_video_segments <= dash_player.alpha:
         config_dash.LOG.debug("available_video <= dash_player.alpha")
-        if curr_bitrate >= max(bitrates):
+        if curr_bitrate >= bitrates[-1]:
             config_dash.LOG.info("Current bitrate is MAX = {}".format(curr_bitrate))
             next_bitrate = curr_bitrate
         else:
-            higher_bitrate = bitrates[bitrates.index(curr_bitrate)+1]
+            higher_index = bitrates.index(curr_bitrate)+1
+            higher_bitrate = bitrates[higher_index]
             # Jump only one if suitable else stick to the current bitrate
             config_dash.LOG.info("next_segment_sizes[higher_bitrate] = {}, weighted_dwn_rate = {} , "
-                                 "available_video={} seconds, ratio = {}".format(next_segment_sizes[higher_bitrate],
+                                 "available_video={} seconds, ratio = {}".format(next_segment_sizes[higher_index],
                                                                                  weighted_dwn_rate,
                                                                                  available_video_duration,
-                                                                                float(next_segment_sizes[higher_bitrate])/weighted_dwn_rate))
-            if float(next_segment_sizes[higher_bitrate])/weighted_dwn_rate < available_video_duration:
+                                                                                float(next_segment_sizes[higher_index])/weighted_dwn_rate))
+            if float(next_segment_sizes[higher_index])/weighted_dwn_rate < available_video_duration:
                 next_bitrate = higher_bitrate
             else:
                 next_bitrate = curr_bitrate
     elif available_video_segments <= dash_player.beta:
         config_dash.LOG.info("available_video <= dash_player.beta")
-        if curr_bitrate >= max(bitrates):
+        if curr_bitrate >= bitrates[-1]:
             next_bitrate = curr_bitrate
         else:
-            for bitrate in reversed(bitrates):
+            for index in range(len(bitrates) - 1, -1, -1):
+                bitrate = bitrates[index]
                 if bitrate >= curr_bitrate:
-                    if float(next_segment_sizes[bitrate])/weighted_dwn_rate < available_video_duration:
+                    if float(next_segment_sizes[index])/weighted_dwn_rate < available_video_duration:
                         next_bitrate = bitrate
                         break
             if not next_bitrate:
@@ -74,12 +75,13 @@ def weighted_dash(bitrates, dash_player, weighted_dwn_rate, curr_bitrate, next_s
 
     elif available_video_segments > dash_player.beta:
         config_dash.LOG.info("available_video > dash_player.beta")
-        if curr_bitrate >= max(bitrates):
+        if curr_bitrate >= bitrates[-1]:
             next_bitrate = curr_bitrate
         else:
-            for bitrate in reversed(bitrates):
+            for index in range(len(bitrates) - 1, -1, -1):
+                bitrate = bitrates[index]
                 if bitrate >= curr_bitrate:
-                    if float(next_segment_sizes[bitrate])/weighted_dwn_rate > available_video_duration:
+                    if float(next_segment_sizes[index])/weighted_dwn_rate > available_video_duration:
                         next_bitrate = bitrate
                         break
         if not next_bitrate:
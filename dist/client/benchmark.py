@@ -0,0 +1,416 @@
+#!/usr/local/bin/python
+"""
+Benchmark of the AStream hot paths on a synthetic video.
+
+A synthetic MPD (configurable number of adaptation sets, representations and
+segments, with SegmentSize and VMAF values) and the media files of the first
+segments are written to a work folder, which is served by server/dash_server.py
+as a local stand-in for the origin. The stages are measured one by one:
+    mpd         read_mpd: parse time (cold and from the MPD cache) and peak memory of the parse
+    urls        get_url_list and the URL of every segment of every representation
+    adaptation  time of every ABR decision (simulation.py on a constant bandwidth) per playback type,
+                with and without the MCOM plugin
+    player      CPU used by dash_buffer.DashPlayer to play segments
+    origin      connect, first byte and transfer time of every segment served by the origin
+    session     one dash_client session against the origin, with the stage timings of every segment
+                (config_dash.SEGMENT_TIMING_HOOK) and the CPU used by the client process
+The report (JSON) also has the peak memory of the process.
+
+From commandline:
+    python3 benchmark.py -a 2 -r 6 -s 1800 -o report.json
+    python3 benchmark.py -s 43200 --STAGES mpd urls adaptation
+"""
+from __future__ import division
+import os
+import sys
+import json
+import time
+import random
+import socket
+import timeit
+import logging
+import tempfile
+import subprocess
+import tracemalloc
+from argparse import ArgumentParser
+try:
+    from time import process_time
+except ImportError:
+    from time import clock as process_time
+try:
+    import resource
+except ImportError:
+    resource = None
+import config_dash
+import read_mpd
+import dash_buffer
+import dash_client
+from read_mpd import DashPlayback
+from abr_controller import PLAYBACK_TYPES
+from connection_pool import ConnectionPool
+from load_generator import NullWriter, percentile
+from simulation import (NetworkTrace, simulate, configure_simulation_log, get_playback_types, INIT_SEGMENT_SIZE,
+                        DEFAULT_BUFFER_SIZE)
+
+STAGES = ['mpd', 'urls', 'adaptation', 'player', 'origin', 'session']
+DEFAULT_ADAPTATION_SETS = 2
+DEFAULT_REPRESENTATIONS = 6
+DEFAULT_SEGMENTS = 1800
+DEFAULT_SEGMENT_DURATION = 2
+# Segments written to the disk, downloaded from the origin and played by the client session
+DEFAULT_SESSION_SEGMENTS = 5
+# Bandwidth of the adaptation stage (in Mbps)
+DEFAULT_BANDWIDTH = 5
+DEFAULT_REPEAT = 3
+BENCHMARK_MPD = "benchmark.mpd"
+CODECS = ['av01.0.08M.08', 'avc1.64001f', 'hev1.1.6.L93.B0', 'vp09.00.10.08']
+RESOLUTIONS = [(640, 360), (854, 480), (1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)]
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'server', 'dash_server.py')
+SERVER_START_TIMEOUT = 10
+
+
+def get_representation_id(adaptation_set_id, bitrate):
+    return "v{}_{}".format(adaptation_set_id, bitrate)
+
+
+def generate_mpd(mpd_file, adaptation_sets=DEFAULT_ADAPTATION_SETS, representations=DEFAULT_REPRESENTATIONS,
+                 segments=DEFAULT_SEGMENTS, segment_duration=DEFAULT_SEGMENT_DURATION, seed=1):
+    """ Module to write a synthetic MPD with SegmentSize nodes
+    The adaptation sets are numbered from config_dash.ADAPTATION_SET_ID, each with its own codec and the same
+    bitrate ladder. The segment sizes vary by +-20% around the bitrate and the VMAF grows with the bitrate.
+    :return: dict {representation id: list of segment sizes in bytes}
+    """
+    generator = random.Random(seed)
+    bitrates = [int(round(200 * 1.8 ** level)) * 1000 for level in range(representations)]
+    duration = segments * segment_duration
+    sizes = dict()
+    with open(mpd_file, 'w') as mpd_handle:
+        mpd_handle.write('<?xml version="1.0"?>\n'
+                         '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" mediaPresentationDuration="PT{}H{}M{}S" '
+                         'minBufferTime="PT{}S">\n<Period>\n'.format(duration // 3600, duration % 3600 // 60,
+                                                                     duration % 60, segment_duration))
+        for index in range(adaptation_sets):
+            adaptation_set_id = config_dash.ADAPTATION_SET_ID + index
+            mpd_handle.write('<AdaptationSet id="{}" mimeType="video/mp4">\n'.format(adaptation_set_id))
+            for level, bitrate in enumerate(bitrates):
+                representation_id = get_representation_id(adaptation_set_id, bitrate)
+                width, height = RESOLUTIONS[min(level, len(RESOLUTIONS) - 1)]
+                mpd_handle.write(
+                    '<Representation id="{}" mimeType="video/mp4" codecs="{}" width="{}" height="{}" '
+                    'bandwidth="{}">\n<SegmentTemplate timescale="1000" duration="{}" startNumber="1" '
+                    'media="media/$RepresentationID$/seg$Number%d$.m4s" '
+                    'initialization="media/$RepresentationID$/init.mp4">\n'.format(
+                        representation_id, CODECS[index % len(CODECS)], width, height, bitrate,
+                        segment_duration * 1000))
+                vmaf = min(30 + 65 * (level + 1) / representations, 100)
+                sizes[representation_id] = list()
+                for segment in range(1, segments + 1):
+                    size = int(bitrate * segment_duration / 8 * generator.uniform(0.8, 1.2))
+                    sizes[representation_id].append(size)
+                    mpd_handle.write('<SegmentSize id="seg{}.m4s" size="{}" scale="bytes" vmaf="{:.2f}"/>\n'.format(
+                        segment, size, min(vmaf + generator.uniform(-3, 3), 100)))
+                mpd_handle.write('</SegmentTemplate></Representation>\n')
+            mpd_handle.write('</AdaptationSet>\n')
+        mpd_handle.write('</Period>\n</MPD>\n')
+    return sizes
+
+
+def write_media(folder, sizes, segment_count):
+    """ Module to write the initialization segment and the first segment_count segments of every representation
+    :return: list of the paths of the segments (relative to folder)
+    """
+    paths = list()
+    for representation_id, segment_sizes in sizes.items():
+        representation_folder = os.path.join(folder, 'media', representation_id)
+        if not os.path.exists(representation_folder):
+            os.makedirs(representation_folder)
+        files = [('init.mp4', INIT_SEGMENT_SIZE)]
+        files += [("seg{}.m4s".format(segment + 1), size) for segment, size in enumerate(segment_sizes[:segment_count])]
+        for file_name, size in files:
+            with open(os.path.join(representation_folder, file_name), 'wb') as media_handle:
+                media_handle.write(b'\0' * size)
+            paths.append('/'.join(('media', representation_id, file_name)))
+    return paths
+
+
+def get_summary(values):
+    """ Module to summarize a list of durations (in seconds) """
+    if not values:
+        return {'count': 0}
+    return {'count': len(values),
+            'mean': sum(values) / len(values),
+            'p50': percentile(values, 50),
+            'p99': percentile(values, 99),
+            'max': max(values)}
+
+
+def get_peak_memory():
+    """ Peak resident memory of the process in kB (None when the platform does not report it) """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kB on Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def bench_mpd(mpd_file, repeat=DEFAULT_REPEAT):
+    """ Module to measure the parse of the MPD, without and with the MPD cache """
+    cache = config_dash.MPD_CACHE
+    results = dict()
+    try:
+        config_dash.MPD_CACHE = False
+        tracemalloc.start()
+        parse_start = timeit.default_timer()
+        read_mpd.read_mpd(mpd_file, DashPlayback())
+        # tracemalloc slows down the parse: the times are measured by the following parses
+        results['traced_parse_time'] = timeit.default_timer() - parse_start
+        results['parse_peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        parse_times = list()
+        for _ in range(repeat):
+            parse_start = timeit.default_timer()
+            read_mpd.read_mpd(mpd_file, DashPlayback())
+            parse_times.append(timeit.default_timer() - parse_start)
+        results['parse_time'] = get_summary(parse_times)
+        config_dash.MPD_CACHE = True
+        # Fill the cache, then read from it
+        read_mpd.read_mpd(mpd_file, DashPlayback())
+        cached_times = list()
+        for _ in range(repeat):
+            parse_start = timeit.default_timer()
+            read_mpd.read_mpd(mpd_file, DashPlayback())
+            cached_times.append(timeit.default_timer() - parse_start)
+        results['cached_parse_time'] = get_summary(cached_times)
+    finally:
+        config_dash.MPD_CACHE = cache
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+    results['file_size'] = os.path.getsize(mpd_file)
+    return results
+
+
+def bench_urls(mpd_file):
+    """ Module to measure the URL templates and the URL of every segment """
+    dp_object, video_segment_duration = read_mpd.read_mpd(mpd_file, DashPlayback())
+    media_objects = [(bitrate, adaptation_set.video[bitrate]) for adaptation_set in dp_object.adaptationSets
+                     for bitrate in adaptation_set.video]
+    start_time = timeit.default_timer()
+    for bitrate, media in media_objects:
+        read_mpd.get_url_list(media, video_segment_duration, dp_object.playback_duration, bitrate, media.id)
+    url_list_time = timeit.default_timer() - start_time
+    start_time = timeit.default_timer()
+    url_count = 0
+    for _, media in media_objects:
+        for segment in range(media.start, media.start + len(media.url_list)):
+            read_mpd.get_segment_url(media, segment)
+            url_count += 1
+    url_time = timeit.default_timer() - start_time
+    return {'representations': len(media_objects),
+            'url_list_time': url_list_time,
+            'segment_urls': url_count,
+            'segment_url_time': url_time / url_count if url_count else None}
+
+
+def bench_adaptation(mpd_file, playback_types, bandwidth=DEFAULT_BANDWIDTH, segment_limit=None):
+    """ Module to measure the time of every ABR decision on a constant bandwidth (in Mbps) """
+    trace = NetworkTrace([(3600, bandwidth * 1000000, 0)], name="constant_{}".format(bandwidth))
+    results = dict()
+    for multi_codec in (False, True):
+        for playback_type in playback_types:
+            if playback_type == "MEDUSA" and multi_codec:
+                continue
+            decision_times = list()
+            start_time = timeit.default_timer()
+            simulate(mpd_file, playback_type, trace, multi_codec, segment_limit=segment_limit,
+                     decision_times=decision_times)
+            session_time = timeit.default_timer() - start_time
+            name = playback_type + ("-MCOM" if multi_codec else "")
+            results[name] = get_summary(decision_times)
+            results[name]['session_time'] = session_time
+    return results
+
+
+def bench_player(segment_count=100, segment_duration=0.02):
+    """ Module to measure the CPU used by DashPlayer to play segment_count segments of segment_duration seconds """
+    dash_player = dash_buffer.DashPlayer(segment_count * segment_duration, segment_duration)
+    for segment_number in range(segment_count):
+        dash_player.write({'playback_length': segment_duration, 'size': 0, 'bitrate': 0, 'data': None,
+                           'URI': None, 'segment_number': segment_number})
+    cpu_start = process_time()
+    start_time = timeit.default_timer()
+    dash_player.start()
+    dash_player.wait_until_stopped()
+    dash_player.player_thread.join()
+    wall_time = timeit.default_timer() - start_time
+    cpu_time = process_time() - cpu_start
+    return {'segments': segment_count,
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'cpu_usage': cpu_time / wall_time if wall_time else None,
+            'cpu_time_per_segment': cpu_time / segment_count}
+
+
+def get_free_port():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+def start_origin(folder, port):
+    """ Module to start server/dash_server.py in folder. Returns the process once the server accepts connections """
+    process = subprocess.Popen([sys.executable, os.path.abspath(SERVER_SCRIPT), '-s', '127.0.0.1', '-p', str(port)],
+                               cwd=folder)
+    deadline = timeit.default_timer() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except socket.error:
+            if process.poll() is not None or timeit.default_timer() > deadline:
+                process.kill()
+                raise IOError("The origin server did not start on port {}".format(port))
+            time.sleep(0.05)
+
+
+def bench_origin(domain, paths):
+    """ Module to download every segment once over keep-alive connections """
+    pool = ConnectionPool()
+    timings = {'connect_time': list(), 'first_byte_time': list(), 'transfer_time': list()}
+    total_size = 0
+    start_time = timeit.default_timer()
+    try:
+        for path in paths:
+            segment_size, segment_timing = pool.fetch(domain + path, NullWriter())
+            total_size += segment_size
+            for stage in timings:
+                timings[stage].append(segment_timing[stage])
+    finally:
+        pool.close()
+    wall_time = timeit.default_timer() - start_time
+    results = dict((stage, get_summary(values)) for stage, values in timings.items())
+    results['throughput_mbps'] = total_size * 8 / wall_time / 1000000 if wall_time else None
+    return results
+
+
+def bench_session(mpd_file, domain, playback_type, segment_limit):
+    """ Module to play segment_limit segments with dash_client against the origin, with the stage timings """
+    segment_timings = list()
+    config_dash.SEGMENT_TIMING_HOOK = segment_timings.append
+    config_dash.JSON_HANDLE['playback_type'] = playback_type.lower()
+    dp_object, video_segment_duration = read_mpd.read_mpd(mpd_file, DashPlayback())
+    dash_client.configure_buffer_size(float(DEFAULT_BUFFER_SIZE), video_segment_duration)
+    cpu_start = process_time()
+    start_time = timeit.default_timer()
+    try:
+        dash_client.start_playback_smart(dp_object, domain, playback_type, False, False, video_segment_duration,
+                                         segment_limit)
+    finally:
+        config_dash.SEGMENT_TIMING_HOOK = None
+    wall_time = timeit.default_timer() - start_time
+    cpu_time = process_time() - cpu_start
+    results = dict((stage, get_summary([timing[stage] for timing in segment_timings]))
+                   for stage in ('decision_time', 'delay_time', 'connect_time', 'first_byte_time', 'transfer_time',
+                                 'buffer_write_time'))
+    results.update({'playback_type': playback_type,
+                    'segments': len(segment_timings),
+                    'wall_time': wall_time,
+                    'cpu_time': cpu_time,
+                    'cpu_usage': cpu_time / wall_time if wall_time else None})
+    return results
+
+
+def run_benchmark(work_folder, stages=STAGES, playback_types=PLAYBACK_TYPES, adaptation_sets=DEFAULT_ADAPTATION_SETS,
+                  representations=DEFAULT_REPRESENTATIONS, segments=DEFAULT_SEGMENTS,
+                  segment_duration=DEFAULT_SEGMENT_DURATION, session_segments=DEFAULT_SESSION_SEGMENTS,
+                  repeat=DEFAULT_REPEAT):
+    """ Module to run the stages of the benchmark in work_folder
+    :return: dict with the results of every stage
+    """
+    mpd_file = os.path.join(work_folder, BENCHMARK_MPD)
+    # The client writes its logs and segments in the current folder
+    config_dash.MPD_CACHE_FOLDER = os.path.join(work_folder, 'mpd_cache')
+    for name in ('JSON_LOG', 'JSON_QOE_INPUT_LOG', 'METRICS_LOG', 'BUFFER_LOG_FILENAME'):
+        setattr(config_dash, name, os.path.join(work_folder, os.path.basename(getattr(config_dash, name))))
+    generate_start = timeit.default_timer()
+    sizes = generate_mpd(mpd_file, adaptation_sets, representations, segments, segment_duration)
+    report = {'parameters': {'adaptation_sets': adaptation_sets, 'representations': representations,
+                             'segments': segments, 'segment_duration': segment_duration,
+                             'session_segments': session_segments},
+              'generate_time': timeit.default_timer() - generate_start}
+    if 'mpd' in stages:
+        config_dash.LOG.warning("Benchmark: MPD parse")
+        report['mpd'] = bench_mpd(mpd_file, repeat)
+    if 'urls' in stages:
+        config_dash.LOG.warning("Benchmark: URL generation")
+        report['urls'] = bench_urls(mpd_file)
+    if 'adaptation' in stages:
+        config_dash.LOG.warning("Benchmark: ABR decisions")
+        report['adaptation'] = bench_adaptation(mpd_file, playback_types)
+    if 'player' in stages:
+        config_dash.LOG.warning("Benchmark: player")
+        report['player'] = bench_player()
+    if 'origin' in stages or 'session' in stages:
+        paths = write_media(work_folder, sizes, session_segments + 1)
+        port = get_free_port()
+        domain = "http://127.0.0.1:{}/".format(port)
+        origin = start_origin(work_folder, port)
+        try:
+            if 'origin' in stages:
+                config_dash.LOG.warning("Benchmark: origin")
+                report['origin'] = bench_origin(domain, paths)
+            if 'session' in stages:
+                config_dash.LOG.warning("Benchmark: client session")
+                report['session'] = bench_session(mpd_file, domain, playback_types[0], session_segments)
+        finally:
+            origin.terminate()
+            origin.wait()
+    report['peak_memory_kb'] = get_peak_memory()
+    return report
+
+
+def create_arguments(parser):
+    """ Adding arguments to the parser """
+    parser.add_argument('-a', '--ADAPTATION_SETS', type=int, default=DEFAULT_ADAPTATION_SETS,
+                        help="Number of adaptation sets of the synthetic MPD")
+    parser.add_argument('-r', '--REPRESENTATIONS', type=int, default=DEFAULT_REPRESENTATIONS,
+                        help="Number of representations per adaptation set")
+    parser.add_argument('-s', '--SEGMENTS', type=int, default=DEFAULT_SEGMENTS, help="Number of segments")
+    parser.add_argument('-d', '--SEGMENT_DURATION', type=int, default=DEFAULT_SEGMENT_DURATION,
+                        help="Segment duration in seconds")
+    parser.add_argument('-n', '--SESSION_SEGMENTS', type=int, default=DEFAULT_SESSION_SEGMENTS,
+                        help="Number of segments downloaded from the origin and played by the client session")
+    parser.add_argument('-p', '--PLAYBACK', default='all',
+                        help="Comma separated playback types (basic, bola, sara, netflix, medusa) or all")
+    parser.add_argument('--STAGES', nargs='*', default=STAGES, choices=STAGES, help="Stages to run")
+    parser.add_argument('--REPEAT', type=int, default=DEFAULT_REPEAT, help="Number of parses of the MPD")
+    parser.add_argument('-w', '--WORK_FOLDER', help="Folder of the synthetic video. Default: a temporary folder")
+    parser.add_argument('-o', '--OUTPUT', help="JSON file for the report")
+
+
+def main():
+    """ Main Program wrapper """
+    parser = ArgumentParser(description='Benchmark of the AStream hot paths')
+    create_arguments(parser)
+    args = parser.parse_args()
+    configure_simulation_log(logging.WARNING)
+    work_folder = os.path.abspath(args.WORK_FOLDER or tempfile.mkdtemp(prefix='astream_benchmark_'))
+    if not os.path.exists(work_folder):
+        os.makedirs(work_folder)
+    output = os.path.abspath(args.OUTPUT) if args.OUTPUT else None
+    # The client session downloads its segments in the current folder
+    os.chdir(work_folder)
+    report = run_benchmark(work_folder, args.STAGES, get_playback_types(args.PLAYBACK), args.ADAPTATION_SETS,
+                           args.REPRESENTATIONS, args.SEGMENTS, args.SEGMENT_DURATION, args.SESSION_SEGMENTS,
+                           args.REPEAT)
+    print(json.dumps(report, indent=4))
+    if output:
+        with open(output, 'w') as report_handle:
+            json.dump(report, report_handle, indent=4)
+    config_dash.LOG.warning("The synthetic video is in {}".format(work_folder))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -47,6 +47,17 @@ LOG = None
 JSON_LOG = strftime('ASTREAM_%Y-%m-%d.%H_%M_%S.json')
 JSON_QOE_INPUT_LOG = strftime('QOE_INPUT_%Y-%m-%d.%H_%M_%S.json')
 JSON_QOE_OUTPUT_LOG = strftime('QOE_OUTPUT_%Y-%m-%d.%H_%M_%S.json')
+# Records of the session written by the metrics sink (metrics_sink.py), one JSON object per line
+METRICS_LOG = strftime('ASTREAM_METRICS_%Y-%m-%d.%H_%M_%S.jsonl')
+# 'jsonl': one line per record, 'columnar': one line per record type and batch with a list of values per field
+METRICS_FORMAT = 'jsonl'
+# Seconds during which the records are collected before they are written
+METRICS_FLUSH_INTERVAL = 1
+# To be set by metrics_sink.get_metrics_sink
+METRICS_SINK = None
+# Function called by dash_client after every segment with a dict of the stage timings (in seconds):
+# decision_time, delay_time, connect_time, first_byte_time, transfer_time, buffer_write_time. None to disable
+SEGMENT_TIMING_HOOK = None
 JSON_HANDLE = dict()
 JSON_HANDLE['playback_info'] = {'start_time': None,
                                 'end_time': None,
@@ -55,6 +66,9 @@ JSON_HANDLE['playback_info'] = {'start_time': None,
                                 'up_shifts': 0,
                                 'down_shifts': 0
                                 }
+# Id of the AdaptationSet used by the single-codec ABR logics (the MCOM plugin may switch to the other sets)
+ADAPTATION_SET_ID = 4
+
 # Constants for the BASIC-2 adaptation scheme
 BASIC_THRESHOLD = 10
 BASIC_UPPER_THRESHOLD = 1.2
@@ -69,6 +83,9 @@ SARA_SAMPLE_COUNT = 5
 # Constants for the Buffer in the Weighted adaptation scheme (in segments)
 INITIAL_BUFFERING_COUNT = 1
 RE_BUFFERING_COUNT = 1
+# Time in seconds given to the player, on top of the buffered segments, to stop after the last download.
+# Past it the client stops the player (eg: it is waiting for skipped segments)
+PLAYER_STOP_TIMEOUT = 10
 ALPHA_BUFFER_COUNT = 2  # 20s: 2, 40s: 5
 BETA_BUFFER_COUNT = 4  # 20s: 4, 40s: 10
 
@@ -85,6 +102,8 @@ NETFLIX_BUFFER_SIZE_SECONDS = 20  # 120
 NETFLIX_BUFFER_SIZE = NETFLIX_BUFFER_SIZE_SECONDS / 4  # Use 4 as default segment length
 NETFLIX_INITIAL_BUFFER = 2
 NETFLIX_INITIAL_FACTOR = 0.875
+# Half-life (in segments) of the EWMA of the download rate used in the INITIAL state
+NETFLIX_RATE_HALF_LIFE = 2
 
 # ---------------------------------------------------
 # BOLA ADAPTATION
@@ -104,6 +123,23 @@ PLACEHOLDER_BUFFER_DECAY = 0.99  # Make sure placeholder buffer does not stick a
 # Set the size of the buffer in terms of segments. Set to unlimited if 0 or None
 MAX_BUFFER_SIZE = None
 
+# ---------------------------------------------------
+# HTTP connections (connection_pool.py)
+# ---------------------------------------------------
+# Timeout in seconds for the segment requests
+HTTP_TIMEOUT = 10
+# Number of times a segment is requested again after a truncated body, a reset connection or a timeout
+SEGMENT_DOWNLOAD_RETRIES = 1
+# Download the next segment at the current bitrate while the ABR decides (lookahead)
+SEGMENT_LOOKAHEAD = False
+
+# ---------------------------------------------------
+# MPD parser (read_mpd.py)
+# ---------------------------------------------------
+# Keep the parsed MPD files on disk, keyed by the hash of the MPD
+MPD_CACHE = True
+MPD_CACHE_FOLDER = os.path.join(LOG_FOLDER, "mpd_cache")
+
 # For ping.py
 PING_PACKETS = 10
 ping_option_nb_pkts = PING_PACKETS
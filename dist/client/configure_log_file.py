@@ -47,6 +47,7 @@ def configure_log_file(playback_type="", log_file=config_dash.LOG_FILENAME, mult
     config_dash.JSON_LOG = os.path.join(config_dash.LOG_FOLDER, config_dash.JSON_LOG)
     config_dash.JSON_QOE_INPUT_LOG = os.path.join(config_dash.LOG_FOLDER, config_dash.JSON_QOE_INPUT_LOG)
     config_dash.JSON_QOE_OUTPUT_LOG = os.path.join(config_dash.LOG_FOLDER, config_dash.JSON_QOE_OUTPUT_LOG)
+    config_dash.METRICS_LOG = os.path.join(config_dash.LOG_FOLDER, config_dash.METRICS_LOG)
     # print(log_file)
     # print(config_dash.BUFFER_LOG_FILENAME)
     # print(config_dash.JSON_LOG)
@@ -83,38 +84,43 @@ def write_json(json_data=config_dash.JSON_HANDLE, json_file=config_dash.JSON_LOG
         json_file_handle.write(json.dumps(json_data))
 
 
-def write_input_qoe(segment_length, json_data=config_dash.JSON_HANDLE, json_file=config_dash.JSON_QOE_INPUT_LOG):
-    # Create and populate ITU-T P.1203-compliant JSON input file
-    jsonString = "{\"I11\":{\"segments\":[],\"streamId\":42},\"I13\":{\"segments\":["
+def get_codec_name(codec):
+    """ Codec name of the ITU-T P.1203 model """
+    c = codec.lower()
+    if "avc" in c:  # Name for AVC should be H264. "AVC" not supported by ITU-T P.1203 model
+        return "h264"
+    elif "hev1" in c:
+        return "hevc"
+    elif "av" in c or "vp09" in c:  # AV1 not supported by ITU-T P.1203 model
+        return "vp9"
+    return c
+
+
+def get_input_qoe(segment_length, json_data=config_dash.JSON_HANDLE):
+    """ ITU-T P.1203-compliant input (dict) of a playback log """
+    segments = list()
     start = 0
     for segment_info in json_data["segment_info"]:
         if segment_info[SEGMENT_NAME][-4:] == ".mp4":  # initialization segment
             continue
-        c = segment_info[CODEC].lower()
-        if "avc" in c:  # Name for AVC should be H264. "AVC" not supported by ITU-T P.1203 model
-            c = "h264"
-        elif "hev1" in c:
-            c = "hevc"
-        elif "av" in c or "vp09" in c:  # AV1 not supported by ITU-T P.1203 model
-            c = "vp9"
-        jsonString += "{{\"bitrate\":{:n},\"codec\":\"{:s}\",\"duration\":{:n},\"fps\":{:n},\"resolution\":\"{:s}\",\"start\":{:n}}},".format(
-            segment_info[BITRATE] / 1000, c, segment_length, 24, segment_info[RESOLUTION], start)
+        segments.append({"bitrate": segment_info[BITRATE] / 1000, "codec": get_codec_name(segment_info[CODEC]),
+                         "duration": segment_length, "fps": 24, "resolution": segment_info[RESOLUTION],
+                         "start": start})
         start += segment_length
-    jsonString = jsonString[:-1]  # Remove the exceeding comma
-    jsonString += "],\"streamId\":42},\"I23\":{\"stalling\":["
-    # start_time = json_data["playback_info"]["start_time"]
-    start_up = json_data["playback_info"]["initial_buffering_duration"]
-    jsonString += "[{:.3f},{:.3f}],".format(0, start_up)  # Initial buffering time
+    # Initial buffering time, then the interruptions
+    stalling = [[0, round(json_data["playback_info"]["initial_buffering_duration"] or 0, 3)]]
     for stall_pair in json_data["playback_info"]["interruptions"]["events"]:
-        time = stall_pair[0]
-        duration = stall_pair[1] - stall_pair[0]
-        jsonString += "[{:.3f},{:.3f}],".format(time, duration)
-    jsonString = jsonString[:-1]  # Remove the exceeding comma
-    jsonString += "],\"streamId\": 42}},\"IGen\":{{\"device\":\"{:s}\",\"displaySize\":\"{:s}\",\"viewingDistance\":\"{:s}\"}}}}".format(
-        DEVICE, DISPLAY_SIZE, VIEWING_DISTANCE)
-    # Using a JSON string
+        stalling.append([round(stall_pair[0], 3), round(stall_pair[1] - stall_pair[0], 3)])
+    return {"I11": {"segments": [], "streamId": 42},
+            "I13": {"segments": segments, "streamId": 42},
+            "I23": {"stalling": stalling, "streamId": 42},
+            "IGen": {"device": DEVICE, "displaySize": DISPLAY_SIZE, "viewingDistance": VIEWING_DISTANCE}}
+
+
+def write_input_qoe(segment_length, json_data=config_dash.JSON_HANDLE, json_file=config_dash.JSON_QOE_INPUT_LOG):
+    # Create and populate ITU-T P.1203-compliant JSON input file
     with open(json_file, 'w') as outfile:
-        outfile.write(jsonString)
+        outfile.write(json.dumps(get_input_qoe(segment_length, json_data), separators=(',', ':')))
 
 
 #def write_output_qoe(json_in_file=config_dash.JSON_QOE_INPUT_LOG, json_out_file=config_dash.JSON_QOE_OUTPUT_LOG):
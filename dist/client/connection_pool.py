@@ -0,0 +1,252 @@
+"""
+Persistent HTTP/1.1 connection pool used to download the DASH segments.
+
+Every host gets a small set of keep-alive connections that are reused
+from one segment to the next, so that the TCP (and TLS) handshake is paid
+once per connection instead of once per segment. Every download reports
+the handshake time separately from the transfer time so that the rate
+adaptation algorithms only see the transfer throughput.
+
+    pool = ConnectionPool()
+    segment_size, segment_timing = pool.fetch(segment_url, file_handle)
+
+A SegmentFetcher can additionally fetch the next segment on a second
+connection while the current segment is being played (lookahead).
+"""
+from __future__ import division
+try:
+    import http.client as httplib  # working for Python3
+except ImportError:
+    import httplib
+try:
+    import urllib.parse as urlparse  # working for Python3
+except ImportError:
+    import urlparse
+import io
+import threading
+import timeit
+import config_dash
+
+# Size of each read from the socket (in bytes)
+READ_CHUNK = 64 * 1024
+# Maximum number of idle connections kept per host
+MAX_IDLE_CONNECTIONS = 4
+# Header with the id of the playback session. dash_server.py shapes the bandwidth per session with it
+SESSION_HEADER = 'X-Session-Id'
+
+
+class SegmentDownloadError(IOError):
+    """ Raised when the server does not return the segment """
+    def __init__(self, url, status, reason):
+        IOError.__init__(self, "Unable to download {} HTTP Error:{} {}".format(url, status, reason))
+        self.url = url
+        self.code = status
+
+
+class ConnectionPool:
+    """ Pool of keep-alive connections indexed by (scheme, host) """
+    def __init__(self, timeout=None, max_idle=MAX_IDLE_CONNECTIONS):
+        if timeout is None:
+            timeout = config_dash.HTTP_TIMEOUT
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle_connections = dict()
+        self.lock = threading.Lock()
+
+    def get_connection(self, scheme, netloc):
+        """ Return a connection for the host and the time spent to open it.
+            The handshake time is None when an idle connection is reused.
+        """
+        key = (scheme, netloc)
+        with self.lock:
+            connections = self.idle_connections.get(key)
+            if connections:
+                return connections.pop(), None
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            connection = httplib.HTTPConnection(netloc, timeout=self.timeout)
+        start_time = timeit.default_timer()
+        connection.connect()
+        return connection, timeit.default_timer() - start_time
+
+    def release_connection(self, scheme, netloc, connection):
+        """ Return a connection to the pool so that it can be reused """
+        key = (scheme, netloc)
+        with self.lock:
+            connections = self.idle_connections.setdefault(key, list())
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """ Close all the idle connections """
+        with self.lock:
+            for connections in self.idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.idle_connections.clear()
+
+    def fetch(self, url, output, headers=None):
+        """ Download the URL on a pooled connection and write the body to output.
+            The body is read until Content-Length (or EOF when the server does not send it).
+            :param url: Absolute URL of the segment
+            :param output: file-like object where the segment is written
+            :param headers: dict of additional request headers
+            :return: size of the segment in bytes and a dict with the timings of the download
+                     {'connect_time', 'first_byte_time', 'transfer_time'} in seconds.
+                     first_byte_time goes from the request to the response headers (the HTTP round trip)
+                     and transfer_time from the response headers to the last byte, so the throughput
+                     (segment_size / transfer_time) excludes both the handshake and the round trip.
+        """
+        parsed_uri = urlparse.urlparse(url)
+        path = parsed_uri.path or '/'
+        request_headers = {'Connection': 'keep-alive'}
+        if headers:
+            request_headers.update(headers)
+        if parsed_uri.query:
+            path += '?' + parsed_uri.query
+        # A reused connection may have been closed by the server in the meantime. In that case
+        # retry once on a fresh connection.
+        for attempt in range(2):
+            connection, connect_time = self.get_connection(parsed_uri.scheme, parsed_uri.netloc)
+            start_time = timeit.default_timer()
+            try:
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+            except (httplib.HTTPException, IOError):
+                connection.close()
+                if attempt or connect_time is not None:
+                    raise
+                continue
+            break
+        if connect_time is None:
+            connect_time = 0
+        first_byte_timer = timeit.default_timer()
+        first_byte_time = first_byte_timer - start_time
+        if response.status != 200:
+            response.read()
+            self._finish(parsed_uri, connection, response)
+            raise SegmentDownloadError(url, response.status, response.reason)
+        segment_size = 0
+        try:
+            while True:
+                segment_data = response.read(READ_CHUNK)
+                if not segment_data:
+                    break
+                segment_size += len(segment_data)
+                output.write(segment_data)
+        except (httplib.HTTPException, IOError):
+            connection.close()
+            raise
+        transfer_time = timeit.default_timer() - first_byte_timer
+        content_length = response.getheader('Content-Length')
+        if content_length is not None and int(content_length) != segment_size:
+            connection.close()
+            raise IOError("Truncated segment {}: received {} of {} bytes".format(url, segment_size, content_length))
+        self._finish(parsed_uri, connection, response)
+        return segment_size, {'connect_time': connect_time,
+                              'first_byte_time': first_byte_time,
+                              'transfer_time': transfer_time}
+
+    def _finish(self, parsed_uri, connection, response):
+        """ Put the connection back in the pool unless the server asked to close it """
+        if response.will_close:
+            connection.close()
+        else:
+            self.release_connection(parsed_uri.scheme, parsed_uri.netloc, connection)
+
+
+class PrefetchCancelled(IOError):
+    """ Raised in the prefetch thread when its segment is not needed anymore """
+
+
+class Prefetch:
+    """ Download of one segment into memory by a background thread """
+    def __init__(self, pool, url, headers=None):
+        self.url = url
+        self.headers = headers
+        self.result = None
+        self.cancelled = False
+        self.buffer_handle = io.BytesIO()
+        self.thread = threading.Thread(target=self.run, args=(pool,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, data):
+        """ Output of ConnectionPool.fetch. Stops the download once the prefetch is cancelled """
+        if self.cancelled:
+            raise PrefetchCancelled("Prefetch of {} cancelled".format(self.url))
+        self.buffer_handle.write(data)
+
+    def run(self, pool):
+        try:
+            segment_size, segment_timing = pool.fetch(self.url, self, self.headers)
+            self.result = (self.buffer_handle.getvalue(), segment_size, segment_timing)
+        except (httplib.HTTPException, IOError) as e:
+            if not self.cancelled:
+                config_dash.LOG.info("Prefetch of {} failed: {}".format(self.url, e))
+
+    def cancel(self):
+        """ Abandon the download without waiting for it. ConnectionPool.fetch closes the connection
+            when the next chunk arrives, so it never goes back to the pool half read.
+        """
+        self.cancelled = True
+
+
+class SegmentFetcher:
+    """ Downloads segments through a ConnectionPool with an optional lookahead.
+        prefetch(url) starts the download of a segment in the background. If the following
+        fetch() asks for the same URL, the prefetched data is used, otherwise the prefetch is
+        cancelled and the segment is downloaded without waiting for it.
+    """
+    def __init__(self, pool=None, lookahead=False, session_id=None):
+        """
+        :param pool: ConnectionPool. Default: a new pool, closed with the fetcher
+        :param lookahead: Download the next segment in the background (see prefetch)
+        :param session_id: Id of the playback session sent to the server in SESSION_HEADER
+        """
+        # Only a pool created here is closed by close(), a shared pool stays open for its other users
+        self.owns_pool = pool is None
+        if pool is None:
+            pool = ConnectionPool()
+        self.pool = pool
+        self.lookahead = lookahead
+        self.headers = {SESSION_HEADER: str(session_id)} if session_id is not None else None
+        self.next_prefetch = None
+
+    def prefetch(self, url):
+        """ Start the download of the next segment on a separate connection """
+        if not self.lookahead or self.next_prefetch:
+            return
+        self.next_prefetch = Prefetch(self.pool, url, self.headers)
+
+    def fetch(self, url, output):
+        """ Same as ConnectionPool.fetch, using the prefetched segment when available """
+        prefetch, self.next_prefetch = self.next_prefetch, None
+        if prefetch:
+            if prefetch.url != url:
+                # The ABR selected another representation: drop the prefetched segment
+                config_dash.LOG.debug("Cancelled the prefetch of {}".format(prefetch.url))
+                prefetch.cancel()
+            else:
+                wait_start = timeit.default_timer()
+                prefetch.thread.join()
+                if prefetch.result:
+                    segment_data, segment_size, segment_timing = prefetch.result
+                    output.write(segment_data)
+                    # The timing is the one measured by the prefetch thread. The transfer shared the
+                    # link with the previous segment, so the throughput it gives is a lower bound.
+                    config_dash.LOG.debug("Used prefetched segment {} after waiting {} seconds".format(
+                        url, timeit.default_timer() - wait_start))
+                    return segment_size, segment_timing
+        return self.pool.fetch(url, output, self.headers)
+
+    def close(self):
+        """ Cancel the pending prefetch and close the pool if it was created by this fetcher """
+        if self.next_prefetch:
+            self.next_prefetch.cancel()
+            self.next_prefetch = None
+        if self.owns_pool:
+            self.pool.close()
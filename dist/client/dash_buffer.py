@@ -5,15 +5,16 @@ except ImportError:
     import Queue
 import threading
 import time
-import csv
-import os
 import config_dash
-from stop_watch import StopWatch
+from stop_watch import StopWatch, clock
+from metrics_sink import get_metrics_sink
 
 # Durations in seconds
 PLAYER_STATES = ['INITIALIZED', 'INITIAL_BUFFERING', 'PLAY',
                  'PAUSE', 'BUFFERING', 'STOP', 'END']
 EXIT_STATES = ['STOP', 'END']
+# Interval (in seconds) between two checks that the player thread is still alive in wait_until_stopped
+PLAYER_LIVENESS_INTERVAL = 1
 
 
 class DashPlayer:
@@ -32,6 +33,8 @@ class DashPlayer:
         # Playback State
         self.playback_state = "INITIALIZED"
         self.playback_state_lock = threading.Lock()
+        # Notified on every state change and segment arrival. The player thread waits on it instead of polling
+        self.player_condition = threading.Condition(self.playback_state_lock)
         # Buffer size
         if config_dash.MAX_BUFFER_SIZE:
             self.max_buffer_size = config_dash.MAX_BUFFER_SIZE
@@ -49,7 +52,8 @@ class DashPlayer:
         self.buffer = Queue.Queue()
         self.buffer_lock = threading.Lock()
         self.current_segment = None
-        self.buffer_log_file = config_dash.BUFFER_LOG_FILENAME
+        # Buffer and interruption records are written by the background thread of the sink
+        self.metrics = get_metrics_sink()
         config_dash.LOG.info("VideoLength={},segmentDuration={},MaxBufferSize={},InitialBuffer(secs)={},"
                              "BufferAlph(secs)={},BufferBeta(secs)={}".format(self.playback_duration,
                                                                               self.segment_duration,
@@ -60,14 +64,60 @@ class DashPlayer:
         """ Function to set the state of the player"""
         state = state.upper()
         if state in PLAYER_STATES:
-            self.playback_state_lock.acquire()
-            config_dash.LOG.info("Changing state from {} to {} at {} Playback time ".format(self.playback_state, state,
-                                                                                            self.playback_timer.time()))
-            self.playback_state = state
-            self.playback_state_lock.release()
+            with self.player_condition:
+                config_dash.LOG.info("Changing state from {} to {} at {} Playback time ".format(self.playback_state, state,
+                                                                                                self.playback_timer.time()))
+                self.playback_state = state
+                # Wake up the player thread and anybody waiting for the end of the playback
+                self.player_condition.notify_all()
         else:
             config_dash.LOG.error("Unidentified state: {}".format(state))
 
+    def wait_for(self, predicate, timeout=None):
+        """ Block until predicate() is True or until timeout (in seconds) expires.
+            The player is woken up by write() and set_state(), so no time is spent polling.
+            :return: The last value of predicate()
+        """
+        end_time = None
+        if timeout is not None:
+            end_time = clock() + timeout
+        with self.player_condition:
+            result = predicate()
+            while not result:
+                if end_time is not None:
+                    remaining = end_time - clock()
+                    if remaining <= 0:
+                        break
+                    self.player_condition.wait(remaining)
+                else:
+                    self.player_condition.wait()
+                result = predicate()
+        return result
+
+    def wait_until_stopped(self, timeout=None):
+        """ Block until the player reaches one of the EXIT_STATES, until timeout (in seconds) expires
+            or until the player thread exits without reaching them (eg: after an exception).
+            :return: True if the player stopped
+        """
+        end_time = None
+        if timeout is not None:
+            end_time = clock() + timeout
+        while True:
+            interval = PLAYER_LIVENESS_INTERVAL
+            if end_time is not None:
+                interval = max(min(interval, end_time - clock()), 0)
+            if self.wait_for(lambda: self.playback_state in EXIT_STATES, interval):
+                return True
+            if not (self.player_thread and self.player_thread.is_alive()):
+                # The thread may have set the state right before exiting
+                if self.playback_state in EXIT_STATES:
+                    return True
+                config_dash.LOG.error("The player thread is not running. Playback state: {}".format(
+                    self.playback_state))
+                return False
+            if end_time is not None and clock() >= end_time:
+                return False
+
     def initialize_player(self):
         """Method that update the current playback time"""
         start_time = time.time()
@@ -102,7 +152,9 @@ class DashPlayer:
                         self.playback_timer.time()))
                     self.playback_timer.pause()
                     paused = True
+                self.wait_for(lambda: self.playback_state != "PAUSE")
                 continue
+            paused = False
 
             # If the playback encounters buffering during the playback
             if self.playback_state == "BUFFERING":
@@ -114,41 +166,42 @@ class DashPlayer:
                     interruption_start = time.time()
                     config_dash.JSON_HANDLE['playback_info']['interruptions']['count'] += 1
                 # If the size of the buffer is greater than the RE_BUFFERING_DURATION then start playback
-                else:
-                    # If the RE_BUFFERING_DURATION is greater than the remaining length of the video then do not wait
-                    remaining_playback_time = self.playback_duration - self.playback_timer.time()
-                    if ((self.buffer.qsize() >= config_dash.RE_BUFFERING_COUNT) or (
-                            config_dash.RE_BUFFERING_COUNT * self.segment_duration >= remaining_playback_time
-                            and self.buffer.qsize() > 0)):
-                        buffering = False
-                        if interruption_start:
-                            interruption_end = time.time()
-                            interruption = interruption_end - interruption_start
+                # If the RE_BUFFERING_DURATION is greater than the remaining length of the video then do not wait
+                self.wait_for(lambda: self.playback_state != "BUFFERING" or self.rebuffering_done())
+                if self.playback_state != "BUFFERING":
+                    continue
+                buffering = False
+                if interruption_start:
+                    interruption_end = time.time()
+                    interruption = interruption_end - interruption_start
 
-                            config_dash.JSON_HANDLE['playback_info']['interruptions']['events'].append(
-                                (self.playback_timer.time(), self.playback_timer.time() + interruption))
-                            config_dash.JSON_HANDLE['playback_info']['interruptions']['total_duration'] += interruption
-                            config_dash.LOG.info("Duration of interruption = {}".format(interruption))
-                            interruption_start = None
-                        self.set_state("PLAY")
-                        self.log_entry("Buffering-Play")
+                    event = (self.playback_timer.time(), self.playback_timer.time() + interruption)
+                    config_dash.JSON_HANDLE['playback_info']['interruptions']['events'].append(event)
+                    config_dash.JSON_HANDLE['playback_info']['interruptions']['total_duration'] += interruption
+                    self.metrics.interruption(*event)
+                    config_dash.LOG.info("Duration of interruption = {}".format(interruption))
+                    interruption_start = None
+                self.set_state("PLAY")
+                self.log_entry("Buffering-Play")
 
             if self.playback_state == "INITIAL_BUFFERING":
-                if self.buffer.qsize() < config_dash.INITIAL_BUFFERING_COUNT:
-                    initial_wait = time.time() - start_time
+                self.wait_for(lambda: self.playback_state != "INITIAL_BUFFERING" or
+                              self.buffer.qsize() >= config_dash.INITIAL_BUFFERING_COUNT)
+                if self.playback_state != "INITIAL_BUFFERING":
                     continue
-                else:
-                    config_dash.LOG.info("Initial Waiting Time = {}".format(initial_wait))
-                    config_dash.JSON_HANDLE['playback_info']['initial_buffering_duration'] = initial_wait
-                    config_dash.JSON_HANDLE['playback_info']['start_time'] = time.time()
-                    self.set_state("PLAY")
-                    self.log_entry("InitialBuffering-Play")
+                initial_wait = time.time() - start_time
+                config_dash.LOG.info("Initial Waiting Time = {}".format(initial_wait))
+                config_dash.JSON_HANDLE['playback_info']['initial_buffering_duration'] = initial_wait
+                config_dash.JSON_HANDLE['playback_info']['start_time'] = time.time()
+                self.set_state("PLAY")
+                self.log_entry("InitialBuffering-Play")
 
             if self.playback_state == "PLAY":
                     # Check of the buffer has any segments
-                    if self.playback_timer.time() == self.playback_duration:
+                    if self.playback_timer.time() >= self.playback_duration:
                         self.set_state("END")
                         self.log_entry("Play-End")
+                        continue
                     if self.buffer.qsize() == 0:
                         config_dash.LOG.info("Buffer empty after {} seconds of playback".format(
                             self.playback_timer.time()))
@@ -166,37 +219,46 @@ class DashPlayer:
                     self.log_entry(action="StillPlaying", bitrate=play_segment["bitrate"])
 
                     # Calculate time playback when the segment finishes
-                    future = self.playback_timer.time() + play_segment['playback_length']
+                    future = min(self.playback_timer.time() + play_segment['playback_length'], self.playback_duration)
 
                     # Start the playback
                     self.playback_timer.start()
-                    while self.playback_timer.time() < future:
-                        # If playback hasn't started yet, set the playback_start_time
-                        if not self.playback_start_time:
-                            self.playback_start_time = time.time()
-                            config_dash.LOG.info("Started playing with representation {} at {}".format(
-                                play_segment['bitrate'], self.playback_timer.time()))
-
-                        # Duration for which the video was played in seconds (integer)
-                        if self.playback_timer.time() >= self.playback_duration:
-                            config_dash.LOG.info("Completed the video playback: {} seconds".format(
-                                self.playback_duration))
-                            self.playback_timer.pause()
-                            self.set_state("END")
-                            self.log_entry("TheEnd")
-                            return
-                    else:
-                        self.buffer_length_lock.acquire()
-                        self.buffer_length -= int(play_segment['playback_length'])
-                        config_dash.LOG.debug("Decrementing buffer_length by {}. dash_buffer = {}".format(
-                            play_segment['playback_length'], self.buffer_length))
-                        self.buffer_length_lock.release()
+                    # If playback hasn't started yet, set the playback_start_time
+                    if not self.playback_start_time:
+                        self.playback_start_time = time.time()
+                        config_dash.LOG.info("Started playing with representation {} at {}".format(
+                            play_segment['bitrate'], self.playback_timer.time()))
+                    # Sleep until the segment finishes playing. Only a stop of the player interrupts the wait
+                    self.wait_for(lambda: self.playback_state in EXIT_STATES,
+                                  max(future - self.playback_timer.time(), 0))
+                    if self.playback_state in EXIT_STATES:
+                        continue
+                    # Duration for which the video was played in seconds
+                    if self.playback_timer.time() >= self.playback_duration:
+                        config_dash.LOG.info("Completed the video playback: {} seconds".format(
+                            self.playback_duration))
+                        self.playback_timer.pause()
+                        self.set_state("END")
+                        self.log_entry("TheEnd")
+                        return
+                    self.buffer_length_lock.acquire()
+                    self.buffer_length -= int(play_segment['playback_length'])
+                    config_dash.LOG.debug("Decrementing buffer_length by {}. dash_buffer = {}".format(
+                        play_segment['playback_length'], self.buffer_length))
+                    self.buffer_length_lock.release()
                     if self.segment_limit:
                         if int(play_segment['segment_number']) >= self.segment_limit:
                             self.set_state("STOP")
                             config_dash.LOG.info("Stopped playback after segment {} at playtime {}".format(
                                 play_segment['segment_number'], self.playback_duration))
 
+    def rebuffering_done(self):
+        """ True when enough segments are in the buffer to resume the playback after a stall """
+        remaining_playback_time = self.playback_duration - self.playback_timer.time()
+        return ((self.buffer.qsize() >= config_dash.RE_BUFFERING_COUNT) or (
+                config_dash.RE_BUFFERING_COUNT * self.segment_duration >= remaining_playback_time
+                and self.buffer.qsize() > 0))
+
     def write(self, segment):
         """ write segment to the buffer.
             Segment is dict with keys ['data', 'bitrate', 'playback_length', 'URI', 'size']
@@ -210,6 +272,9 @@ class DashPlayer:
         self.buffer_lock.acquire()
         self.buffer.put(segment)
         self.buffer_lock.release()
+        # Wake up the player if it is waiting for a segment
+        with self.player_condition:
+            self.player_condition.notify_all()
         self.buffer_length_lock.acquire()
         self.buffer_length += int(segment['playback_length'])
         config_dash.LOG.debug("Incrementing buffer_length by {}. dash_buffer = {}".format(
@@ -235,25 +300,11 @@ class DashPlayer:
 
     def log_entry(self, action, bitrate=0):
         """Method to log the current state"""
-
-        if self.buffer_log_file:
-            header_row = None
-            if self.actual_start_time:
-                log_time = time.time() - self.actual_start_time
-            else:
-                log_time = 0
-            if not os.path.exists(self.buffer_log_file):
-                header_row = "EpochTime,CurrentPlaybackTime,CurrentBufferSize,CurrentPlaybackState,Action,Bitrate".split(",")
-                stats = (log_time, str(self.playback_timer.time()), self.buffer.qsize(),
-                         self.playback_state, action,bitrate)
-            else:
-                stats = (log_time, str(self.playback_timer.time()), self.buffer.qsize(),
-                         self.playback_state, action,bitrate)
-            str_stats = [str(i) for i in stats]
-            with open(self.buffer_log_file, "a") as log_file_handle:
-                result_writer = csv.writer(log_file_handle, delimiter=",")
-                if header_row:
-                    result_writer.writerow(header_row)
-                result_writer.writerow(str_stats)
-            config_dash.LOG.info("BufferStats: EpochTime=%s,CurrentPlaybackTime=%s,CurrentBufferSize=%s,"
-                                 "CurrentPlaybackState=%s,Action=%s,Bitrate=%s" % tuple(str_stats))
\ No newline at end of file
+        if self.actual_start_time:
+            log_time = time.time() - self.actual_start_time
+        else:
+            log_time = 0
+        stats = (log_time, self.playback_timer.time(), self.buffer.qsize(), self.playback_state, action, bitrate)
+        self.metrics.buffer(stats)
+        config_dash.LOG.debug("BufferStats: EpochTime=%s,CurrentPlaybackTime=%s,CurrentBufferSize=%s,"
+                              "CurrentPlaybackState=%s,Action=%s,Bitrate=%s" % stats)
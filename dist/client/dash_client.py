@@ -34,19 +34,22 @@ except ImportError:
 from string import ascii_letters, digits
 from argparse import ArgumentParser
 from multiprocessing import Process, Queue
-from collections import defaultdict
-from adaptation import basic_dash, basic_dash2, bola_paper, weighted_dash, netflix_dash, mcom_dash, medusa
-from adaptation.base_adaptation import WeightedMean
+from abr_controller import AbrController
+# Segment size helpers of the ABR logic, still importable from dash_client
+from abr_controller import get_segment_sizes, get_average_segment_sizes, get_segment_count
 import config_dash
 import dash_buffer
+from connection_pool import SegmentFetcher, SegmentDownloadError
 from configure_log_file import configure_log_file, write_json, write_input_qoe#, write_output_qoe
+from metrics_sink import get_metrics_sink, close_metrics_sink
 import time
 from read_mpd import DashPlayback
 
 
 # Constants
 DEFAULT_PLAYBACK = 'BASIC'
-DOWNLOAD_CHUNK = 1024
+# Keep-alive connections shared by the segment downloads of this process
+SEGMENT_FETCHER = SegmentFetcher()
 
 
 def get_mpd(url):
@@ -100,32 +103,40 @@ def id_generator(id_size=6):
     return 'TEMP_' + ''.join(random.choice(ascii_letters+digits) for _ in range(id_size))
 
 
-def download_segment(segment_url, dash_folder):
-    """ Module to download the segment """
-    try:
-        connection = urllib2.urlopen(segment_url)
-    except urllib2.HTTPError as error:
-        config_dash.LOG.error("Unable to download DASH Segment {} HTTP Error:{} ".format(segment_url, str(error.code)))
-        return None
+def download_segment(segment_url, dash_folder, segment_fetcher=None):
+    """ Module to download the segment over a persistent (keep-alive) connection
+    :param segment_url: Absolute URL of the segment
+    :param dash_folder: Local folder where the segment is stored
+    :param segment_fetcher: SegmentFetcher holding the connections of the session
+    :return: segment_size, segment_filename, segment_timing
+             segment_timing is a dict with the 'connect_time', 'first_byte_time' and 'transfer_time' of the download
+    """
+    if segment_fetcher is None:
+        segment_fetcher = SEGMENT_FETCHER
     parsed_uri = urlparse.urlparse(segment_url)
     segment_path = '{uri.path}'.format(uri=parsed_uri)
     while segment_path.startswith('/'):
         segment_path = segment_path[1:]        
     segment_filename = os.path.join(dash_folder, os.path.basename(segment_path))
     make_sure_path_exists(os.path.dirname(segment_filename))
-    segment_file_handle = open(segment_filename, 'wb')
-    segment_size = 0
-    while True:
-        segment_data = connection.read(DOWNLOAD_CHUNK)
-        segment_size += len(segment_data)
-        segment_file_handle.write(segment_data)
-        if len(segment_data) < DOWNLOAD_CHUNK:
-            break
-    connection.close()
-    segment_file_handle.close()
+    for attempt in range(config_dash.SEGMENT_DOWNLOAD_RETRIES + 1):
+        with open(segment_filename, 'wb') as segment_file_handle:
+            try:
+                segment_size, segment_timing = segment_fetcher.fetch(segment_url, segment_file_handle)
+                break
+            except SegmentDownloadError as error:
+                config_dash.LOG.error("Unable to download DASH Segment {} HTTP Error:{} ".format(segment_url, str(error.code)))
+                return None
+            except (httplib.HTTPException, IOError) as error:
+                # Truncated segment, reset connection or socket timeout: the request is sent again
+                config_dash.LOG.warning("Unable to download DASH Segment {} (attempt {}): {}".format(
+                    segment_url, attempt + 1, error))
+    else:
+        config_dash.LOG.error("Unable to download DASH Segment {} after {} attempts".format(segment_url, attempt + 1))
+        return None
     #print "segment size = {}".format(segment_size)
     #print "segment filename = {}".format(segment_filename)
-    return segment_size, segment_filename
+    return segment_size, segment_filename, segment_timing
 
 
 def get_media_all(domain, media_info, file_identifier, done_queue):
@@ -137,9 +148,9 @@ def get_media_all(domain, media_info, file_identifier, done_queue):
     for segment in [media.initialization] + media.url_list:
         start_time = timeit.default_timer()
         segment_url = urlparse.urljoin(domain, segment)
-        _, segment_file = download_segment(segment_url, file_identifier)
+        segment_dr = download_segment(segment_url, file_identifier)
         elapsed = timeit.default_timer() - start_time
-        if segment_file:
+        if segment_dr:
             done_queue.put((bandwidth, segment_url, elapsed))
     media_download_time = timeit.default_timer() - media_start_time
     done_queue.put((bandwidth, 'STOP', media_download_time))
@@ -183,236 +194,53 @@ def start_playback_smart(dp_object, domain, playback_type=None, multi_codec=Fals
     """
     # Initialize the DASH buffer
     dash_player = dash_buffer.DashPlayer(dp_object.playback_duration, video_segment_duration)
-    dash_player.start()
     # A folder to save the segments in
     file_identifier = id_generator()
+    # Keep-alive connections (and optional lookahead) for the segments of this playback. The folder name
+    # identifies the session for the bandwidth shaping of dash_server.py
+    segment_fetcher = SegmentFetcher(SEGMENT_FETCHER.pool, lookahead=config_dash.SEGMENT_LOOKAHEAD,
+                                     session_id=file_identifier)
+    dash_player.start()
     config_dash.LOG.info("The segments are stored in %s" % file_identifier)
-    dp_list = defaultdict(defaultdict)
-    # Creating a Dictionary of all that has the URLs for each segment and different bitrates
+    # Segment URLs are generated from the templates when they are requested
     for adaptationSet in dp_object.adaptationSets:
         for bitrate in adaptationSet.video:
-            # Getting the URL list for each bitrate
             adaptationSet.video[bitrate] = read_mpd.get_url_list(adaptationSet.video[bitrate], video_segment_duration,
                                                              dp_object.playback_duration, bitrate, adaptationSet.video[bitrate].id)
-
-            if "$Bandwidth$" in adaptationSet.video[bitrate].initialization:
-                adaptationSet.video[bitrate].initialization = adaptationSet.video[bitrate].initialization.replace(
-                    "$Bandwidth$", str(bitrate))
-            if "$RepresentationID$" in adaptationSet.video[bitrate].initialization:
-                adaptationSet.video[bitrate].initialization = adaptationSet.video[bitrate].initialization.replace("$RepresentationID$", str(adaptationSet.video[bitrate].id))
-            # media_urls = [adaptationSet.video[bitrate].initialization] + adaptationSet.video[bitrate].url_list
-            media_urls = [adaptationSet.video[bitrate].initialization] + adaptationSet.video[bitrate].url_list
-            #print "media urls"
-            #print media_urls
-            for segment_count, segment_url in enumerate(media_urls, adaptationSet.video[bitrate].start):
-                # segment_duration = adaptationSet.video[bitrate].segment_duration
-                #print "segment url"
-                #print segment_url
-                # print("SegmentCount: {}, SegmentUrl: {}, Bitrate: {}, AdaptationSetId: {}".format(segment_count, segment_url, bitrate, adaptationSet.id))
-                if segment_count not in dp_list:
-                    dp_list[segment_count] = defaultdict(defaultdict)
-                if int(adaptationSet.id) not in dp_list[segment_count]:
-                    dp_list[segment_count][int(adaptationSet.id)] = defaultdict(defaultdict)
-                if bitrate not in dp_list[segment_count][int(adaptationSet.id)]:
-                    dp_list[segment_count][int(adaptationSet.id)][bitrate] = segment_url
-    # Select the proper AdaptationSet
-    adaptationSetIdx = 4
-    mcom_adaptationSetIdx = adaptationSetIdx
-    bitrates = list(dp_object.getAdaptationSetFromId(adaptationSetIdx).video.keys())
-    bitrates.sort()
-    average_dwn_time = 0
+    # Number of segments including the initialization segment
+    segment_count = get_segment_count(dp_object)
+    # Rate adaptation of the session (the same dispatch as the simulation and the load generator)
+    abr = AbrController(dp_object, playback_type, multi_codec, segment_count=segment_count)
+    adaptationSetIdx = abr.adaptation_set_id
     segment_files = []
-    # For basic adaptation
-    previous_segment_times = []
-    recent_download_sizes = []
-    weighted_mean_object = None
-    current_bitrate = bitrates[0]
-    mcom_current_bitrate = bitrates[0]
     previous_bitrate = None
     # Stats
-    last_throughput = None
     last_buffer_occupancy = None
     total_downloaded = 0
-    # Delay in terms of the number of segments
-    delay = 0
     segment_duration = 0
-    segment_size = segment_download_time = None
-    vmaf = None  # gather VMAF from adaptationSet
-    # Netflix Variables
-    average_segment_sizes = netflix_rate_map = None
-    netflix_state = "INITIAL"
+    first_segment = abr.start
     # Start playback of all the segments
-    config_dash.LOG.info("{} available segments starting from index {}".format(len(dp_list), dp_object.getAdaptationSetFromId(adaptationSetIdx).video[current_bitrate].start))
-    for segment_number, segment in enumerate(dp_list, dp_object.getAdaptationSetFromId(adaptationSetIdx).video[current_bitrate].start - 1):
+    config_dash.LOG.info("{} available segments starting from index {}".format(segment_count, first_segment))
+    for segment_number, segment in enumerate(range(first_segment, first_segment + segment_count), first_segment - 1):
         config_dash.LOG.info(" {}: Processing the segment {}".format(playback_type.upper(), segment_number))
-        write_json(json_file=config_dash.JSON_LOG)
+        decision_start = timeit.default_timer()
         if not previous_bitrate:
-            previous_bitrate = current_bitrate
+            previous_bitrate = abr.current_bitrate
         if segment_limit:
             if not dash_player.segment_limit:
                 dash_player.segment_limit = int(segment_limit)
             if segment_number > int(segment_limit):
                 config_dash.LOG.info("Segment limit reached")
                 break
-        # print("segment_number ={}".format(segment_number))
-        # print("dp_object.adaptationSets[{}].video[bitrate].start={}".format(adaptationSetIdx, dp_object.adaptationSets[adaptationSetIdx].video[bitrate].start))
-        if segment_number == dp_object.getAdaptationSetFromId(adaptationSetIdx).video[current_bitrate].start - 1:
-            current_bitrate = bitrates[0]
-        else:
-            if playback_type.upper() == "MEDUSA":
-                    mcom_current_bitrate, mcom_adaptationSetIdx, vmaf = medusa.medusa_dash(dp_object, dash_player, last_throughput, segment_number)
-                                                                                
-                    config_dash.LOG.info("MEDUSA results: Adaptation set id {} -> bitrate = {}".format(mcom_adaptationSetIdx,
-                                                                                            mcom_current_bitrate))
-            else:
-                if multi_codec:
-                    if playback_type.upper() == "BASIC":
-                        current_bitrate, average_dwn_time = basic_dash2.basic_dash2(segment_number, bitrates, average_dwn_time,
-                                                                                    recent_download_sizes,
-                                                                                    previous_segment_times, current_bitrate)
-                        # Replace result with MCOM plugin result
-                        mcom_current_bitrate, mcom_adaptationSetIdx, vmaf = mcom_dash.mcom_dash(dp_object, dash_player, last_throughput,
-                                                                                                current_bitrate,
-                                                                                                adaptationSetIdx,
-                                                                                                segment_number)
-                                                                                                
-                        config_dash.LOG.info("Basic-DASH: Selected {} for the segment {}".format(current_bitrate,
-                                                                                                 segment_number))
-                        config_dash.LOG.info(
-                            "MCOM-refined results: Adaptation set id {} -> bitrate = {}".format(mcom_adaptationSetIdx,
-                                                                                                mcom_current_bitrate))
-                    elif playback_type.upper() == "BOLA":
-                        current_bitrate = bola_paper.bola_dash(segment_number, dash_player, bitrates, average_dwn_time,
-                                                              recent_download_sizes, previous_segment_times, current_bitrate)
-                        # Replace result with MCOM plugin result
-                        mcom_current_bitrate, mcom_adaptationSetIdx, vmaf = mcom_dash.mcom_dash(dp_object, dash_player, last_throughput,
-                                                                                                current_bitrate,
-                                                                                                adaptationSetIdx,
-                                                                                                segment_number)
-                                                                                                
-                        config_dash.LOG.info("BOLA-DASH: Selected {} for the segment {}".format(current_bitrate,
-                                                                                                 segment_number))
-                        config_dash.LOG.info(
-                            "MCOM-refined results: Adaptation set id {} -> bitrate = {}".format(mcom_adaptationSetIdx,
-                                                                                                mcom_current_bitrate))
-                    elif playback_type.upper() == "SMART":
-                        if not weighted_mean_object:
-                            weighted_mean_object = WeightedMean(config_dash.SARA_SAMPLE_COUNT)
-                            config_dash.LOG.debug("Initializing the weighted Mean object")
-                        # Checking the segment number is in acceptable range
-                        if segment_number < len(dp_list) - 1 + dp_object.getAdaptationSetFromId(adaptationSetIdx).video[current_bitrate].start:
-                            try:
-                                current_bitrate, delay = weighted_dash.weighted_dash(bitrates, dash_player,
-                                                                                     weighted_mean_object.weighted_mean_rate,
-                                                                                     current_bitrate,
-                                                                                     get_segment_sizes(dp_object.getAdaptationSetFromId(adaptationSetIdx),
-                                                                                                       segment_number))
-                                # Replace result with MCOM plugin result
-                                mcom_current_bitrate, mcom_adaptationSetIdx, vmaf = mcom_dash.mcom_dash(dp_object,
-                                                                                                        dash_player, last_throughput,
-                                                                                                        current_bitrate,
-                                                                                                        adaptationSetIdx,
-                                                                                                        segment_number)
-                                config_dash.LOG.info("MCOM-refined results: Adaptation set id {} -> bitrate = {}".format(
-                                    mcom_adaptationSetIdx, mcom_current_bitrate))
-                            except IndexError as e:
-                                config_dash.LOG.error(e)
-
-                    elif playback_type.upper() == "NETFLIX":
-                        config_dash.LOG.info("Playback is NETFLIX")
-                        # Calculate the average segment sizes for each bitrate
-                        if not average_segment_sizes:
-                            average_segment_sizes = get_average_segment_sizes(dp_object.getAdaptationSetFromId(adaptationSetIdx))
-                        if segment_number < len(dp_list) - 1 + dp_object.getAdaptationSetFromId(adaptationSetIdx).video[current_bitrate].start:
-                            try:
-                                if segment_size and segment_download_time:
-                                    segment_download_rate = segment_size / segment_download_time
-                                else:
-                                    segment_download_rate = 0
-                                current_bitrate, netflix_rate_map, netflix_state = netflix_dash.netflix_dash(
-                                    bitrates, dash_player, segment_download_rate, current_bitrate, average_segment_sizes,
-                                    netflix_rate_map, netflix_state)
-                                # Replace result with MCOM plugin result
-                                mcom_current_bitrate, mcom_adaptationSetIdx, vmaf = mcom_dash.mcom_dash(dp_object, dash_player, last_throughput, current_bitrate, 
-                                adaptationSetIdx, segment_number)
-                                config_dash.LOG.info("NETFLIX: Next bitrate = {}".format(current_bitrate))
-                                config_dash.LOG.info("MCOM-refined results: Adaptation set id {} -> bitrate = {}".format(mcom_adaptationSetIdx, mcom_current_bitrate))
-                            except IndexError as e:
-                                config_dash.LOG.error(e)
-                        else:
-                            config_dash.LOG.critical("Completed segment playback for Netflix")
-                            break
-
-                    else:
-                        config_dash.LOG.error("Unknown playback type:{}. Continuing with basic playback".format(playback_type))
-                        current_bitrate, average_dwn_time = basic_dash.basic_dash(segment_number, bitrates, average_dwn_time,
-                                                                                  segment_download_time, current_bitrate)
-                else:
-                    if playback_type.upper() == "BASIC":
-                        current_bitrate, average_dwn_time = basic_dash2.basic_dash2(segment_number, bitrates,
-                                                                                    average_dwn_time,
-                                                                                    recent_download_sizes,
-                                                                                    previous_segment_times, current_bitrate)
-                                                                                    
-                        config_dash.LOG.info("Basic-DASH: Selected {} for the segment {}".format(current_bitrate,
-                                                                                                 segment_number))
-                    elif playback_type.upper() == "BOLA":
-                        current_bitrate = bola_paper.bola_dash(segment_number, dash_player, bitrates, average_dwn_time,
-                                                              recent_download_sizes, previous_segment_times, current_bitrate)
-                                                              
-                        config_dash.LOG.info("BOLA-DASH: Selected {} for the segment {}".format(current_bitrate,
-                                                                                                 segment_number))
-                    elif playback_type.upper() == "SMART":
-                        if not weighted_mean_object:
-                            weighted_mean_object = WeightedMean(config_dash.SARA_SAMPLE_COUNT)
-                            config_dash.LOG.debug("Initializing the weighted Mean object")
-                        # Checking the segment number is in acceptable range
-                        if segment_number < len(dp_list) - 1 + dp_object.getAdaptationSetFromId(adaptationSetIdx).video[
-                            current_bitrate].start:
-                            try:
-                                current_bitrate, delay = weighted_dash.weighted_dash(bitrates, dash_player,
-                                                                                     weighted_mean_object.weighted_mean_rate,
-                                                                                     current_bitrate,
-                                                                                     get_segment_sizes(
-                                                                                         dp_object.getAdaptationSetFromId(
-                                                                                             adaptationSetIdx),
-                                                                                         segment_number))
-                            except IndexError as e:
-                                config_dash.LOG.error(e)
-
-                    elif playback_type.upper() == "NETFLIX":
-                        config_dash.LOG.info("Playback is NETFLIX")
-                        # Calculate the average segment sizes for each bitrate
-                        if not average_segment_sizes:
-                            average_segment_sizes = get_average_segment_sizes(
-                                dp_object.getAdaptationSetFromId(adaptationSetIdx))
-                        if segment_number < len(dp_list) - 1 + dp_object.getAdaptationSetFromId(adaptationSetIdx).video[
-                            current_bitrate].start:
-                            try:
-                                if segment_size and segment_download_time:
-                                    segment_download_rate = segment_size / segment_download_time
-                                else:
-                                    segment_download_rate = 0
-                                current_bitrate, netflix_rate_map, netflix_state = netflix_dash.netflix_dash(
-                                    bitrates, dash_player, segment_download_rate, current_bitrate, average_segment_sizes,
-                                    netflix_rate_map, netflix_state)
-                                config_dash.LOG.info("NETFLIX: Next bitrate = {}".format(current_bitrate))
-                            except IndexError as e:
-                                config_dash.LOG.error(e)
-                        else:
-                            config_dash.LOG.critical("Completed segment playback for Netflix")
-                            break
-                    else:
-                        config_dash.LOG.error(
-                            "Unknown playback type:{}. Continuing with basic playback".format(playback_type))
-                        current_bitrate, average_dwn_time = basic_dash.basic_dash(segment_number, bitrates,
-                                                                                  average_dwn_time,
-                                                                                  segment_download_time, current_bitrate)
-        # print(dp_list[segment])
-        segment_path = dp_list[segment][adaptationSetIdx][current_bitrate]
-        if multi_codec or playback_type.upper() == "MEDUSA":
-            if mcom_current_bitrate and mcom_adaptationSetIdx:
-                segment_path = dp_list[segment][mcom_adaptationSetIdx][mcom_current_bitrate]
+        # Representation of the segment: the MCOM result when MCOM (or MEDUSA) selected one
+        segment_adaptation_set, segment_bitrate, vmaf, delay = abr.next_segment(segment_number, dash_player)
+        if abr.completed:
+            break
+        current_bitrate = abr.current_bitrate
+        segment_path = get_segment_path(dp_object, segment_adaptation_set, segment_bitrate, segment)
+        if segment_path is None:
+            config_dash.LOG.error("{}: No segment {} at the selected bitrate".format(playback_type.upper(), segment))
+            break
         #print "domain"
         #print domain
         #print "segment"
@@ -424,51 +252,60 @@ def start_playback_smart(dp_object, domain, playback_type=None, multi_codec=Fals
         #print "segment url"
         #print segment_url
         config_dash.LOG.info("{}: Segment URL = {}".format(playback_type.upper(), segment_url))
+        # Time of the ABR decision and of the URL of the segment
+        decision_time = timeit.default_timer() - decision_start
+        delay_time = 0
         if dash_player.buffer.qsize() > config_dash.MAX_BUFFER_SIZE and delay == 0:
             delay = 1
         if delay:
             delay_start = time.time()
             config_dash.LOG.info("SLEEPING for {} seconds ".format(delay*segment_duration))
-            while time.time() - delay_start < (delay * segment_duration):
-                time.sleep(1)
+            # Woken up by the player only when the playback stops
+            dash_player.wait_for(lambda: dash_player.playback_state in dash_buffer.EXIT_STATES,
+                                 delay * segment_duration)
             delay = 0
-            config_dash.LOG.debug("SLEPT for {} seconds ".format(time.time() - delay_start))
-        start_time = timeit.default_timer()
+            delay_time = time.time() - delay_start
+            config_dash.LOG.debug("SLEPT for {} seconds ".format(delay_time))
         try:
             #print 'url'
             #print segment_url
             #print 'file'
             #print file_identifier
-            segment_dr = download_segment(segment_url, file_identifier)
+            segment_dr = download_segment(segment_url, file_identifier, segment_fetcher)
             if segment_dr is None:
-                config_dash.LOG.info("Downloaded failed. Terminating... ")
+                config_dash.LOG.info("Download failed. Skipping the segment {}".format(segment_number))
                 continue
-            segment_size, segment_filename = segment_dr
+            segment_size, segment_filename, segment_timing = segment_dr
             config_dash.LOG.info("{}: Downloaded segment {}".format(playback_type.upper(), segment_url))
         except IOError as e:
             config_dash.LOG.error("Unable to save segment {}".format(e))
             return None
-        segment_download_time = timeit.default_timer() - start_time
-        previous_segment_times.append(segment_download_time)
-        recent_download_sizes.append(segment_size)
+        # Only the transfer is used for the throughput estimates. The connection setup is logged separately
+        segment_download_time = segment_timing['transfer_time']
+        config_dash.LOG.info("{}: connect time = {}, first byte time = {}, transfer time = {}".format(
+            playback_type.upper(), segment_timing['connect_time'], segment_timing['first_byte_time'],
+            segment_download_time))
+        abr.update(segment_size, segment_download_time)
         # Updating the JSON information
         segment_name = os.path.split(segment_url)[1]
         if "segment_info" not in config_dash.JSON_HANDLE:
             config_dash.JSON_HANDLE["segment_info"] = list()
         # Add here the metrics for the final log
-        if multi_codec or playback_type.upper() == "MEDUSA":
-            if mcom_current_bitrate and mcom_adaptationSetIdx:
-                config_dash.JSON_HANDLE["segment_info"].append((segment_name, mcom_current_bitrate, dp_object.getAdaptationSetFromId(mcom_adaptationSetIdx).codec, vmaf, segment_size,
-                                                        segment_download_time, dp_object.getAdaptationSetFromId(mcom_adaptationSetIdx).video[mcom_current_bitrate].resolution))
+        segment_record = None
+        if abr.uses_mcom():
+            if abr.mcom_current_bitrate and abr.mcom_adaptation_set_id:
+                segment_record = (segment_name, segment_bitrate, dp_object.getAdaptationSetFromId(segment_adaptation_set).codec, vmaf, segment_size,
+                                  segment_download_time, dp_object.getAdaptationSetFromId(segment_adaptation_set).video[segment_bitrate].resolution)
         else:
-            config_dash.JSON_HANDLE["segment_info"].append((segment_name, current_bitrate, dp_object.getAdaptationSetFromId(adaptationSetIdx).codec, dp_object.getVmafForSegment(adaptationSetIdx, current_bitrate, segment_number), segment_size,
-                                                            segment_download_time, dp_object.getAdaptationSetFromId(adaptationSetIdx).video[current_bitrate].resolution))
+            segment_record = (segment_name, current_bitrate, dp_object.getAdaptationSetFromId(adaptationSetIdx).codec, dp_object.getVmafForSegment(adaptationSetIdx, current_bitrate, segment_number), segment_size,
+                              segment_download_time, dp_object.getAdaptationSetFromId(adaptationSetIdx).video[current_bitrate].resolution)
+        if segment_record:
+            config_dash.JSON_HANDLE["segment_info"].append(segment_record)
+            dash_player.metrics.segment_info(segment_record)
         total_downloaded += segment_size
         config_dash.LOG.info("{} : The total downloaded = {}, segment_size = {}, segment_number = {}".format(
             playback_type.upper(),
             total_downloaded, segment_size, segment_number))
-        if playback_type.upper() == "SMART" and weighted_mean_object:
-            weighted_mean_object.update_weighted_mean(segment_size, segment_download_time)
 
         segment_info = {'playback_length': video_segment_duration,
                         'size': segment_size,
@@ -477,7 +314,27 @@ def start_playback_smart(dp_object, domain, playback_type=None, multi_codec=Fals
                         'URI': segment_url,
                         'segment_number': segment_number}
         segment_duration = segment_info['playback_length']
+        write_start = timeit.default_timer()
         dash_player.write(segment_info)
+        if config_dash.SEGMENT_TIMING_HOOK:
+            config_dash.SEGMENT_TIMING_HOOK({'playback_type': playback_type.upper(),
+                                             'segment_number': segment_number,
+                                             'segment_url': segment_url,
+                                             'segment_size': segment_size,
+                                             'decision_time': decision_time,
+                                             'delay_time': delay_time,
+                                             'connect_time': segment_timing['connect_time'],
+                                             'first_byte_time': segment_timing['first_byte_time'],
+                                             'transfer_time': segment_timing['transfer_time'],
+                                             'buffer_write_time': timeit.default_timer() - write_start,
+                                             'buffer_size': dash_player.buffer.qsize()})
+        # Lookahead: request the next segment at the same bitrate while the ABR decides, unless the buffer
+        # is full (the next segment is then only requested after the delay)
+        if segment + 1 < first_segment + segment_count and (
+                not config_dash.MAX_BUFFER_SIZE or dash_player.buffer.qsize() < config_dash.MAX_BUFFER_SIZE):
+            next_segment_path = get_segment_path(dp_object, segment_adaptation_set, segment_bitrate, segment + 1)
+            if next_segment_path:
+                segment_fetcher.prefetch(urlparse.urljoin(domain, next_segment_path))
         segment_files.append(segment_filename)
         config_dash.LOG.info("Downloaded %s. Size = %s in %s seconds" % (
             segment_url, segment_size, str(segment_download_time)))
@@ -488,15 +345,23 @@ def start_playback_smart(dp_object, domain, playback_type=None, multi_codec=Fals
                 config_dash.JSON_HANDLE['playback_info']['down_shifts'] += 1
             previous_bitrate = current_bitrate
         # Print stats (lastThroughput, safeThroughput, bufferOccupancy)
-        last_throughput = segment_size * 8 / 1000 / segment_download_time
         last_buffer_occupancy = dash_player.buffer.qsize() * video_segment_duration
-        config_dash.LOG.info("lastThroughput: {:.0f} kbps".format(last_throughput))
+        if abr.last_throughput is not None:
+            config_dash.LOG.info("lastThroughput: {:.0f} kbps".format(abr.last_throughput))
         # config_dash.LOG.info("safeThroughput: {} kbps".format(segment_size * 8 / 1000 / segment_download_time))
         config_dash.LOG.info("bufferOccupancy: {:.3f} s".format(last_buffer_occupancy))
 
-    # waiting for the player to finish playing
-    while dash_player.playback_state not in dash_buffer.EXIT_STATES:
-        time.sleep(1)
+    segment_fetcher.close()
+    # waiting for the player to finish playing the buffered segments (and the one being played)
+    stop_timeout = (dash_player.buffer.qsize() + 1) * video_segment_duration + config_dash.PLAYER_STOP_TIMEOUT
+    if not dash_player.wait_until_stopped(stop_timeout):
+        config_dash.LOG.error("The player did not stop {} seconds after the last download".format(stop_timeout))
+        dash_player.stop()
+    # The player thread writes its last buffer record when it sees the STOP state
+    dash_player.player_thread.join(1)
+    dash_player.metrics.emit('playback_info', config_dash.JSON_HANDLE['playback_info'])
+    close_metrics_sink()
+    # The complete log is only written once, at the end of the playback
     write_json(json_file=config_dash.JSON_LOG)
     write_input_qoe(video_segment_duration, json_file=config_dash.JSON_QOE_INPUT_LOG)
     # write_output_qoe(json_in_file=config_dash.JSON_QOE_INPUT_LOG, json_out_file=config_dash.JSON_QOE_OUTPUT_LOG)
@@ -504,19 +369,15 @@ def start_playback_smart(dp_object, domain, playback_type=None, multi_codec=Fals
         clean_files(file_identifier)
 
 
-def get_segment_sizes(dp_object, segment_number):
-    """ Module to get the segment sizes for the segment_number
-    :param dp_object:
-    :param segment_number:
-    :return:
+def get_segment_path(dp_object, adaptation_set_id, bitrate, segment):
+    """ Module to get the relative URL of a segment
+    :param segment: Segment number counted from the start number for the initialization segment
+    :return: URL or None when the representation does not exist or does not have the segment
     """
-    try:
-        segment_sizes = dict([(bitrate, dp_object.video[bitrate].segment_sizes[segment_number - 1]) for bitrate in dp_object.video])
-    except Exception as e:
-        config_dash.LOG.error("Unable to get the segment sizes")
+    adaptationSet = dp_object.getAdaptationSetFromId(adaptation_set_id)
+    if adaptationSet is None or bitrate not in adaptationSet.video:
         return None
-    config_dash.LOG.debug("The segment sizes of {} are {}".format(segment_number, segment_sizes))
-    return segment_sizes
+    return read_mpd.get_segment_url(adaptationSet.video[bitrate], segment)
 
 
 def get_vmafs(dp_object, segment_number):
@@ -530,22 +391,9 @@ def get_vmafs(dp_object, segment_number):
     return vmafs
 
 
-def get_average_segment_sizes(dp_object):
-    """
-    Module to get the avearge segment sizes for each bitrate
-    :param dp_object:
-    :return: A dictionary of aveage segment sizes for each bitrate
-    """
-    average_segment_sizes = dict()
-    for bitrate in dp_object.video:
-        segment_sizes = dp_object.video[bitrate].segment_sizes
-        segment_sizes = [float(i) for i in segment_sizes]
-        try:
-            average_segment_sizes[bitrate] = sum(segment_sizes)/len(segment_sizes)
-        except ZeroDivisionError:
-            average_segment_sizes[bitrate] = 0
-    config_dash.LOG.info("The avearge segment size for is {}".format(average_segment_sizes.items()))
-    return average_segment_sizes
+def log_segment_timing(segment_timing):
+    """ SEGMENT_TIMING_HOOK writing the stage timings of every segment to the metrics log """
+    get_metrics_sink().emit('segment_timing', segment_timing)
 
 
 def clean_files(folder_path):
@@ -615,6 +463,28 @@ def start_playback_all(dp_object, domain):
                 break
 
 
+def configure_buffer_size(buffer_size_seconds, video_segment_duration):
+    """ Module to set the buffer related constants of all the ABR logics
+    :param buffer_size_seconds: Maximum buffer size in seconds
+    :param video_segment_duration: Playback duration of each segment
+    """
+    config_dash.NETFLIX_BUFFER_SIZE_SECONDS = buffer_size_seconds
+    # Fix all the maximum buffer sizes to get a fair comparison
+    config_dash.BASIC_THRESHOLD = config_dash.NETFLIX_BUFFER_SIZE_SECONDS / video_segment_duration
+    # Update maximum buffer size (in segments) based on the maximum buffer size (in seconds) and the video segment duration
+    config_dash.NETFLIX_BUFFER_SIZE = config_dash.NETFLIX_BUFFER_SIZE_SECONDS / video_segment_duration
+    # Update the value for MAX_BUFFER_SIZE to have a fair comparison between ABR logics
+    config_dash.MAX_BUFFER_SIZE = config_dash.NETFLIX_BUFFER_SIZE_SECONDS / video_segment_duration
+    if config_dash.NETFLIX_BUFFER_SIZE_SECONDS == 20:
+        config_dash.ALPHA_BUFFER_COUNT = 2 
+        config_dash.BETA_BUFFER_COUNT = 4
+        config_dash.STABLE_BUFFER_TIME = 10
+    else:
+        config_dash.ALPHA_BUFFER_COUNT = 5
+        config_dash.BETA_BUFFER_COUNT = 10
+        config_dash.STABLE_BUFFER_TIME = 20
+
+
 def create_arguments(parser):
     """ Adding arguments to the parser """
     parser.add_argument('-m', '--MPD',                   
@@ -625,6 +495,10 @@ def create_arguments(parser):
     parser.add_argument('-n', '--SEGMENT_LIMIT', help="The Segment number limit")
     parser.add_argument('-d', '--DOWNLOAD', default=False, help="Keep the video files after playback")
     parser.add_argument('-z', '--MULTI_CODEC', default=False, help="Activate MCOM Plugin")
+    parser.add_argument('-k', '--LOOKAHEAD', default=False, action='store_true',
+                        help="Download the next segment while the current one is decided")
+    parser.add_argument('-t', '--TIMING', default=False, action='store_true',
+                        help="Write the stage timings of every segment to the metrics log")
 
 
 def main():
@@ -646,7 +520,9 @@ def main():
     if not args.MPD:
         print("ERROR: Please provide the URL to the MPD file. Try Again..")
         return None
-    config_dash.NETFLIX_BUFFER_SIZE_SECONDS = float(args.BUFFER_SIZE)
+    config_dash.SEGMENT_LOOKAHEAD = args.LOOKAHEAD
+    if args.TIMING:
+        config_dash.SEGMENT_TIMING_HOOK = log_segment_timing
     config_dash.LOG.info('Settings: multi-codec -> {}, medusa_mc -> {}'.format(args.MULTI_CODEC, medusa_mc))
     config_dash.LOG.info('Downloading MPD file {}'.format(args.MPD))
     # Retrieve the MPD files for the video
@@ -657,20 +533,7 @@ def main():
     # Reading the MPD file created
     dp_object, video_segment_duration = read_mpd.read_mpd(mpd_file, dp_object)
 
-    # Fix all the maximum buffer sizes to get a fair comparison
-    config_dash.BASIC_THRESHOLD = config_dash.NETFLIX_BUFFER_SIZE_SECONDS / video_segment_duration
-    # Update maximum buffer size (in segments) based on the maximum buffer size (in seconds) and the video segment duration
-    config_dash.NETFLIX_BUFFER_SIZE = config_dash.NETFLIX_BUFFER_SIZE_SECONDS / video_segment_duration
-    # Update the value for MAX_BUFFER_SIZE to have a fair comparison between ABR logics
-    config_dash.MAX_BUFFER_SIZE = config_dash.NETFLIX_BUFFER_SIZE_SECONDS / video_segment_duration
-    if config_dash.NETFLIX_BUFFER_SIZE_SECONDS == 20:
-        config_dash.ALPHA_BUFFER_COUNT = 2 
-        config_dash.BETA_BUFFER_COUNT = 4
-        config_dash.STABLE_BUFFER_TIME = 10
-    else:
-        config_dash.ALPHA_BUFFER_COUNT = 5
-        config_dash.BETA_BUFFER_COUNT = 10
-        config_dash.STABLE_BUFFER_TIME = 20
+    configure_buffer_size(float(args.BUFFER_SIZE), video_segment_duration)
     
     config_dash.LOG.info("The DASH media has {} video adaptations with a total of {} video representations".format(len([aset for aset in dp_object.adaptationSets if aset.mimeType == "video"]), sum([len(aset.video) for aset in dp_object.adaptationSets])))
     if args.LIST:
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Check of adaptation/estimators.py: each estimator is fed random samples and
+compared after every update with the naive computation over the same window.
+
+From commandline:
+    python3 estimators_test.py
+"""
+from __future__ import print_function, division
+import math
+import random
+from adaptation.estimators import nearest_rank, HarmonicMean, SlidingAverage, SlidingPercentile, Ewma
+
+SAMPLE_COUNT = 2000
+WINDOWS = [1, 2, 5, 16]
+
+
+def random_samples(seed, duplicates=False):
+    """ Download rates in bytes per second. With duplicates, the samples are drawn from a few values """
+    generator = random.Random(seed)
+    if duplicates:
+        return [generator.choice([1e5, 2e5, 2e5, 5e5, 1e6]) for _ in range(SAMPLE_COUNT)]
+    return [generator.lognormvariate(13, 1) for _ in range(SAMPLE_COUNT)]
+
+
+def assert_close(value, expected, message):
+    assert abs(value - expected) <= 1e-9 * abs(expected), "{}: {} instead of {}".format(message, value, expected)
+
+
+def test_harmonic_mean():
+    generator = random.Random(1)
+    for window in WINDOWS:
+        estimator = HarmonicMean(window)
+        history = list()
+        for _ in range(SAMPLE_COUNT):
+            size, download_time = generator.uniform(1e5, 1e7), generator.uniform(0.01, 5)
+            history.append((size, download_time))
+            last = history[-window:]
+            estimator.update(size, download_time)
+            assert_close(estimator.value, sum(size for size, _ in last) / sum(time for _, time in last),
+                         "HarmonicMean({})".format(window))
+            assert_close(estimator.average_time(), sum(time for _, time in last) / len(last),
+                         "HarmonicMean({}).average_time".format(window))
+
+
+def test_sliding_average():
+    for window in WINDOWS:
+        estimator = SlidingAverage(window)
+        samples = random_samples(2)
+        for index, sample in enumerate(samples):
+            last = samples[max(index + 1 - window, 0):index + 1]
+            assert_close(estimator.update(sample), sum(last) / len(last), "SlidingAverage({})".format(window))
+
+
+def test_sliding_percentile():
+    for window in WINDOWS:
+        for percentile in (0, 1, 25, 50, 90, 95, 100):
+            for duplicates in (False, True):
+                estimator = SlidingPercentile(window, percentile)
+                samples = random_samples(3, duplicates)
+                for index, sample in enumerate(samples):
+                    last = sorted(samples[max(index + 1 - window, 0):index + 1])
+                    value, expected = estimator.update(sample), nearest_rank(last, percentile)
+                    assert value == expected, "SlidingPercentile({}, {}): {} instead of {}".format(
+                        window, percentile, value, expected)
+                # The stale entries of the heaps are dropped regularly
+                assert len(estimator.lower) + len(estimator.upper) <= 2 * window + 1
+
+
+def test_ewma():
+    for half_life in (0.5, 1, 3, 10):
+        estimator = Ewma.from_half_life(half_life)
+        assert_close(math.pow(1 - estimator.alpha, half_life), 0.5, "Ewma.from_half_life({})".format(half_life))
+        # Past a few hundred samples, the weights of the first samples are below the float resolution
+        samples = random_samples(4)[:300]
+        for index, sample in enumerate(samples):
+            # Weight of each sample: alpha * (1 - alpha)^age, normalized by the sum of the weights
+            weights = [estimator.alpha * math.pow(1 - estimator.alpha, index - position)
+                       for position in range(index + 1)]
+            expected = math.fsum(weight * value for weight, value in zip(weights, samples)) / math.fsum(weights)
+            assert_close(estimator.update(sample), expected, "Ewma.from_half_life({})".format(half_life))
+
+
+if __name__ == "__main__":
+    for test in (test_harmonic_mean, test_sliding_average, test_sliding_percentile, test_ewma):
+        test()
+        print("{}: OK".format(test.__name__))
@@ -0,0 +1,262 @@
+#!/usr/local/bin/python
+"""
+Load generator: run many independent AStream playback sessions in one process.
+
+Every session has its own keep-alive connections, ABR state (AbrController)
+and JSON log, and its playout buffer is advanced on the wall clock only
+when the session needs it (SimulatedPlayer), so a session costs one mostly
+idle worker thread instead of a process with a busy player thread.
+The sessions do not run dash_client.start_playback_smart: the ABR decisions
+and the HTTP downloads are the same as the client, but the segments are not
+written to disk and the playout is the SimulatedPlayer model of
+dash_buffer.DashPlayer, not the DashPlayer thread itself.
+The sessions are started gradually (ramp-up) on a bounded pool of workers.
+
+At the end the aggregate throughput, the p50/p99 segment latency and the
+stall rate are reported.
+
+From commandline:
+    python3 load_generator.py -m "http://127.0.0.1:8000/media/mpd/x4ukwHdACDw.mpd" -p netflix -s 500 -r 0.1
+"""
+from __future__ import division
+import os
+import sys
+import json
+import time
+import timeit
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import urllib.parse as urlparse  # working for Python3
+except ImportError:
+    import urlparse
+import config_dash
+import read_mpd
+from read_mpd import DashPlayback
+from abr_controller import AbrController, get_segment_count
+from adaptation.estimators import nearest_rank
+from connection_pool import ConnectionPool, SegmentFetcher, SegmentDownloadError
+from dash_client import get_mpd, get_domain_name, configure_buffer_size, get_segment_path
+from simulation import SimulatedPlayer, new_json_handle, configure_simulation_log, get_playback_types
+
+DEFAULT_SESSIONS = 10
+# Seconds between the start of two sessions
+DEFAULT_RAMP_INTERVAL = 1
+DEFAULT_BUFFER_SIZE = 20
+
+
+class WallClock:
+    """ Real time clock with the interface of simulation.VirtualClock """
+    def time(self):
+        return timeit.default_timer()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class NullWriter:
+    """ Discards the downloaded segments. Only the sizes and timings matter for the load test """
+    def write(self, data):
+        pass
+
+
+def prepare_playback(dp_object, video_segment_duration):
+    """ Resolve the URL templates of every representation once, so that the sessions share a read-only dp_object """
+    for adaptation_set in dp_object.adaptationSets:
+        for bitrate in adaptation_set.video:
+            read_mpd.get_url_list(adaptation_set.video[bitrate], video_segment_duration,
+                                  dp_object.playback_duration, bitrate, adaptation_set.video[bitrate].id)
+
+
+class PlaybackSession:
+    """ One emulated viewer """
+    def __init__(self, session_id, domain, dp_object, video_segment_duration, playback_type,
+                 multi_codec=False, segment_limit=None):
+        self.session_id = session_id
+        self.domain = domain
+        self.dp_object = dp_object
+        self.video_segment_duration = video_segment_duration
+        self.playback_type = playback_type
+        self.multi_codec = multi_codec
+        self.segment_limit = segment_limit
+        self.clock = WallClock()
+        self.json_handle = new_json_handle(playback_type + ("-mcom" if multi_codec else ""))
+        # The server shapes the bandwidth of every session separately (dash_server.py -m session)
+        self.segment_fetcher = SegmentFetcher(ConnectionPool(), session_id="{}-{}".format(os.getpid(), session_id))
+        # Time from the request to the last byte of every segment (including the connection setup)
+        self.segment_latencies = list()
+        self.total_downloaded = 0
+        self.errors = 0
+
+    def run(self):
+        """ Play the video. Returns the session itself so that it can be collected from the worker pool """
+        dash_player = SimulatedPlayer(self.dp_object.playback_duration, self.video_segment_duration, self.clock,
+                                      self.json_handle)
+        if self.segment_limit:
+            dash_player.segment_limit = int(self.segment_limit)
+        # The initialization segment followed by the media segments of the longest representation
+        segment_count = get_segment_count(self.dp_object)
+        abr = AbrController(self.dp_object, self.playback_type, self.multi_codec, segment_count=segment_count,
+                            clock=self.clock)
+        dash_player.start()
+        segment_duration = 0
+        previous_bitrate = None
+        null_writer = NullWriter()
+        try:
+            for segment_number in range(abr.start - 1, abr.start - 1 + segment_count):
+                if self.segment_limit and segment_number > int(self.segment_limit):
+                    break
+                dash_player.advance()
+                adaptation_set_id, bitrate, vmaf, delay = abr.next_segment(segment_number, dash_player)
+                if abr.completed:
+                    break
+                if abr.uses_mcom() and not abr.mcom_current_bitrate:
+                    adaptation_set_id, bitrate = abr.adaptation_set_id, abr.current_bitrate
+                if dash_player.buffer.qsize() > config_dash.MAX_BUFFER_SIZE and delay == 0:
+                    delay = 1
+                if delay:
+                    self.clock.sleep(delay * segment_duration)
+                    dash_player.advance()
+                segment_path = get_segment_path(self.dp_object, adaptation_set_id, bitrate, segment_number + 1)
+                if segment_path is None:
+                    config_dash.LOG.error("Session {}: No segment {} at bitrate {}".format(
+                        self.session_id, segment_number + 1, bitrate))
+                    self.errors += 1
+                    continue
+                segment_url = urlparse.urljoin(self.domain, segment_path)
+                try:
+                    segment_size, segment_timing = self.segment_fetcher.fetch(segment_url, null_writer)
+                except (SegmentDownloadError, IOError) as e:
+                    config_dash.LOG.error("Session {}: {}".format(self.session_id, e))
+                    self.errors += 1
+                    continue
+                self.segment_latencies.append(segment_timing['connect_time'] + segment_timing['first_byte_time'] +
+                                              segment_timing['transfer_time'])
+                self.total_downloaded += segment_size
+                abr.update(segment_size, segment_timing['transfer_time'])
+                media = self.dp_object.getAdaptationSetFromId(adaptation_set_id).video[bitrate]
+                self.json_handle['segment_info'].append((os.path.basename(segment_path), bitrate,
+                                                         self.dp_object.getAdaptationSetFromId(adaptation_set_id).codec,
+                                                         vmaf, segment_size, segment_timing['transfer_time'],
+                                                         media.resolution))
+                segment_duration = self.video_segment_duration
+                dash_player.write({'playback_length': self.video_segment_duration,
+                                   'size': segment_size,
+                                   'bitrate': abr.current_bitrate,
+                                   'data': None,
+                                   'URI': segment_url,
+                                   'segment_number': segment_number})
+                if previous_bitrate:
+                    if previous_bitrate < abr.current_bitrate:
+                        self.json_handle['playback_info']['up_shifts'] += 1
+                    elif previous_bitrate > abr.current_bitrate:
+                        self.json_handle['playback_info']['down_shifts'] += 1
+                previous_bitrate = abr.current_bitrate
+        finally:
+            self.segment_fetcher.close()
+        # The remaining buffer cannot stall anymore: no need to wait for it in real time
+        dash_player.finish()
+        return self
+
+
+def percentile(values, percent):
+    """ Nearest-rank percentile of a list of values """
+    if not values:
+        return None
+    return nearest_rank(sorted(values), percent)
+
+
+def get_report(sessions, duration):
+    """ Module to aggregate the statistics of the sessions
+    :param sessions: list of completed PlaybackSession
+    :param duration: wall time of the load test in seconds
+    :return: dict with the aggregate results
+    """
+    latencies = [latency for session in sessions for latency in session.segment_latencies]
+    total_downloaded = sum(session.total_downloaded for session in sessions)
+    stalled_sessions = [s for s in sessions if s.json_handle['playback_info']['interruptions']['count']]
+    stall_time = sum(s.json_handle['playback_info']['interruptions']['total_duration'] for s in sessions)
+    played_time = sum(len(s.segment_latencies) * s.video_segment_duration for s in sessions)
+    return {'sessions': len(sessions),
+            'duration': duration,
+            'segments': len(latencies),
+            'errors': sum(session.errors for session in sessions),
+            'total_downloaded': total_downloaded,
+            'throughput_mbps': total_downloaded * 8 / duration / 1000000 if duration else 0,
+            'p50_segment_latency': percentile(latencies, 50),
+            'p99_segment_latency': percentile(latencies, 99),
+            'stalled_sessions': len(stalled_sessions),
+            'stall_rate': len(stalled_sessions) / len(sessions) if sessions else 0,
+            'stall_ratio': stall_time / (stall_time + played_time) if played_time else 0}
+
+
+def run_load_test(mpd_url, playback_type, session_count=DEFAULT_SESSIONS, ramp_interval=DEFAULT_RAMP_INTERVAL,
+                  workers=None, multi_codec=False, buffer_size=DEFAULT_BUFFER_SIZE, segment_limit=None):
+    """ Module to run session_count concurrent playback sessions
+    :param ramp_interval: seconds between the start of two sessions
+    :param workers: size of the worker pool. Default: one worker per session
+    :return: the report of get_report
+    """
+    mpd_file = get_mpd(mpd_url)
+    if not mpd_file:
+        return None
+    domain = get_domain_name(mpd_url)
+    dp_object, video_segment_duration = read_mpd.read_mpd(mpd_file, DashPlayback())
+    configure_buffer_size(float(buffer_size), video_segment_duration)
+    prepare_playback(dp_object, video_segment_duration)
+    sessions = list()
+    futures = list()
+    start_time = timeit.default_timer()
+    with ThreadPoolExecutor(max_workers=workers or session_count) as executor:
+        for session_id in range(session_count):
+            # Ramp-up: start the sessions gradually
+            delay = start_time + session_id * ramp_interval - timeit.default_timer()
+            if delay > 0:
+                time.sleep(delay)
+            session = PlaybackSession(session_id, domain, dp_object, video_segment_duration,
+                                      playback_type, multi_codec, segment_limit)
+            futures.append(executor.submit(session.run))
+            config_dash.LOG.info("Started session {}".format(session_id))
+        for future in futures:
+            try:
+                sessions.append(future.result())
+            except Exception as e:
+                config_dash.LOG.error("Session failed: {}".format(e))
+    return get_report(sessions, timeit.default_timer() - start_time)
+
+
+def create_arguments(parser):
+    """ Adding arguments to the parser """
+    parser.add_argument('-m', '--MPD', required=True, help="Url to the MPD File")
+    parser.add_argument('-p', '--PLAYBACK', default='basic', help="Playback type (basic, bola, sara, netflix or medusa)")
+    parser.add_argument('-s', '--SESSIONS', type=int, default=DEFAULT_SESSIONS, help="Number of concurrent sessions")
+    parser.add_argument('-r', '--RAMP', type=float, default=DEFAULT_RAMP_INTERVAL,
+                        help="Seconds between the start of two sessions")
+    parser.add_argument('-w', '--WORKERS', type=int, default=None, help="Size of the worker pool. Default = SESSIONS")
+    parser.add_argument('-b', '--BUFFER_SIZE', type=float, default=DEFAULT_BUFFER_SIZE, help="Buffer size in seconds")
+    parser.add_argument('-n', '--SEGMENT_LIMIT', help="The Segment number limit")
+    parser.add_argument('-z', '--MULTI_CODEC', default=False, action='store_true', help="Activate MCOM Plugin")
+    parser.add_argument('-o', '--OUTPUT', help="JSON file for the report")
+
+
+def main():
+    """ Main Program wrapper """
+    parser = ArgumentParser(description='Run concurrent AStream sessions')
+    create_arguments(parser)
+    args = parser.parse_args()
+    configure_simulation_log(logging.WARNING)
+    report = run_load_test(args.MPD, get_playback_types(args.PLAYBACK)[0], args.SESSIONS, args.RAMP, args.WORKERS,
+                           args.MULTI_CODEC, args.BUFFER_SIZE, args.SEGMENT_LIMIT)
+    if report is None:
+        return 1
+    print(json.dumps(report, indent=4))
+    if args.OUTPUT:
+        with open(args.OUTPUT, 'w') as report_handle:
+            json.dump(report, report_handle, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Metrics sink: the records of a playback session are written by a background thread.
+
+The player and the download loop only put the records on a queue. The writer
+thread collects them for config_dash.METRICS_FLUSH_INTERVAL seconds and appends
+the batch to the metrics file (JSON Lines: one JSON object per line) with one
+write, instead of rewriting the whole JSON log after every segment and reopening
+the buffer CSV for every event. The buffer records are also appended to the
+buffer CSV (config_dash.BUFFER_LOG_FILENAME) with the columns of the README.
+
+Record types:
+    segment_info    segment_name, bitrate, codec, vmaf, segment_size, segment_download_time, resolution
+    buffer          epoch_time, playback_time, buffer_size, playback_state, action, bitrate
+    interruption    start, end, duration (in seconds of playback time)
+    playback_info   playback_info of config_dash.JSON_HANDLE at the end of the session
+    segment_timing  stage timings of every segment (dash_client.py -t, see config_dash.SEGMENT_TIMING_HOOK)
+
+With config_dash.METRICS_FORMAT = 'columnar', every batch is written as one line
+per record type with the list of values of each field:
+    {"type": "buffer", "columns": {"epoch_time": [...], "playback_time": [...], ...}}
+"""
+from __future__ import division
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+import os
+import csv
+import json
+import atexit
+import threading
+from collections import OrderedDict
+import config_dash
+from stop_watch import clock
+
+SEGMENT_INFO_FIELDS = ('segment_name', 'bitrate', 'codec', 'vmaf', 'segment_size', 'segment_download_time',
+                       'resolution')
+BUFFER_FIELDS = ('epoch_time', 'playback_time', 'buffer_size', 'playback_state', 'action', 'bitrate')
+BUFFER_LOG_HEADER = "EpochTime,CurrentPlaybackTime,CurrentBufferSize,CurrentPlaybackState,Action,Bitrate".split(",")
+
+
+class MetricsSink:
+    """ Queue of records written to disk by a background thread """
+    def __init__(self, metrics_file, buffer_log_file=None, flush_interval=None, columnar=None):
+        """
+        :param metrics_file: JSON Lines file (None to keep only the buffer CSV)
+        :param buffer_log_file: CSV file of the buffer records (None to skip it)
+        :param flush_interval: seconds during which the records are collected before a write.
+            Default: config_dash.METRICS_FLUSH_INTERVAL
+        :param columnar: write the batches by columns. Default: config_dash.METRICS_FORMAT == 'columnar'
+        """
+        if flush_interval is None:
+            flush_interval = config_dash.METRICS_FLUSH_INTERVAL
+        if columnar is None:
+            columnar = config_dash.METRICS_FORMAT == 'columnar'
+        self.metrics_file = metrics_file
+        self.buffer_log_file = buffer_log_file
+        self.flush_interval = flush_interval
+        self.columnar = columnar
+        # (record type, record). None stops the writer thread
+        self.records = Queue.Queue()
+        self.closed = False
+        self.writer_thread = threading.Thread(target=self.run)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def emit(self, record_type, record):
+        """ Queue a record (dict). Never waits for the disk """
+        self.records.put((record_type, record))
+
+    def segment_info(self, segment_info):
+        """ :param segment_info: tuple of config_dash.JSON_HANDLE['segment_info'] """
+        self.emit('segment_info', dict(zip(SEGMENT_INFO_FIELDS, segment_info)))
+
+    def buffer(self, stats):
+        """ :param stats: (epoch_time, playback_time, buffer_size, playback_state, action, bitrate) """
+        self.emit('buffer', dict(zip(BUFFER_FIELDS, stats)))
+
+    def interruption(self, start, end):
+        self.emit('interruption', {'start': start, 'end': end, 'duration': end - start})
+
+    def close(self):
+        """ Write the queued records and stop the writer thread """
+        if self.closed:
+            return
+        self.closed = True
+        self.records.put(None)
+        self.writer_thread.join()
+
+    def get_batch(self):
+        """ Wait for a record, then collect the records queued during flush_interval seconds
+            :return: (list of records, True when the sink is closed)
+        """
+        record = self.records.get()
+        batch = list()
+        deadline = clock() + self.flush_interval
+        while record is not None:
+            batch.append(record)
+            remaining = deadline - clock()
+            try:
+                if remaining > 0:
+                    record = self.records.get(timeout=remaining)
+                else:
+                    record = self.records.get_nowait()
+            except Queue.Empty:
+                return batch, False
+        return batch, True
+
+    def format_batch(self, batch):
+        """ Lines of the metrics file for a batch of records """
+        if not self.columnar:
+            return [json.dumps(dict(type=record_type, **record)) for record_type, record in batch]
+        tables = OrderedDict()
+        for record_type, record in batch:
+            if record_type not in tables:
+                tables[record_type] = OrderedDict((field, list()) for field in record)
+            for field, values in tables[record_type].items():
+                values.append(record.get(field))
+        return [json.dumps({'type': record_type, 'columns': columns}) for record_type, columns in tables.items()]
+
+    def run(self):
+        """ Writer thread """
+        metrics_handle = buffer_handle = buffer_writer = None
+        if self.metrics_file:
+            metrics_handle = open(self.metrics_file, 'a')
+        if self.buffer_log_file:
+            new_file = not os.path.exists(self.buffer_log_file)
+            buffer_handle = open(self.buffer_log_file, 'a')
+            buffer_writer = csv.writer(buffer_handle, delimiter=",")
+            if new_file:
+                buffer_writer.writerow(BUFFER_LOG_HEADER)
+        try:
+            closed = False
+            while not closed:
+                batch, closed = self.get_batch()
+                if metrics_handle and batch:
+                    metrics_handle.write("\n".join(self.format_batch(batch)) + "\n")
+                    metrics_handle.flush()
+                if buffer_writer:
+                    buffer_writer.writerows([str(record[field]) for field in BUFFER_FIELDS]
+                                            for record_type, record in batch if record_type == 'buffer')
+                    buffer_handle.flush()
+        finally:
+            for handle in (metrics_handle, buffer_handle):
+                if handle:
+                    handle.close()
+
+
+def get_metrics_sink():
+    """ MetricsSink of the process (config_dash.METRICS_SINK), created on the first call with the file names
+        of config_dash. It is closed at the exit of the interpreter if close_metrics_sink was not called.
+    """
+    if config_dash.METRICS_SINK is None:
+        config_dash.METRICS_SINK = MetricsSink(config_dash.METRICS_LOG, config_dash.BUFFER_LOG_FILENAME)
+        atexit.register(config_dash.METRICS_SINK.close)
+    return config_dash.METRICS_SINK
+
+
+def close_metrics_sink():
+    """ Write the remaining records of the process sink to the disk """
+    if config_dash.METRICS_SINK is not None:
+        config_dash.METRICS_SINK.close()
+        config_dash.METRICS_SINK = None
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Check of read_mpd on the sample MPDs: every MPD of dist/sample_mpd is parsed
+(without the MPD cache) and the initialization, first and last segment URLs of
+every video representation are formatted from its SegmentTemplate.
+
+From commandline:
+    python3 mpd_test.py
+"""
+from __future__ import print_function
+import os
+import glob
+import config_dash
+import read_mpd
+from simulation import configure_simulation_log
+
+SAMPLE_MPD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'sample_mpd')
+
+
+def check_mpd(mpd_file):
+    """ Module to parse an MPD and format the segment URLs of its representations
+    :return: number of representations checked
+    """
+    configure_simulation_log()
+    config_dash.MPD_CACHE = False
+    dp_object, _ = read_mpd.read_mpd(mpd_file, read_mpd.DashPlayback())
+    representations = 0
+    for adaptation_set in dp_object.adaptationSets:
+        for bitrate, media in adaptation_set.video.items():
+            assert len(media.url_list) > 0, "{}: no segment for {}".format(mpd_file, bitrate)
+            for segment_url in (media.url_list[0], media.url_list[-1],
+                                read_mpd.get_segment_url(media, media.start + 1)):
+                assert '%' not in segment_url and '$' not in segment_url, \
+                    "{}: bad segment URL {}".format(mpd_file, segment_url)
+            assert str(media.start) in os.path.basename(media.url_list[0])
+            assert '$' not in media.initialization
+            representations += 1
+    assert representations, "{}: no video representation".format(mpd_file)
+    return representations
+
+
+def test_sample_mpds():
+    mpd_files = sorted(glob.glob(os.path.join(SAMPLE_MPD_FOLDER, '*.mpd')))
+    assert mpd_files
+    for mpd_file in mpd_files:
+        check_mpd(mpd_file)
+
+
+if __name__ == "__main__":
+    for mpd_file in sorted(glob.glob(os.path.join(SAMPLE_MPD_FOLDER, '*.mpd'))):
+        print("{}: {} representations".format(os.path.basename(mpd_file), check_mpd(mpd_file)))
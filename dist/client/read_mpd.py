@@ -5,11 +5,20 @@
 """
 from __future__ import division
 from collections import OrderedDict
+from array import array
+import hashlib
+import os
 import re
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle  # working for Python3
 import config_dash
 
 FORMAT = 0
 URL_LIST = list()
+# Changing the parser or the classes invalidates the parsed MPDs in the cache
+MPD_CACHE_VERSION = '2'
 # Dictionary to convert size to bits
 SIZE_DICT = {'bits':   1,
              'Kbits':  1024,
@@ -87,8 +96,10 @@ class MediaObject(object):
         self.segment_duration = None
         self.initialization = None
         self.base_url = None
+        # array('d') of the segment sizes (in bits) and VMAF values
         self.segment_sizes = None
         self.vmafs = None
+        # SegmentUrlList filled by get_url_list
         self.url_list = list()
 
 
@@ -125,436 +136,271 @@ def get_playback_time(playback_duration):
     return total_duration
 
 
+def get_template_format(template, bitrate, representationId):
+    """ Module to convert a SegmentTemplate media string into a %-format string
+        eg: 'video/$RepresentationID$/seg-$Number%04d$.m4f' -> 'video/1/seg-%04d.m4f'
+            'bunny_$Bandwidth$bps/BigBuckBunny_4s$Number$%d.m4s' -> 'bunny_45226bps/BigBuckBunny_4s%d.m4s'
+            'swiss_$Bandwidth$bps/TheSwissAccount_4s$Number$.m4s' -> 'swiss_88745bps/TheSwissAccount_4s%d.m4s'
+    """
+    if "$Bandwidth$" in template:
+        template = template.replace("$Bandwidth$", str(bitrate))
+    if "$RepresentationID$" in template:
+        template = template.replace("$RepresentationID$", str(representationId))
+    if "$Number" in template:
+        template = template.split('$')
+        template[1] = template[1].replace('Number', '')
+        # $Number$ without a format: the format spec may follow the identifier
+        if not template[1] and not template[2].startswith('%'):
+            template[1] = '%d'
+        template = ''.join(template)
+    return template
+
+
+def get_segment_count(segment_duration, playback_duration):
+    """ Number of media segments needed to cover the playback duration """
+    segment_count = 1
+    total_playback = segment_duration
+    while total_playback < playback_duration:
+        total_playback += segment_duration
+        segment_count += 1
+    return segment_count
+
+
+class SegmentUrlList(object):
+    """ Read-only list of the media segment URLs of a representation.
+        The URLs are generated from the SegmentTemplate when they are accessed.
+    """
+    def __init__(self, url_format, start, segment_count):
+        self.url_format = url_format
+        self.start = start
+        self.segment_count = segment_count
+
+    def __len__(self):
+        return self.segment_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.segment_count))]
+        if index < 0:
+            index += self.segment_count
+        if not 0 <= index < self.segment_count:
+            raise IndexError("Segment index out of range")
+        return self.url_format % (self.start + index)
+
+    def __iter__(self):
+        for index in range(self.segment_count):
+            yield self.url_format % (self.start + index)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+
 def get_url_list(media, segment_duration,  playback_duration, bitrate, representationId):
     """
     Module to get the List of URLs
+    The URLs (and the initialization URL) are resolved from the template on access
     """
-    # Counting the init file
-    total_playback = segment_duration
-    # print(playback_duration)
-    # print(segment_duration)
-    segment_count = media.start
-    # Get the Base URL string
-    base_url = media.base_url
-    if "$Bandwidth$" in base_url:
-        base_url = base_url.replace("$Bandwidth$", str(bitrate))
-    if "$RepresentationID$" in base_url:
-        base_url = base_url.replace("$RepresentationID$", str(representationId))
-    if "$Number" in base_url:
-        base_url = base_url.split('$')
-        base_url[1] = base_url[1].replace('$', '')
-        base_url[1] = base_url[1].replace('Number', '')
-        base_url = ''.join(base_url)
-    while True:
-        # print(base_url % segment_count)
-        media.url_list.append(base_url % segment_count)
-        segment_count += 1
-        if total_playback >= playback_duration:
-            break
-        total_playback += segment_duration
-    # elif FORMAT == 1:
-    #     media.url_list = URL_LIST
-    #print media.url_list
+    media.url_list = SegmentUrlList(get_template_format(media.base_url, bitrate, representationId),
+                                    media.start, get_segment_count(segment_duration, playback_duration))
+    if media.initialization:
+        media.initialization = get_template_format(media.initialization, bitrate, representationId)
     return media
 
 
+def get_segment_url(media, segment):
+    """ Module to get the URL of a segment of a representation
+    :param segment: Segment number counted from media.start for the initialization segment
+    :return: relative URL or None when the representation does not have the segment
+    """
+    index = segment - media.start
+    if index == 0:
+        return media.initialization
+    if 0 < index <= len(media.url_list):
+        return media.url_list[index - 1]
+    return None
+
+
+def get_mpd_hash(mpd_file):
+    """ Module to get the key of the MPD in the cache """
+    mpd_hash = hashlib.sha1(MPD_CACHE_VERSION.encode())
+    with open(mpd_file, 'rb') as mpd_handle:
+        for data in iter(lambda: mpd_handle.read(64 * 1024), b''):
+            mpd_hash.update(data)
+    return mpd_hash.hexdigest()
+
+
+def load_cached_mpd(mpd_hash):
+    """ Module to load a parsed MPD from the cache. Returns None when it is not cached """
+    cache_file = os.path.join(config_dash.MPD_CACHE_FOLDER, mpd_hash + '.pickle')
+    try:
+        with open(cache_file, 'rb') as cache_handle:
+            return pickle.load(cache_handle)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+        if os.path.exists(cache_file):
+            config_dash.LOG.warning("Unable to read the MPD cache {}: {}".format(cache_file, e))
+        return None
+
+
+def save_cached_mpd(mpd_hash, parsed_mpd):
+    """ Module to save a parsed MPD in the cache """
+    cache_file = os.path.join(config_dash.MPD_CACHE_FOLDER, mpd_hash + '.pickle')
+    temp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    try:
+        if not os.path.exists(config_dash.MPD_CACHE_FOLDER):
+            os.makedirs(config_dash.MPD_CACHE_FOLDER)
+        with open(temp_file, 'wb') as cache_handle:
+            pickle.dump(parsed_mpd, cache_handle, pickle.HIGHEST_PROTOCOL)
+        # Concurrent runs never read a partial file
+        os.rename(temp_file, cache_file)
+    except (IOError, OSError, pickle.PicklingError) as e:
+        config_dash.LOG.warning("Unable to write the MPD cache {}: {}".format(cache_file, e))
+
+
 def read_mpd(mpd_file, dashplayback):
-    """ Module to read the MPD file"""
-    global FORMAT
+    """ Module to read the MPD file
+        Parsed MPDs are cached in config_dash.MPD_CACHE_FOLDER (keyed by the hash of the file)
+    """
     config_dash.LOG.info("Reading the MPD file")
+    mpd_hash = None
+    if config_dash.MPD_CACHE:
+        try:
+            mpd_hash = get_mpd_hash(mpd_file)
+        except IOError:
+            config_dash.LOG.error("MPD file not found. Exiting")
+            return None
+        cached_mpd = load_cached_mpd(mpd_hash)
+        if cached_mpd:
+            cached_playback, video_segment_duration, video_metadata = cached_mpd
+            config_dash.LOG.info("Using the cached MPD {}".format(mpd_hash))
+            dashplayback.__dict__.update(cached_playback.__dict__)
+            video_metadata['mpd_file'] = mpd_file
+            config_dash.JSON_HANDLE["video_metadata"] = video_metadata
+            return dashplayback, int(video_segment_duration)
     try:
-        tree = ET.parse(mpd_file)
+        video_segment_duration = parse_mpd(mpd_file, dashplayback)
     except IOError:
         config_dash.LOG.error("MPD file not found. Exiting")
         return None
-    config_dash.JSON_HANDLE["video_metadata"] = {'mpd_file': mpd_file}
-    root = tree.getroot()
-    if 'MPD' in get_tag_name(root.tag).upper():
-        if MEDIA_PRESENTATION_DURATION in root.attrib:
-            dashplayback.playback_duration = get_playback_time(root.attrib[MEDIA_PRESENTATION_DURATION])
-            config_dash.JSON_HANDLE["video_metadata"]['playback_duration'] = dashplayback.playback_duration
-        if MIN_BUFFER_TIME in root.attrib:
-            dashplayback.min_buffer_time = get_playback_time(root.attrib[MIN_BUFFER_TIME])
-    # format = 0;
-    # if "Period" in get_tag_name(root[0].tag):
-    #     child_period = root[0]
-    #     FORMAT = 0
-    # elif "Period" in get_tag_name(root[1].tag):
-    #     child_period = root[1]
-    #     FORMAT = 1
-    #print child_period
+    if mpd_hash:
+        save_cached_mpd(mpd_hash, (dashplayback, video_segment_duration, config_dash.JSON_HANDLE["video_metadata"]))
+    return dashplayback, int(video_segment_duration)
+
+
+def set_segment_template(media, attrib):
+    """ Module to set the SegmentTemplate attributes of a representation
+        :return: the segment duration (in seconds)
+    """
+    media.base_url = attrib['media']
+    media.start = int(attrib['startNumber'])
+    media.timescale = float(attrib['timescale'])
+    media.initialization = attrib['initialization']
+    media.segment_duration = float(attrib['duration']) / media.timescale
+    config_dash.LOG.debug("Segment Playback Duration = {}".format(media.segment_duration))
+    return media.segment_duration
+
+
+def parse_mpd(mpd_file, dashplayback):
+    """ Module to parse the MPD file with a streaming parser. The SegmentSize nodes are
+        stored in arrays and released as soon as they are read.
+        :return: the segment duration of the last SegmentTemplate
+    """
+    config_dash.JSON_HANDLE["video_metadata"] = {'mpd_file': mpd_file, 'available_bitrates': list()}
     video_segment_duration = None
-    # if FORMAT == 0:
-    # Print all the information in the MPD
-    for node1 in root:
-        # print("{} found with following attributes: ".format(get_tag_name(node1.tag)))
-        # for att in node1.attrib:
-        #     print("\t - {}: {} ".format(att, node1.attrib[att]))
-        if get_tag_name(node1.tag) == "Period":
-            # print("Period found")
-            for node2 in node1:
-                # print("\t{} found with following attributes: ".format(get_tag_name(node2.tag)))
-                # for att in node2.attrib:
-                #     print("\t\t - {}: {} ".format(att, node2.attrib[att]))
-                if get_tag_name(node2.tag) == "AdaptationSet":
-                    # print("AdaptationSet found")
-                    # Node is an AdaptationSet
-                    adaptation_set = node2
-                    # Create new Adaptation Set
-                    adaptationSet = AdaptationSet()
-                    if 'id' in adaptation_set.attrib:
-                        adaptationSet.id = adaptation_set.attrib['id']
-                    media_object = OrderedDict()
-                    codec = None
-                    mimeType = None
-                    for adaptation_set_child in adaptation_set:
-                        if get_tag_name(adaptation_set_child.tag) == "Representation":
-                            # print("Representation found")
-                            representation = adaptation_set_child
-                            if 'mimeType' in representation.attrib:
-                                media_found = False
-                                if 'video' in representation.attrib['mimeType']:
-                                    # media_object = dashplayback.video
-                                    mimeType = "video"
-                                    media_found = True
-                                    config_dash.LOG.info("Found Video")
-                                elif 'audio' in representation.attrib['mimeType']:
-                                    # media_object = dashplayback.audio
-                                    mimeType = "audio"
-                                    media_found = False
-                                    config_dash.LOG.info("Found Audio")
-                                    print("Not handling AUDIO at the moment")
-                                if media_found:
-                                    config_dash.LOG.info("Retrieving Media")
-                                    config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'] = list()
-                                # print("Media Object is for type {}".format(mimeType))
-                                bandwidth = None
-                                if 'bandwidth' in representation.attrib:
-                                    try:
-                                        bandwidth = int(representation.attrib['bandwidth'])
-                                    except Exception as e:
-                                        print(e)
-                                else:
-                                    # print("Bandwidth not included in Representation")
-                                    continue
-                                config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'].append(bandwidth)
-                                media_object[bandwidth] = MediaObject()
-                                # Check if codec is available
-                                if 'codecs' in representation.attrib:
-                                    # print("Codec available")
-                                    media_object[bandwidth].codec = codec
-                                    codec = representation.attrib['codecs']
-                                if 'id' in representation.attrib:
-                                    # print("RepresentationId available")
-                                    media_object[bandwidth].id = representation.attrib['id']
-                                if 'width' in representation.attrib and 'height' in representation.attrib:
-                                    media_object[bandwidth].resolution = "{}x{}".format(representation.attrib['width'], representation.attrib['height'])
-                                # Fetch sizes of segments in SegmentSize nodes
-                                media_object[bandwidth].segment_sizes = []
-                                # Fetch VMAF values in SegmentSize nodes
-                                media_object[bandwidth].vmafs = []
-                                for representation_child in representation:
-                                    # print("{} found".format(get_tag_name(representation_child.tag)))
-                                    if "SegmentTemplate" in get_tag_name(representation_child.tag):
-                                        # print("SegmentTemplate found")
-                                        segmentTemplate = representation_child
-                                        media_object[bandwidth].base_url = segmentTemplate.attrib['media']
-                                        media_object[bandwidth].start = int(segmentTemplate.attrib['startNumber'])
-                                        media_object[bandwidth].timescale = float(segmentTemplate.attrib['timescale'])
-                                        media_object[bandwidth].initialization = segmentTemplate.attrib['initialization']
-                                        video_segment_duration = (float(segmentTemplate.attrib['duration']) / float(
-                                            segmentTemplate.attrib['timescale']))
-                                        config_dash.LOG.debug("Segment Playback Duration = {}".format(video_segment_duration))
-                                        for segmentTemplate_child in segmentTemplate:
-                                            if "SegmentSize" in get_tag_name(segmentTemplate_child.tag):
-                                                # print("SegmentSize found")
-                                                try:
-                                                    segment_size = float(segmentTemplate_child.attrib['size']) * float(
-                                                        SIZE_DICT[segmentTemplate_child.attrib['scale']])
-                                                    media_object[bandwidth].segment_sizes.append(segment_size)
-                                                except Exception as e:
-                                                    config_dash.LOG.error("Error in reading Segment sizes :{}".format(e))
-                                                    continue
-                                                try:
-                                                    vmaf = float(segmentTemplate_child.attrib['vmaf'])
-                                                    media_object[bandwidth].vmafs.append(vmaf)
-                                                except Exception as e:
-                                                    config_dash.LOG.error("Error in reading VMAF value :{}".format(e))
-                                                    continue
-                    if mimeType == "video":
-                        # print(media_object)
-                        adaptationSet.video = media_object
-                        # print(adaptationSet.video)
-                    elif mimeType == "audio":
-                        adaptationSet.audio = media_object
-                    adaptationSet.mimeType = mimeType
-                    adaptationSet.codec = codec
-                    dashplayback.adaptationSets.append(adaptationSet)
-    #         for node3 in node2:
-    #             # print("\t\t{} found with following attributes: ".format(get_tag_name(node3.tag)))
-    #             # for att in node3.attrib:
-    #             #     print("\t\t\t - {}: {} ".format(att, node3.attrib[att]))
-    #             if get_tag_name(node3.tag) == "Representation":
-    #                 print("Representation found")
-    #             for node4 in node3:
-    #                 # print("\t\t\t{} found with following attributes: ".format(get_tag_name(node4.tag)))
-    #                 # for att in node4.attrib:
-    #                 #     print("\t\t\t\t - {}: {} ".format(att, node4.attrib[att]))
-    #                 if get_tag_name(node4.tag) == "SegmentTemplate":
-    #                     print("SegmentTemplate found")
-    #                 for node5 in node4:
-    #                     # print("\t\t\t{} found with following attributes: ".format(get_tag_name(node5.tag)))
-    #                     # for att in node5.attrib:
-    #                     #     print("\t\t\t\t - {}: {} ".format(att, node5.attrib[att]))
-    #                     if get_tag_name(node5.tag) == "SegmentSize":
-    #                         print("SegmentSize found")
-    # for root_child in root:
-    #     print("{} found with following attributes: ".format(get_tag_name(root_child.tag)))
-    #     for att in root_child.attrib:
-    #         print("\t - {}: {} ".format(att, root_child.attrib[att]))
-    #     for adaptation_set in root_child:
-    #         if 'mimeType' in adaptation_set.attrib:
-    #             media_found = False
-    #             if 'audio' in adaptation_set.attrib['mimeType']:
-    #                 media_object = dashplayback.audio
-    #                 media_found = False
-    #                 config_dash.LOG.info("Found Audio")
-    #             elif 'video' in adaptation_set.attrib['mimeType']:
-    #                 media_object = dashplayback.video
-    #                 media_found = True
-    #                 config_dash.LOG.info("Found Video")
-    #             if media_found:
-    #                 config_dash.LOG.info("Retrieving Media")
-    #                 config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'] = list()
-    #                 for representation in adaptation_set:
-    #                     bandwidth = int(representation.attrib['bandwidth'])
-    #                     config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'].append(bandwidth)
-    #                     media_object[bandwidth] = MediaObject()
-    #                     media_object[bandwidth].segment_sizes = []
-    #                     for segment_info in representation:
-    #                         if "SegmentTemplate" in get_tag_name(segment_info.tag):
-    #                             media_object[bandwidth].base_url = segment_info.attrib['media']
-    #                             media_object[bandwidth].start = int(segment_info.attrib['startNumber'])
-    #                             media_object[bandwidth].timescale = float(segment_info.attrib['timescale'])
-    #                             media_object[bandwidth].initialization = segment_info.attrib['initialization']
-    #                         if 'video' in adaptation_set.attrib['mimeType']:
-    #                             if "SegmentSize" in get_tag_name(segment_info.tag):
-    #                                 try:
-    #                                     segment_size = float(segment_info.attrib['size']) * float(
-    #                                         SIZE_DICT[segment_info.attrib['scale']])
-    #                                 except Exception as e:
-    #                                     config_dash.LOG.error("Error in reading Segment sizes :{}".format(e))
-    #                                     continue
-    #                                 media_object[bandwidth].segment_sizes.append(segment_size)
-    #                             elif "SegmentTemplate" in get_tag_name(segment_info.tag):
-    #                                 video_segment_duration = (float(segment_info.attrib['duration'])/float(
-    #                                     segment_info.attrib['timescale']))
-    #                                 config_dash.LOG.debug("Segment Playback Duration = {}".format(video_segment_duration))
-    #         else:
-    #             for representation in adaptation_set:
-    #                 media_found = False
-    #                 if 'audio' in representation.attrib['mimeType']:
-    #                     media_object = dashplayback.audio
-    #                     media_found = False
-    #                     config_dash.LOG.info("Found Audio")
-    #                 elif 'video' in representation.attrib['mimeType']:
-    #                     media_object = dashplayback.video
-    #                     media_found = True
-    #                     config_dash.LOG.info("Found Video")
-    #                 if media_found:
-    #                     config_dash.LOG.info("Retrieving Media")
-    #                     config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'] = list()
-    #                 bandwidth = int(representation.attrib['bandwidth'])
-    #                 config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'].append(bandwidth)
-    #                 media_object[bandwidth] = MediaObject()
-    #                 media_object[bandwidth].segment_sizes = []
-    #                 media_object[bandwidth].start = int(representation.attrib['startWithSAP'])
-    #                 media_object[bandwidth].base_url = root[0].text
-    #                 tempcut_url = root[0].text.split('/',3)[2:]
-    #                 cut_url = tempcut_url[1]
-    #                 print("cut_url = {}".format(cut_url))
-    #                 #print root[0].text
-    #                 for segment_info in representation:
-    #                     if "SegmentBase" in get_tag_name(segment_info.tag):
-    #                         for init in segment_info:
-    #                             media_object[bandwidth].initialization = cut_url + init.attrib['sourceURL']
-    #
-    #                     if 'video' in representation.attrib['mimeType']:
-    #                         if "SegmentList" in get_tag_name(segment_info.tag):
-    #                             video_segment_duration = (float(segment_info.attrib['duration']))
-    #                             config_dash.LOG.debug("Segment Playback Duration = {}".format(video_segment_duration))
-    #                             for segment_URL in segment_info:
-    #                                 if "SegmentURL" in get_tag_name(segment_URL.tag):
-    #                                     try:
-    #                                         Ssize = segment_URL.attrib['media'].split('/')[0]
-    #                                         Ssize = Ssize.split('_')[-1];
-    #                                         Ssize = Ssize.split('kbit')[0];
-    #                                         #print "ssize"
-    #                                         #print Ssize
-    #                                         segment_size = float(Ssize) * float(
-    #                                             SIZE_DICT["Kbits"])
-    #                                     except Exception as e:
-    #                                         config_dash.LOG.error("Error in reading Segment sizes :{}".format(e))
-    #                                         continue
-    #                                     segurl = cut_url + segment_URL.attrib['media']
-    #                                     #print segurl
-    #                                     URL_LIST.append(segurl)
-    #                                     media_object[bandwidth].segment_sizes.append(segment_size)
-
-    # elif FORMAT == 1: #differentFormat
-    #
-    #     for adaptation_set in child_period:
-    #         for representation in adaptation_set:
-    #             media_found = False
-    #             if 'audio' in representation.attrib['mimeType']:
-    #                 media_object = dashplayback.audio
-    #                 media_found = False
-    #                 config_dash.LOG.info("Found Audio")
-    #             elif 'video' in representation.attrib['mimeType']:
-    #                 media_object = dashplayback.video
-    #                 media_found = True
-    #                 config_dash.LOG.info("Found Video")
-    #             if media_found:
-    #                 config_dash.LOG.info("Retrieving Media")
-    #                 config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'] = list()
-    #             bandwidth = int(representation.attrib['bandwidth'])
-    #             config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'].append(bandwidth)
-    #             media_object[bandwidth] = MediaObject()
-    #             media_object[bandwidth].segment_sizes = []
-    #             media_object[bandwidth].start = int(representation.attrib['startWithSAP'])
-    #             media_object[bandwidth].base_url = root[0].text
-    #             tempcut_url = root[0].text.split('/',3)[2:]
-    #             cut_url = tempcut_url[1]
-    #             print("cut_url = {}".format(cut_url))
-    #             #print root[0].text
-    #             for segment_info in representation:
-    #                 if "SegmentBase" in get_tag_name(segment_info.tag):
-    #                     for init in segment_info:
-    #                         media_object[bandwidth].initialization = cut_url + init.attrib['sourceURL']
-    #
-    #                 if 'video' in representation.attrib['mimeType']:
-    #                     if "SegmentList" in get_tag_name(segment_info.tag):
-    #                         video_segment_duration = (float(segment_info.attrib['duration']))
-    #                         config_dash.LOG.debug("Segment Playback Duration = {}".format(video_segment_duration))
-    #                         for segment_URL in segment_info:
-    #                             if "SegmentURL" in get_tag_name(segment_URL.tag):
-    #                                 try:
-    #                                     Ssize = segment_URL.attrib['media'].split('/')[0]
-    #                                     Ssize = Ssize.split('_')[-1];
-    #                                     Ssize = Ssize.split('kbit')[0];
-    #                                     #print "ssize"
-    #                                     #print Ssize
-    #                                     segment_size = float(Ssize) * float(
-    #                                         SIZE_DICT["Kbits"])
-    #                                 except Exception as e:
-    #                                     config_dash.LOG.error("Error in reading Segment sizes :{}".format(e))
-    #                                     continue
-    #                                 segurl = cut_url + segment_URL.attrib['media']
-    #                                 #print segurl
-    #                                 URL_LIST.append(segurl)
-    #                                 media_object[bandwidth].segment_sizes.append(segment_size)
-
-    # elif FORMAT == 2:  # Other format: Period -> AdaptationSet -> {SupplementalProperty, Representation -> {SegmentTemplate: {SegmentSize, ...}}}
-    #     for adaptation_set in child_period:
-    #         startWithSAP = ""
-    #         if "startWithSAP" in adaptation_set.attrib:
-    #             startWithSAP = adaptation_set.attrib["startWithSAP"]
-    #         # Optional supplemental properties
-    #         for adaptation_set_child in adaptation_set:
-    #             media = ""
-    #             startNumber = ""
-    #             timescale = ""
-    #             initialization = ""
-    #             if "SupplementalProperty" in get_tag_name(adaptation_set_child.tag):
-    #                 print("SupplementalProperty found with following attributes: ")
-    #                 for att in adaptation_set_child.attrib:
-    #                     print("\t - {}: {} ".format(att, adaptation_set_child.attrib[att]))
-    #             elif "SegmentTemplate" in get_tag_name(adaptation_set_child.tag):
-    #                 print("SegmentTemplate found with following attributes: ")
-    #                 for att in adaptation_set_child.attrib:
-    #                     print("\t - {}: {} ".format(att, adaptation_set_child.attrib[att]))
-    #                 if "SegmentTemplate" in get_tag_name(adaptation_set_child.tag):
-    #                     # media_object[bandwidth].base_url = adaptation_set_child.attrib['media']
-    #                     # media_object[bandwidth].start = int(adaptation_set_child.attrib['startNumber'])
-    #                     # media_object[bandwidth].timescale = float(adaptation_set_child.attrib['timescale'])
-    #                     # media_object[bandwidth].initialization = adaptation_set_child.attrib['initialization']
-    #                     if "media" in adaptation_set_child.attrib:
-    #                         media = adaptation_set_child.attrib['media']
-    #                     if "startNumber" in adaptation_set_child.attrib:
-    #                         startNumber = adaptation_set_child.attrib['startNumber']
-    #                     if "timescale" in adaptation_set_child.attrib:
-    #                         timescale = adaptation_set_child.attrib['timescale']
-    #                     if "initialization" in adaptation_set_child.attrib:
-    #                         initialization = adaptation_set_child.attrib['initialization']
-    #             elif "Representation" in get_tag_name(adaptation_set_child.tag):
-    #                 media_found = False
-    #                 if 'audio' in adaptation_set_child.attrib['mimeType']:
-    #                     media_object = dashplayback.audio
-    #                     media_found = False
-    #                     config_dash.LOG.info("Found Audio")
-    #                 elif 'video' in adaptation_set_child.attrib['mimeType']:
-    #                     media_object = dashplayback.video
-    #                     media_found = True
-    #                     config_dash.LOG.info("Found Video")
-    #                 else:
-    #                     print("Error: MediaType is neither 'video' nor 'audio'")
-    #                     continue
-    #                 if media_found:  # Video found
-    #                     config_dash.LOG.info("Retrieving Media")
-    #                     config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'] = list()
-    #                 bandwidth = int(adaptation_set_child.attrib['bandwidth'])
-    #                 config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'].append(bandwidth)
-    #                 media_object[bandwidth] = MediaObject()
-    #                 media_object[bandwidth].segment_sizes = []
-    #                 if "startWithSAP" in adaptation_set_child.attrib:
-    #                     media_object[bandwidth].start = int(adaptation_set_child.attrib['startWithSAP'])
-    #                 elif startWithSAP != "":
-    #                     media_object[bandwidth].start = int(startWithSAP)
-    #                 if media == "":
-    #                     media_object[bandwidth].base_url = root[0].text
-    #                 else:
-    #                     media_object[bandwidth].base_url = media
-    #                 tempcut_url = media_object[bandwidth].base_url.split('/', 3)[2:]
-    #                 print(tempcut_url)
-    #                 cut_url = tempcut_url[1]
-    #                 print("cut_url = {}".format(cut_url))
-    #                 # print root[0].text
-    #                 for segment_info in adaptation_set_child:
-    #                     if "SegmentBase" in get_tag_name(segment_info.tag):
-    #                         for init in segment_info:
-    #                             media_object[bandwidth].initialization = cut_url + init.attrib['sourceURL']
-    #
-    #                     if 'video' in adaptation_set_child.attrib['mimeType']:
-    #                         if "SegmentList" in get_tag_name(segment_info.tag):
-    #                             video_segment_duration = (float(segment_info.attrib['duration']))
-    #                             config_dash.LOG.debug(
-    #                                 "Segment Playback Duration = {}".format(video_segment_duration))
-    #                             for segment_URL in segment_info:
-    #                                 if "SegmentURL" in get_tag_name(segment_URL.tag):
-    #                                     try:
-    #                                         Ssize = segment_URL.attrib['media'].split('/')[0]
-    #                                         Ssize = Ssize.split('_')[-1]
-    #                                         Ssize = Ssize.split('kbit')[0]
-    #                                         # print "ssize"
-    #                                         # print Ssize
-    #                                         segment_size = float(Ssize) * float(
-    #                                             SIZE_DICT["Kbits"])
-    #                                     except Exception as e:
-    #                                         config_dash.LOG.error("Error in reading Segment sizes :{}".format(e))
-    #                                         continue
-    #                                     segurl = cut_url + segment_URL.attrib['media']
-    #                                     # print segurl
-    #                                     URL_LIST.append(segurl)
-    #                                     media_object[bandwidth].segment_sizes.append(segment_size)
-    #             else:
-    #                 print("{} found with following attributes: ".format(get_tag_name(adaptation_set_child.tag)))
-    #                 for att in adaptation_set_child.attrib:
-    #                     print("\t - {}: {} ".format(att, adaptation_set_child.attrib[att]))
-    #
-    #
-    #
-    # else:
-    #
-    #     print("Error: UknownFormat of MPD file!")
-
-    return dashplayback, int(video_segment_duration)
\ No newline at end of file
+    adaptationSet = media = None
+    media_object = OrderedDict()
+    codec = mimeType = adaptation_set_template = None
+    # Names and elements of the open nodes
+    path = []
+    elements = []
+    for event, element in ET.iterparse(mpd_file, events=('start', 'end')):
+        tag_name = get_tag_name(element.tag)
+        if event == 'start':
+            path.append(tag_name)
+            elements.append(element)
+            if tag_name == "MPD" and len(path) == 1:
+                if MEDIA_PRESENTATION_DURATION in element.attrib:
+                    dashplayback.playback_duration = get_playback_time(element.attrib[MEDIA_PRESENTATION_DURATION])
+                    config_dash.JSON_HANDLE["video_metadata"]['playback_duration'] = dashplayback.playback_duration
+                if MIN_BUFFER_TIME in element.attrib:
+                    dashplayback.min_buffer_time = get_playback_time(element.attrib[MIN_BUFFER_TIME])
+            elif tag_name == "AdaptationSet" and path[-2:-1] == ["Period"]:
+                # Create new Adaptation Set
+                adaptationSet = AdaptationSet()
+                adaptationSet.id = element.attrib.get('id')
+                adaptation_set_mime_type = element.attrib.get('mimeType')
+                adaptation_set_template = None
+                media_object = OrderedDict()
+                codec = mimeType = None
+            elif tag_name == "Representation" and adaptationSet is not None:
+                media = None
+                representation_mime_type = element.attrib.get('mimeType', adaptation_set_mime_type)
+                if not representation_mime_type or 'bandwidth' not in element.attrib:
+                    continue
+                if 'video' in representation_mime_type:
+                    mimeType = "video"
+                    config_dash.LOG.info("Found Video")
+                elif 'audio' in representation_mime_type:
+                    mimeType = "audio"
+                    config_dash.LOG.info("Found Audio. Not handling AUDIO at the moment")
+                try:
+                    bandwidth = int(element.attrib['bandwidth'])
+                except ValueError as e:
+                    config_dash.LOG.error(e)
+                    bandwidth = None
+                if mimeType == "video":
+                    config_dash.JSON_HANDLE["video_metadata"]['available_bitrates'].append(bandwidth)
+                media = media_object[bandwidth] = MediaObject()
+                # Codec of this Representation (the previous parser stored the codec of the preceding one)
+                if 'codecs' in element.attrib:
+                    codec = element.attrib['codecs']
+                    media.codec = codec
+                media.id = element.attrib.get('id')
+                if 'width' in element.attrib and 'height' in element.attrib:
+                    media.resolution = "{}x{}".format(element.attrib['width'], element.attrib['height'])
+                # Sizes of segments in SegmentSize nodes (in bits)
+                media.segment_sizes = array('d')
+                # VMAF values in SegmentSize nodes
+                media.vmafs = array('d')
+                if adaptation_set_template:
+                    video_segment_duration = set_segment_template(media, adaptation_set_template)
+            elif tag_name == "SegmentTemplate" and media is not None:
+                video_segment_duration = set_segment_template(media, element.attrib)
+            elif tag_name == "SegmentTemplate" and path[-2:-1] == ["AdaptationSet"] and adaptationSet is not None:
+                # Default SegmentTemplate of the Representations of the AdaptationSet
+                adaptation_set_template = dict(element.attrib)
+            continue
+        path.pop()
+        elements.pop()
+        if tag_name == "SegmentSize":
+            if media is not None and path[-1:] == ["SegmentTemplate"]:
+                try:
+                    media.segment_sizes.append(float(element.attrib['size']) * SIZE_DICT[element.attrib['scale']])
+                except (KeyError, ValueError) as e:
+                    config_dash.LOG.error("Error in reading Segment sizes :{}".format(e))
+                else:
+                    try:
+                        media.vmafs.append(float(element.attrib['vmaf']))
+                    except (KeyError, ValueError) as e:
+                        config_dash.LOG.error("Error in reading VMAF value :{}".format(e))
+            # Release the node: it is the last child of its parent
+            if elements:
+                del elements[-1][-1]
+        elif tag_name == "Representation":
+            if media is not None and media.base_url and dashplayback.playback_duration:
+                get_url_list(media, media.segment_duration, dashplayback.playback_duration, bandwidth, media.id)
+            media = None
+            element.clear()
+        elif tag_name == "AdaptationSet" and adaptationSet is not None and path[-1:] == ["Period"]:
+            if mimeType == "video":
+                adaptationSet.video = media_object
+            elif mimeType == "audio":
+                adaptationSet.audio = media_object
+            adaptationSet.mimeType = mimeType
+            adaptationSet.codec = codec
+            dashplayback.adaptationSets.append(adaptationSet)
+            adaptationSet = None
+            element.clear()
+    return video_segment_duration
@@ -0,0 +1,425 @@
+#!/usr/local/bin/python
+"""
+Trace driven simulation of the DASH playback on a virtual clock.
+
+The segment sizes are taken from the SegmentSize nodes of the MPD and the
+download times are computed from a bandwidth/latency trace, so a session
+runs as fast as the ABR logic can decide. The adaptation modules are the
+same used by dash_client.py and the JSON logs have the same format
+(segment_info, interruptions, QoE input).
+
+Trace file: one line per period, '#' starts a comment
+    <duration in seconds> <bandwidth in Mbps> [<latency in ms>]
+The trace is repeated when the session is longer than the trace.
+
+From commandline:
+    python3 simulation.py -m BigBuckBunny.mpd -p all -t trace1.txt trace2.txt -j 8
+    python3 simulation.py -m BigBuckBunny.mpd -p netflix,bola -g 3 0.6 -j 8
+"""
+from __future__ import division
+import os
+import sys
+import copy
+import random
+import timeit
+import logging
+from argparse import ArgumentParser
+from multiprocessing import Pool
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+import config_dash
+import read_mpd
+import dash_buffer
+from read_mpd import DashPlayback
+from abr_controller import AbrController, PLAYBACK_TYPES, get_segment_count
+from dash_client import configure_buffer_size
+from configure_log_file import write_json, write_input_qoe
+
+# Same as server/bandwidth_changer.py: MU and sigma in Mbps, new value every SLEEP_TIME seconds
+GAUSS_MU = 3
+GAUSS_SIGMA = 0.6
+GAUSS_INTERVAL = 5
+# Size (in bytes) of the initialization segments, not listed in the MPD
+INIT_SEGMENT_SIZE = 1000
+DEFAULT_BUFFER_SIZE = 20
+SIMULATION_FOLDER = "SIMULATION_LOGS"
+
+
+class VirtualClock:
+    """ Clock of the simulation. sleep() moves the time forward without waiting """
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+class NetworkTrace:
+    """ Piecewise constant bandwidth and latency, repeated cyclically """
+    def __init__(self, periods, name="trace"):
+        """
+        :param periods: list of (duration in seconds, bandwidth in bits per second, latency in seconds)
+        """
+        self.periods = [(float(d), float(b), float(l)) for d, b, l in periods if d > 0]
+        if not self.periods or not any(b > 0 for _, b, _ in self.periods):
+            raise ValueError("The trace {} has no bandwidth".format(name))
+        self.name = name
+        self.duration = sum(d for d, _, _ in self.periods)
+
+    def period_at(self, time_s):
+        """ Return the index of the period at time_s and the time left in that period """
+        offset = time_s % self.duration
+        for index, (duration, _, _) in enumerate(self.periods):
+            if offset < duration:
+                return index, duration - offset
+            offset -= duration
+        return 0, self.periods[0][0]
+
+    def download_time(self, start_time, size):
+        """ Time to download size bytes starting at start_time
+        :return: latency, transfer_time (in seconds)
+        """
+        index, remaining_period = self.period_at(start_time)
+        latency = self.periods[index][2]
+        now = start_time + latency
+        index, remaining_period = self.period_at(now)
+        remaining_bits = size * 8
+        transfer_time = 0
+        while True:
+            bandwidth = self.periods[index][1]
+            if bandwidth * remaining_period >= remaining_bits:
+                transfer_time += remaining_bits / bandwidth
+                return latency, transfer_time
+            remaining_bits -= bandwidth * remaining_period
+            transfer_time += remaining_period
+            index = (index + 1) % len(self.periods)
+            remaining_period = self.periods[index][0]
+
+
+def load_trace(trace_file):
+    """ Module to read a trace file (see module docstring for the format) """
+    periods = []
+    with open(trace_file) as trace_handle:
+        for line in trace_handle:
+            line = line.split('#')[0].split()
+            if not line:
+                continue
+            latency = float(line[2]) / 1000 if len(line) > 2 else 0
+            periods.append((float(line[0]), float(line[1]) * 1000000, latency))
+    return NetworkTrace(periods, name=os.path.splitext(os.path.basename(trace_file))[0])
+
+
+def gaussian_trace(mu=GAUSS_MU, sigma=GAUSS_SIGMA, interval=GAUSS_INTERVAL, duration=3600, seed=None):
+    """ Module to create a trace with the Gaussian process of server/bandwidth_changer.py
+    :param mu: Mean bandwidth in Mbps
+    :param sigma: Standard deviation in Mbps
+    :param interval: Seconds between two changes of the bandwidth
+    """
+    generator = random.Random(seed)
+    periods = []
+    for _ in range(int(duration / interval) or 1):
+        # tc does not accept negative rates: keep a minimum bandwidth
+        bandwidth = max(generator.gauss(mu, sigma), 0.01)
+        periods.append((interval, bandwidth * 1000000, 0))
+    return NetworkTrace(periods, name="gauss_{}_{}_{}".format(mu, sigma, seed))
+
+
+class SimulatedPlayer:
+    """ Playout buffer of dash_buffer.DashPlayer advanced on a virtual clock.
+        The adaptation modules only read the attributes, so they work unchanged.
+    """
+    def __init__(self, video_length, segment_duration, clock, json_handle):
+        self.clock = clock
+        self.json_handle = json_handle
+        self.playback_duration = video_length
+        self.segment_duration = segment_duration
+        self.playback_state = "INITIALIZED"
+        if config_dash.MAX_BUFFER_SIZE:
+            self.max_buffer_size = config_dash.MAX_BUFFER_SIZE
+        else:
+            self.max_buffer_size = video_length
+        self.initial_buffer = config_dash.INITIAL_BUFFERING_COUNT
+        self.alpha = config_dash.ALPHA_BUFFER_COUNT
+        self.beta = config_dash.BETA_BUFFER_COUNT
+        self.segment_limit = None
+        self.buffer = Queue.Queue()
+        # Media time already played and clock time at which the current segment finishes
+        self.playback_time = 0
+        self.segment_end_time = None
+        self.segment_end_playback = None
+        self.segment_limit_reached = False
+        self.start_time = None
+        self.interruption_start = None
+
+    def start(self):
+        self.start_time = self.clock.time()
+        self.playback_state = "INITIAL_BUFFERING"
+
+    def set_state(self, state):
+        config_dash.LOG.debug("Changing state from {} to {} at {} Playback time".format(
+            self.playback_state, state, self.playback_time))
+        self.playback_state = state
+
+    def play_next(self, now):
+        """ Start playing the next segment of the buffer at time now """
+        segment = self.buffer.get()
+        self.segment_end_time = now + segment['playback_length']
+        self.segment_end_playback = min(self.playback_time + segment['playback_length'], self.playback_duration)
+        self.segment_limit_reached = (self.segment_limit and
+                                      int(segment['segment_number']) >= self.segment_limit)
+
+    def advance(self, now=None):
+        """ Play the buffer until the time now """
+        if now is None:
+            now = self.clock.time()
+        while self.playback_state == "PLAY" and self.segment_end_time <= now:
+            finish_time = self.segment_end_time
+            self.playback_time = self.segment_end_playback
+            if self.playback_time >= self.playback_duration:
+                self.stop("END", finish_time)
+            elif self.segment_limit_reached:
+                self.stop("STOP", finish_time)
+            elif self.buffer.qsize() == 0:
+                self.set_state("BUFFERING")
+                self.interruption_start = finish_time
+                self.json_handle['playback_info']['interruptions']['count'] += 1
+            else:
+                self.play_next(finish_time)
+
+    def write(self, segment):
+        """ Add a downloaded segment to the buffer at the current time """
+        now = self.clock.time()
+        self.advance(now)
+        self.buffer.put(segment)
+        if self.playback_state == "INITIAL_BUFFERING":
+            if self.buffer.qsize() >= config_dash.INITIAL_BUFFERING_COUNT:
+                self.json_handle['playback_info']['initial_buffering_duration'] = now - self.start_time
+                self.set_state("PLAY")
+                self.play_next(now)
+        elif self.playback_state == "BUFFERING":
+            remaining_playback_time = self.playback_duration - self.playback_time
+            if (self.buffer.qsize() >= config_dash.RE_BUFFERING_COUNT or
+                    config_dash.RE_BUFFERING_COUNT * self.segment_duration >= remaining_playback_time):
+                interruption = now - self.interruption_start
+                playback_info = self.json_handle['playback_info']
+                playback_info['interruptions']['events'].append((self.playback_time, self.playback_time + interruption))
+                playback_info['interruptions']['total_duration'] += interruption
+                self.set_state("PLAY")
+                self.play_next(now)
+
+    def stop(self, state, now):
+        self.set_state(state)
+        self.json_handle['playback_info']['end_time'] = now
+
+    def finish(self):
+        """ Play the remaining buffer. Returns the time at the end of the playback """
+        if self.playback_state == "PLAY":
+            self.advance(float('inf'))
+        if self.playback_state not in dash_buffer.EXIT_STATES:
+            self.stop("STOP", self.clock.time())
+        return self.json_handle['playback_info']['end_time']
+
+
+def new_json_handle(playback_type):
+    """ Empty log with the format of config_dash.JSON_HANDLE """
+    json_handle = {'playback_type': playback_type.lower(),
+                   'playback_info': {'start_time': 0,
+                                     'end_time': None,
+                                     'initial_buffering_duration': None,
+                                     'interruptions': {'count': 0, 'events': list(), 'total_duration': 0},
+                                     'up_shifts': 0,
+                                     'down_shifts': 0},
+                   'segment_info': list()}
+    return json_handle
+
+
+def simulate(mpd_file, playback_type, trace, multi_codec=False, buffer_size=DEFAULT_BUFFER_SIZE, segment_limit=None,
+             decision_times=None):
+    """ Module to simulate one playback session
+    :param mpd_file: Local MPD file with SegmentSize nodes
+    :param playback_type: 'BASIC', 'BOLA', 'SMART', 'NETFLIX' or 'MEDUSA'
+    :param trace: NetworkTrace object
+    :param decision_times: list where the (wall) time of every ABR decision is appended, in seconds
+    :return: dict with the format of config_dash.JSON_HANDLE
+    """
+    dp_object, video_segment_duration = read_mpd.read_mpd(mpd_file, DashPlayback())
+    configure_buffer_size(float(buffer_size), video_segment_duration)
+    json_handle = new_json_handle(playback_type + ("-mcom" if multi_codec else ""))
+    json_handle['video_metadata'] = copy.deepcopy(config_dash.JSON_HANDLE["video_metadata"])
+    json_handle['video_metadata']['segment_duration'] = video_segment_duration
+    json_handle['trace'] = trace.name
+
+    clock = VirtualClock()
+    dash_player = SimulatedPlayer(dp_object.playback_duration, video_segment_duration, clock, json_handle)
+    if segment_limit:
+        dash_player.segment_limit = int(segment_limit)
+    for aset in dp_object.adaptationSets:
+        for bitrate in aset.video:
+            read_mpd.get_url_list(aset.video[bitrate], video_segment_duration, dp_object.playback_duration,
+                                  bitrate, aset.video[bitrate].id)
+    # The initialization segment followed by the media segments, as in start_playback_smart
+    segment_count = get_segment_count(dp_object)
+    # BOLA waits on the virtual clock
+    abr = AbrController(dp_object, playback_type, multi_codec, segment_count=segment_count, clock=clock)
+    dash_player.start()
+    previous_bitrate = None
+    segment_duration = 0
+    for segment_number in range(abr.start - 1, abr.start - 1 + segment_count):
+        if segment_limit and segment_number > int(segment_limit):
+            break
+        dash_player.advance()
+        decision_start = timeit.default_timer()
+        adaptation_set_id, bitrate, vmaf, delay = abr.next_segment(segment_number, dash_player)
+        if decision_times is not None:
+            decision_times.append(timeit.default_timer() - decision_start)
+        if abr.completed:
+            break
+        if abr.uses_mcom() and not abr.mcom_current_bitrate:
+            # Same as start_playback_smart: MCOM failed, use the single-codec decision
+            adaptation_set_id, bitrate = abr.adaptation_set_id, abr.current_bitrate
+        media = dp_object.getAdaptationSetFromId(adaptation_set_id).video[bitrate]
+        if dash_player.buffer.qsize() > config_dash.MAX_BUFFER_SIZE and delay == 0:
+            delay = 1
+        if delay:
+            clock.sleep(delay * segment_duration)
+            dash_player.advance()
+        segment_index = segment_number - abr.start
+        segment_name = os.path.basename(read_mpd.get_segment_url(media, segment_number + 1))
+        if segment_index < 0:
+            segment_size = INIT_SEGMENT_SIZE
+        else:
+            try:
+                # The SegmentSize values are in bits
+                segment_size = media.segment_sizes[segment_index] / 8
+            except (IndexError, TypeError):
+                segment_size = bitrate * video_segment_duration / 8
+        latency, transfer_time = trace.download_time(clock.time(), segment_size)
+        clock.sleep(latency + transfer_time)
+        # As the transfer_time of ConnectionPool.fetch, the request latency is not part of the throughput
+        abr.update(segment_size, transfer_time)
+        aset = dp_object.getAdaptationSetFromId(adaptation_set_id)
+        if abr.uses_mcom():
+            if abr.mcom_current_bitrate and abr.mcom_adaptation_set_id:
+                json_handle['segment_info'].append((segment_name, bitrate, aset.codec, vmaf, segment_size,
+                                                    transfer_time, media.resolution))
+        else:
+            json_handle['segment_info'].append((segment_name, bitrate, aset.codec,
+                                                dp_object.getVmafForSegment(adaptation_set_id, bitrate, segment_number),
+                                                segment_size, transfer_time, media.resolution))
+        segment_duration = video_segment_duration
+        dash_player.write({'playback_length': video_segment_duration,
+                           'size': segment_size,
+                           'bitrate': abr.current_bitrate,
+                           'data': None,
+                           'URI': segment_name,
+                           'segment_number': segment_number})
+        if previous_bitrate:
+            if previous_bitrate < abr.current_bitrate:
+                json_handle['playback_info']['up_shifts'] += 1
+            elif previous_bitrate > abr.current_bitrate:
+                json_handle['playback_info']['down_shifts'] += 1
+        previous_bitrate = abr.current_bitrate
+    dash_player.finish()
+    return json_handle
+
+
+def run_simulation_task(task):
+    """ Worker of the process pool: simulate one (algorithm, trace) pair and write the logs """
+    mpd_file, playback_type, trace, multi_codec, buffer_size, segment_limit, output_folder = task
+    if config_dash.LOG is None:
+        configure_simulation_log()
+    if not isinstance(trace, NetworkTrace):
+        trace = load_trace(trace)
+    json_handle = simulate(mpd_file, playback_type, trace, multi_codec, buffer_size, segment_limit)
+    run_name = "{}_{}".format(json_handle['playback_type'].upper(), trace.name)
+    json_file = os.path.join(output_folder, "ASTREAM_{}.json".format(run_name))
+    write_json(json_data=json_handle, json_file=json_file)
+    write_input_qoe(json_handle['video_metadata']['segment_duration'], json_data=json_handle, json_file=os.path.join(output_folder, "QOE_INPUT_{}.json".format(run_name)))
+    interruptions = json_handle['playback_info']['interruptions']
+    return run_name, len(json_handle['segment_info']), interruptions['count'], interruptions['total_duration']
+
+
+def configure_simulation_log(log_level=logging.WARNING):
+    """ The simulation only logs to the screen. INFO logs of every decision slow down the runs """
+    config_dash.LOG = logging.getLogger(config_dash.LOG_NAME)
+    config_dash.LOG.setLevel(log_level)
+    if not config_dash.LOG.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s'))
+        config_dash.LOG.addHandler(handler)
+
+
+def run_simulations(mpd_file, playback_types, traces, multi_codec=False, buffer_size=DEFAULT_BUFFER_SIZE,
+                    segment_limit=None, output_folder=SIMULATION_FOLDER, processes=None):
+    """ Module to simulate every (algorithm, trace) pair on a pool of processes
+    :param traces: list of trace files or NetworkTrace objects
+    :return: list of (run name, number of segments, number of interruptions, total interruption time)
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    tasks = [(mpd_file, playback_type, trace, multi_codec, buffer_size, segment_limit, output_folder)
+             for trace in traces for playback_type in playback_types]
+    if processes == 1:
+        return [run_simulation_task(task) for task in tasks]
+    pool = Pool(processes)
+    try:
+        return list(pool.imap_unordered(run_simulation_task, tasks))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def create_arguments(parser):
+    """ Adding arguments to the parser """
+    parser.add_argument('-m', '--MPD', required=True, help="Local MPD file with the SegmentSize nodes")
+    parser.add_argument('-p', '--PLAYBACK', default='all',
+                        help="Comma separated playback types (basic, bola, sara, netflix, medusa) or all")
+    parser.add_argument('-t', '--TRACES', nargs='*', default=[], help="Bandwidth trace files")
+    parser.add_argument('-g', '--GAUSSIAN', nargs=2, type=float, metavar=('MU', 'SIGMA'),
+                        help="Add a Gaussian trace (in Mbps) as in bandwidth_changer.py")
+    parser.add_argument('-r', '--RUNS', type=int, default=1, help="Number of Gaussian traces (different seeds)")
+    parser.add_argument('-b', '--BUFFER_SIZE', type=float, default=DEFAULT_BUFFER_SIZE, help="Buffer size in seconds")
+    parser.add_argument('-n', '--SEGMENT_LIMIT', help="The Segment number limit")
+    parser.add_argument('-z', '--MULTI_CODEC', default=False, action='store_true', help="Activate MCOM Plugin")
+    parser.add_argument('-j', '--PROCESSES', type=int, default=None, help="Number of processes. Default = CPU count")
+    parser.add_argument('-o', '--OUTPUT', default=SIMULATION_FOLDER, help="Folder of the JSON logs")
+
+
+def get_playback_types(playback):
+    """ Translate the command line names to the playback types of dash_client """
+    names = {'basic': 'BASIC', 'bola': 'BOLA', 'sara': 'SMART', 'smart': 'SMART', 'netflix': 'NETFLIX',
+             'medusa': 'MEDUSA'}
+    if playback.lower() == 'all':
+        return list(PLAYBACK_TYPES)
+    return [names[name.strip().lower()] for name in playback.split(',')]
+
+
+def main():
+    """ Main Program wrapper """
+    parser = ArgumentParser(description='Trace driven simulation of the ABR logics')
+    create_arguments(parser)
+    args = parser.parse_args()
+    configure_simulation_log()
+    traces = list(args.TRACES)
+    if args.GAUSSIAN:
+        mu, sigma = args.GAUSSIAN
+        traces += [gaussian_trace(mu, sigma, seed=seed) for seed in range(args.RUNS)]
+    if not traces:
+        print("ERROR: Please provide a trace file or Gaussian parameters. Try Again..")
+        return 1
+    results = run_simulations(args.MPD, get_playback_types(args.PLAYBACK), traces, args.MULTI_CODEC,
+                              args.BUFFER_SIZE, args.SEGMENT_LIMIT, args.OUTPUT, args.PROCESSES)
+    for run_name, segments, interruptions, interruption_time in sorted(results):
+        print("{}: {} segments, {} interruptions ({:.3f} seconds)".format(run_name, segments, interruptions,
+                                                                        interruption_time))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
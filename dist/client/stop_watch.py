@@ -1,9 +1,13 @@
-import time
+try:
+    from time import monotonic as clock
+except ImportError:
+    from time import time as clock
 
 
 class StopWatch():
     """ Implements a stop watch function
         Modified from http://code.activestate.com/recipes/124894-stopwatch-in-tkinter/
+        Uses a monotonic clock so that the elapsed time is not affected by changes of the system time.
     """
     def __init__(self):
         self.start_time = 0.0
@@ -13,24 +17,24 @@ class StopWatch():
     def start(self):
         """ Start the stopwatch, ignore if running. """
         if not self.running:
-            self.start_time = time.time() - self.elapsed_time
+            self.start_time = clock() - self.elapsed_time
             self.running = 1
     
     def pause(self):
         """ Stop the stopwatch, ignore if already paused."""
         if self.running:
-            self.elapsed_time = time.time() - self.start_time
+            self.elapsed_time = clock() - self.start_time
             self.running = 0
     
     def reset(self):
         """ Reset the stopwatch. """
-        self.start_time = time.time()
+        self.start_time = clock()
         self.elapsed_time = 0.0
 
     def time(self):
         """
-        :return: elapsed time
+        :return: elapsed time in seconds (float)
         """
         if self.running:
-            self.elapsed_time = time.time() - self.start_time
-        return int(self.elapsed_time)
\ No newline at end of file
+            self.elapsed_time = clock() - self.start_time
+        return self.elapsed_time
@@ -1,6 +1,9 @@
 """
 Apache2 Configuration:
 http://www.cyberciti.biz/faq/ubuntu-mod_python-apache-tutorial/
+
+Without Apache, dash_server.py replays the same speed log with a token bucket:
+    python3 dash_server.py --SPEED_LOG speed_log.txt
 """
 
 from mod_python import apache
@@ -2,41 +2,55 @@
 """A simple HTTP server
 
 To start the server:
-    python delayserver.py
+    python3 dash_server.py -s 0.0.0.0 -p 8006
 
 Ipython Run:
-    import BaseHTTPServer
-    from delayserver import MyHTTPRequestHandler
-    http = BaseHTTPServer.HTTPServer( ('localhost', 8000),
-        MyHTTPRequestHandler)
+    from dash_server import DashHTTPServer, MyHTTPRequestHandler
+    http = DashHTTPServer(('localhost', 8000), MyHTTPRequestHandler)
     http.serve_forever()
 
 To test with browser : 'http://198.248.242.16:8005/mpd/index.html')
 
-To retriev from Python2.7 Shell:
-    import urllib2
-     urllib2.urlopen(
-            "http://198.248.242.16:8006/mpd/x4ukwHdACDw.mpd").read()
+To retriev from Python3 Shell:
+    from urllib.request import urlopen
+    urlopen("http://198.248.242.16:8006/mpd/x4ukwHdACDw.mpd").read()
 To Test from client:
-  from urllib2 import urlopen
-  data = urlopen("http://198.248.242.16:8006/x4ukwHdACDw/video/1/seg-0001.m4f"))
+  from urllib.request import urlopen
+  data = urlopen("http://198.248.242.16:8006/x4ukwHdACDw/video/1/seg-0001.m4f")
 
+Every connection is served by its own thread and kept alive between the
+segments (HTTP/1.1). The segments are sent with sendfile (no copy through
+Python), with Content-Length and single Range requests (206) support.
+The MPD and initialization segments, requested by every new session,
+are kept in memory.
+
+The bandwidth can be shaped per connection, per playback session or for the whole
+server with a fixed rate, a bandwidth trace or the Gaussian process of
+bandwidth_changer.py (see throttle.py):
+    python3 dash_server.py -s 0.0.0.0 -t trace.txt -m session -l 40
 
 To DO:
-    -- Create a logging module
     -- Get the IP address of the machine automatically
-    -- Directory Listing as in SimpleHTTPServer.py
-    -- Guess Type of File
-    -- Translate path from HTML to local path
     -- Automate the MPD and DASH file LIST generation
 """
 import time
-import BaseHTTPServer
 import sys
 import os
+import threading
+import logging
 from argparse import ArgumentParser
-from collections import defaultdict
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # working for Python3
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+try:
+    from urllib.parse import unquote  # working for Python3
+except ImportError:
+    from urllib import unquote
 from list_directory import list_directory
+import throttle
 import itertools
 # sys.path.append('..')
 
@@ -44,32 +58,58 @@ import itertools
 DEFAULT_HOSTNAME = '198.248.242.16'
 #DEFAULT_HOSTNAME = '127.0.0.1'
 DEFAULT_PORT = 8006
-DEFAULT_SLOW_RATE = 0.001
+# Seconds before an idle keep-alive connection is closed
+DEFAULT_KEEP_ALIVE_TIMEOUT = 30
+# Seconds without request before a session is removed from ACTIVE_DICT
+DEFAULT_SESSION_TIMEOUT = 300
 
-BLOCK_SIZE = 1024
+# Size of the copies when sendfile is not available
+BLOCK_SIZE = 64 * 1024
+# Number of pending connections accepted by the listening socket
+REQUEST_QUEUE_SIZE = 1024
 
 # Values set by the option parser
 PORT = DEFAULT_PORT
 HOSTNAME = DEFAULT_HOSTNAME
 HTTP_VERSION = "HTTP/1.1"
-# 10 kbps when size is in bytes
-SLOW_RATE = DEFAULT_SLOW_RATE
+KEEP_ALIVE_TIMEOUT = DEFAULT_KEEP_ALIVE_TIMEOUT
+SESSION_TIMEOUT = DEFAULT_SESSION_TIMEOUT
+VERBOSE = False
+# throttle.Throttle shaping the media and MPD requests. None = no shaping
+THROTTLE = None
 
 HTML_PAGES = ['index.html', 'list.html', 'media/my_image.png']
-MPD_FILES = ['media/mpd/x4ukwHdACDw.mpd', "media/mpd/x4ukwHdACDw_filesize.mpd"]
+MPD_EXTENSION = 'mpd'
+MEDIA_EXTENSIONS = ['m4f', 'm4s', 'mp4']
+# Initialization segments are named init.mp4 in the MPD files
+INIT_SEGMENT_PREFIX = 'init'
+# Header with the id of the playback session, sent by dash_client.py and load_generator.py
+SESSION_HEADER = 'X-Session-Id'
 HTML_404 = "404.html"
+CONTENT_TYPES = {'mpd': 'application/dash+xml',
+                 'm4f': 'video/iso.segment',
+                 'm4s': 'video/iso.segment',
+                 'mp4': 'video/mp4',
+                 'html': 'text/html',
+                 'png': 'image/png'}
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+LOG = logging.getLogger('dash_server')
 
 # dict that holds the current active sessions
 # Has the Keys :
 #       'session_list' = List of active session ID's = {connection_id, port}
 #       'delay' : iterator to check if we need to delay or not
+#       'last_seen' : time of the last request, used to expire the session
 
-ACTIVE_DICT = defaultdict(dict)
+ACTIVE_DICT = dict()
+ACTIVE_DICT_LOCK = threading.Lock()
+# Time of the last scan for expired sessions
+LAST_EXPIRY = [time.time()]
 
 # DELAY Parameters
 # Number of the segement to insert delay
 #COUNT = 3
-SLOW_COUNT = 1000
 DELAY_VALUES = dict()
 
 
@@ -81,152 +121,320 @@ def delay_decision():
         yield 1
 
 
-class MyHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+class FileCache:
+    """ In-memory copy of the small files requested by every session (MPD and initialization segments).
+        A file is read again when its modification time or size changes.
+    """
+    def __init__(self):
+        self.files = dict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """ Return the content of the file. Raises IOError/OSError when it does not exist """
+        file_stat = os.stat(path)
+        with self.lock:
+            entry = self.files.get(path)
+        if entry and entry[1] == (file_stat.st_mtime, file_stat.st_size):
+            return entry[0]
+        with open(path, 'rb') as request_file:
+            data = request_file.read()
+        with self.lock:
+            self.files[path] = (data, (file_stat.st_mtime, file_stat.st_size))
+        return data
+
+
+FILE_CACHE = FileCache()
+
+
+def get_session_path(path, headers):
+    """ Module to get the session of a request on its client: the SESSION_HEADER of the request or,
+        for the clients that do not send it, the folder of the requested file
+    """
+    return headers.get(SESSION_HEADER) or os.path.dirname(path)
+
+
+def register_segment(connection_id, segment_name):
+    """ Module to add a segment request to the session in ACTIVE_DICT """
+    now = time.time()
+    with ACTIVE_DICT_LOCK:
+        if connection_id not in ACTIVE_DICT:
+            ACTIVE_DICT[connection_id] = {
+                'file_list': [segment_name],
+                'iter': itertools.cycle(delay_decision())}
+        else:
+            ACTIVE_DICT[connection_id]['file_list'].append(segment_name)
+        ACTIVE_DICT[connection_id]['last_seen'] = now
+        # Scanning all the sessions on every request would be quadratic
+        if now - LAST_EXPIRY[0] > SESSION_TIMEOUT / 10.0:
+            LAST_EXPIRY[0] = now
+            expire_sessions(now)
+
+
+def expire_sessions(now):
+    """ Module to remove the sessions idle for more than SESSION_TIMEOUT.
+        Must be called with ACTIVE_DICT_LOCK held.
+    """
+    expired = [connection_id for connection_id, session in ACTIVE_DICT.items()
+               if now - session['last_seen'] > SESSION_TIMEOUT]
+    for connection_id in expired:
+        del ACTIVE_DICT[connection_id]
+    if THROTTLE:
+        THROTTLE.expire(SESSION_TIMEOUT)
+    if expired:
+        LOG.info("Expired {} sessions, {} active".format(len(expired), len(ACTIVE_DICT)))
+
+
+def parse_range(range_header, file_size):
+    """ Module to parse the Range header of a request.
+        Only single byte ranges are supported, other ranges are ignored (the whole file is sent).
+        :return: (first byte, last byte) or None for the whole file
+        :raise ValueError: when the range cannot be satisfied
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, _, last = range_header[len('bytes='):].strip().partition('-')
+    try:
+        first = int(first) if first else None
+        last = int(last) if last else None
+    except ValueError:
+        return None
+    if first is None:
+        # Suffix range: the last bytes of the file
+        if not last or not file_size:
+            raise ValueError("Unsatisfiable range {}".format(range_header))
+        return max(file_size - last, 0), file_size - 1
+    if first >= file_size or (last is not None and last < first):
+        raise ValueError("Unsatisfiable range {}".format(range_header))
+    if last is None or last >= file_size:
+        last = file_size - 1
+    return first, last
+
+
+def get_content_type(request):
+    """ Module to guess the Content-Type from the file extension """
+    return CONTENT_TYPES.get(request.split('.')[-1], DEFAULT_CONTENT_TYPE)
+
+
+def is_safe_path(request):
+    """ Module to refuse the paths outside of the served directory """
+    return not os.path.isabs(request) and '..' not in request.replace('\\', '/').split('/')
+
+
+class DashHTTPServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server with one thread per connection """
+    daemon_threads = True
+    # Do not keep a reference to every connection thread
+    block_on_close = False
+    allow_reuse_address = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+class MyHTTPRequestHandler(BaseHTTPRequestHandler):
     """HTTPHandler to serve the DASH video"""
+    protocol_version = HTTP_VERSION
+    timeout = DEFAULT_KEEP_ALIVE_TIMEOUT
+    # TCP_NODELAY: the headers and the sendfile body are separate sends. With Nagle's algorithm, the end of the
+    # body waits for the (delayed) ACK of the headers on keep-alive connections
+    disable_nagle_algorithm = True
 
     def do_GET(self):
         """Function to handle the get message"""
-        #request = self.path.strip("/").split('?')[0]
-        request = self.path.split('?')[0]
+        self.handle_request(send_body=True)
+
+    def do_HEAD(self):
+        """Function to handle the head message"""
+        self.handle_request(send_body=False)
+
+    def handle_request(self, send_body):
+        """ Function to dispatch the request to the right writer """
+        request = unquote(self.path.split('?')[0])
         if request.startswith('/'):
             request = request[1:]
-        # connection_id = client IP, dirname of file
-        connection_id = (self.client_address[0],
-                         os.path.dirname(self.path))
-        shutdown = False
-        #check if the request is for the a directory
-        if request.endswith('/'):
-            dir_listing = list_directory(request)
-            duration = dir_write(self.wfile, dir_listing)
-        elif request in HTML_PAGES:
-            print "Request HTML %s" % request
-            duration = normal_write(self.wfile, request)
-        elif request in MPD_FILES:
-            print "Request for MPD %s" % request
-            duration = normal_write(self.wfile, request)  #, **kwargs)
-            # assuming that the new session always
-            # starts with the download of the MPD file
-            # Making sure that older sessions are not
-            # in the ACTIVE_DICT
-            if connection_id in ACTIVE_DICT:
-                del (ACTIVE_DICT[connection_id])
-        elif request.split('.')[-1] in ['m4f', 'mp4']:
-            print "Request for DASH Media %s" % request
-            if connection_id not in ACTIVE_DICT:
-                ACTIVE_DICT[connection_id] = {
-                    'file_list': [os.path.basename(request)],
-                    'iter': itertools.cycle(delay_decision())}
+        if not is_safe_path(request):
+            self.send_404(send_body)
+            return
+        # connection_id = client IP, session path (session header or dirname of file)
+        session_path = get_session_path(self.path, self.headers)
+        connection_id = (self.client_address[0], session_path)
+        extension = request.split('.')[-1]
+        start_time = time.time()
+        bucket = None
+        if THROTTLE and (extension == MPD_EXTENSION or extension in MEDIA_EXTENSIONS):
+            bucket = THROTTLE.get_bucket(self.client_address, session_path)
+            time.sleep(THROTTLE.request_latency(bucket))
+        try:
+            #check if the request is for the a directory
+            if request.endswith('/') or not request:
+                self.send_data(list_directory(request or '.').read(), 'text/html', send_body)
+            elif request in HTML_PAGES:
+                LOG.info("Request HTML %s" % request)
+                self.send_file(request, send_body)
+            elif extension == MPD_EXTENSION:
+                LOG.info("Request for MPD %s" % request)
+                self.send_cached_file(request, send_body, bucket)
+                # assuming that the new session always
+                # starts with the download of the MPD file
+                # Making sure that older sessions are not
+                # in the ACTIVE_DICT
+                with ACTIVE_DICT_LOCK:
+                    ACTIVE_DICT.pop(connection_id, None)
+            elif extension in MEDIA_EXTENSIONS:
+                LOG.debug("Request for DASH Media %s" % request)
+                register_segment(connection_id, os.path.basename(request))
+                if os.path.basename(request).startswith(INIT_SEGMENT_PREFIX):
+                    file_size = self.send_cached_file(request, send_body, bucket)
+                else:
+                    file_size = self.send_file(request, send_body, bucket)
+                LOG.debug('Normal: Request took {} seconds for size of {}'.format(time.time() - start_time,
+                                                                                  file_size))
             else:
-                ACTIVE_DICT[connection_id]['file_list'].append(
-                    os.path.basename(request))
-
-            duration, file_size = normal_write(self.wfile, request)
-            print 'Normal: Request took {} seconds for size of {}'.format(duration, file_size)
-
-            # if ACTIVE_DICT[connection_id]['iter'].next() == 0:
-            #     duration = slow_write(output=self.wfile, request=request, rate=SLOW_RATE)
-            #     print 'Slow: Request took %f seconds' % duration
-            # else:
-            #     duration = normal_write(self.wfile, request)
-            #     print 'Normal: Request took %f seconds' % duration
+                self.send_404(send_body)
+        except (IOError, OSError) as e:
+            # The client closed the connection or did not read the data in time
+            LOG.info("Error while sending {} to {}: {}".format(request, self.client_address, e))
+            self.close_connection = True
+
+    def send_headers(self, request, file_size):
+        """ Function to send the status line and the headers of a file.
+            :return: (first byte, last byte) to send or None when there is no body
+        """
+        try:
+            byte_range = parse_range(self.headers.get('Range'), file_size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */{}'.format(file_size))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        if byte_range:
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(byte_range[0], byte_range[1], file_size))
         else:
+            self.send_response(200)
+            byte_range = (0, file_size - 1)
+        self.send_header('Content-Type', get_content_type(request))
+        self.send_header('Content-Length', str(byte_range[1] - byte_range[0] + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if byte_range[1] < byte_range[0]:
+            return None
+        return byte_range
+
+    def send_file(self, request, send_body=True, bucket=None):
+        """ Function to send a file from the disk with sendfile.
+            :param bucket: throttle.TokenBucket shaping the transfer
+            :return: the size of the file
+        """
+        try:
+            request_file = open(request, 'rb')
+        except (IOError, OSError):
+            self.send_404(send_body)
+            return 0
+        with request_file:
+            file_size = os.fstat(request_file.fileno()).st_size
+            byte_range = self.send_headers(request, file_size)
+            if byte_range and send_body:
+                count = byte_range[1] - byte_range[0] + 1
+                if bucket is None:
+                    send_file_range(self.connection, self.wfile, request_file, byte_range[0], count)
+                else:
+                    THROTTLE.pacer.send(bucket, self.connection, count, lambda offset, length: send_file_chunk(
+                        self.connection, request_file, byte_range[0] + offset, length), self.timeout)
+        return file_size
+
+    def send_cached_file(self, request, send_body=True, bucket=None):
+        """ Function to send a file from FILE_CACHE.
+            :param bucket: throttle.TokenBucket shaping the transfer
+            :return: the size of the file
+        """
+        try:
+            data = FILE_CACHE.get(request)
+        except (IOError, OSError):
+            self.send_404(send_body)
+            return 0
+        byte_range = self.send_headers(request, len(data))
+        if byte_range and send_body:
+            data = memoryview(data)[byte_range[0]:byte_range[1] + 1]
+            if bucket is None:
+                self.wfile.write(data)
+            else:
+                THROTTLE.pacer.send(bucket, self.connection, len(data), lambda offset, length: self.connection.send(
+                    data[offset:offset + length]), self.timeout)
+        return len(data)
+
+    def send_data(self, data, content_type, send_body=True, status=200):
+        """ Function to send a generated page """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data)
+
+    def send_404(self, send_body=True):
+        """ Function to send the 404 page """
+        try:
+            self.send_data(FILE_CACHE.get(HTML_404), 'text/html', send_body, status=404)
+        except (IOError, OSError):
             self.send_error(404)
-            return
-        #self.send_response( 200 )
-        #self.send_header('ContentType', 'text/plain;charset=utf-8')
-        #self.send_header('Content-Length', str(os.path.getsize(request)))
-        #self.send_header('Pragma', 'no-cache' )
-        #self.end_headers()
-        if shutdown:
-            self.server.shutdown()
-
-
-def normal_write(output, request):
-    """Function to write the video onto output stream"""
-    data = None
-    try:
-        with open(request, 'rb') as request_file:
-            start_time = time.time()
-            data_len = 0
-            while True:
-                data = request_file.read(BLOCK_SIZE)
-                output.write(data)
-                data_len += len(data)
-                if len(data) < BLOCK_SIZE:
-                    break
-            now = time.time()
-            output.flush()
-    except IOError:
-        with open(HTML_404, 'r') as request_file:
-            start_time = time.time()
-            output.write(request_file.read())
-            now = time.time()
-            output.flush()
-    return now - start_time, data_len
-
-
-def dir_write(output, data):
-    """Function to write the video onto output stream"""
-    start_time = time.time()
-    output.write(data.read())
-    now = time.time()
-    output.flush()
-    return now - start_time
+
+    def finish(self):
+        """ Function called when the connection is closed """
+        BaseHTTPRequestHandler.finish(self)
+        if THROTTLE:
+            THROTTLE.release(self.client_address)
+
+    def log_message(self, format, *args):
+        """ Logging every request on stderr does not scale: use the debug log """
+        LOG.debug("%s - %s" % (self.address_string(), format % args))
 
 
-def slow_write(output, request, rate=None):
-    """Function to write the video onto output stream with interruptions in
-    the stream
+def send_file_range(connection, output, request_file, offset, count):
+    """ Function to send count bytes of the file from offset. sendfile copies the
+        data from the page cache to the socket without going through Python.
     """
-    print "Slow write of %s" % request
-    with open(request, 'r') as request_file:
-        start_time = time.time()
-        data = request_file.read(BLOCK_SIZE)
-        output.write(data)
-        last_send = time.time()
-        current_stream = len(data)
-        while data != '':
-            print "In loop"
-            if rate:
-                if curr_send_rate(BLOCK_SIZE, last_send - time.time()) > rate:
-                    continue
-                else:
-                    break
+    try:
+        return connection.sendfile(request_file, offset, count)
+    except AttributeError:
+        # Python 2: no socket.sendfile
+        request_file.seek(offset)
+        sent = 0
+        while sent < count:
+            data = request_file.read(min(BLOCK_SIZE, count - sent))
+            if not data:
+                break
             output.write(data)
-            last_send = time.time()
-            current_stream += len(data)
-            data = request_file.read(BLOCK_SIZE)
-        now = time.time()
+            sent += len(data)
         output.flush()
-    print 'Served %d bytes of file: %s in %f seconds' % (
-        current_stream, request, now - start_time)
-    return now - start_time
+        return sent
 
 
-def curr_send_rate(data_size, time_to_send_data):
-    """ Method to calculate the current rate at which the data 
-        is being sent. Data_size in byes
-        The return value is in kbps
+def send_file_chunk(connection, request_file, offset, count):
+    """ Function to send at most count bytes of the file from offset on a non-blocking socket
+        (throttle.Pacer). Returns the number of bytes sent.
     """
-    rate = None
-    while True:
-        try:
-            rate = data_size * 8 / time_to_send_data / 1000
-            break
-        except ZeroDivisionError:
-            continue
-    return rate
+    try:
+        return os.sendfile(connection.fileno(), request_file.fileno(), offset, count)
+    except AttributeError:
+        # Python 2: no os.sendfile
+        request_file.seek(offset)
+        return connection.send(request_file.read(min(BLOCK_SIZE, count)))
 
 
 def start_server():
     """ Module to start the server"""
-    http_server = BaseHTTPServer.HTTPServer((HOSTNAME, PORT),
-                                            MyHTTPRequestHandler)
-    print " ".join(("Listening on ", HOSTNAME, " at Port ",
-                    str(PORT), " - press ctrl-c to stop"))
     # Use this Version of HTTP Protocol
-    http_server.protocol_version = HTTP_VERSION
-    http_server.serve_forever()
+    MyHTTPRequestHandler.protocol_version = HTTP_VERSION
+    # Idle keep-alive connections are closed after this time
+    MyHTTPRequestHandler.timeout = KEEP_ALIVE_TIMEOUT
+    http_server = DashHTTPServer((HOSTNAME, PORT),
+                                 MyHTTPRequestHandler)
+    LOG.warning(" ".join(("Listening on ", HOSTNAME, " at Port ",
+                          str(PORT), " - press ctrl-c to stop")))
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        http_server.server_close()
 
 
 def create_arguments(parser):
@@ -235,9 +443,48 @@ def create_arguments(parser):
                         help=("Port Number to run the server. Default = %d" % DEFAULT_PORT), default=DEFAULT_PORT)
     parser.add_argument('-s', '--HOSTNAME', help=("Hostname of the server. Default = %s"
                                                   % DEFAULT_HOSTNAME), default=DEFAULT_HOSTNAME)
-    parser.add_argument('-d', '--SLOW_RATE', type=float, help=(
-        "Delay value for the server in msec. Default = %f" % DEFAULT_SLOW_RATE),
-                        default=DEFAULT_SLOW_RATE)
+    parser.add_argument('-k', '--KEEP_ALIVE_TIMEOUT', type=float, help=(
+        "Seconds before an idle connection is closed. Default = %d" % DEFAULT_KEEP_ALIVE_TIMEOUT),
+                        default=DEFAULT_KEEP_ALIVE_TIMEOUT)
+    parser.add_argument('-e', '--SESSION_TIMEOUT', type=float, help=(
+        "Seconds before an idle session is forgotten. Default = %d" % DEFAULT_SESSION_TIMEOUT),
+                        default=DEFAULT_SESSION_TIMEOUT)
+    parser.add_argument('-r', '--RATE', type=float, help="Shape the bandwidth to RATE Mbps")
+    parser.add_argument('-t', '--TRACE', help=("Shape the bandwidth with a trace: one "
+                                               "'<duration in s> <bandwidth in Mbps> [<latency in ms>]' line per period"))
+    parser.add_argument('--SPEED_LOG', help="Shape the bandwidth with a speed log of ThrottleServer.py (bytes/s per second)")
+    parser.add_argument('-g', '--GAUSS', type=float, nargs=2, metavar=('MU', 'SIGMA'),
+                        help="Shape the bandwidth with the Gaussian process of bandwidth_changer.py (in Mbps)")
+    parser.add_argument('-i', '--INTERVAL', type=float, default=throttle.GAUSS_INTERVAL,
+                        help="Seconds between two changes of the Gaussian bandwidth. Default = %d" %
+                             throttle.GAUSS_INTERVAL)
+    parser.add_argument('-l', '--LATENCY', type=float, default=0, help="Latency added to every request in msec")
+    parser.add_argument('-m', '--THROTTLE_MODE', default=throttle.MODE_SESSION, choices=throttle.THROTTLE_MODES,
+                        help=("Shape each connection, each playback session (client IP address and %s header "
+                              "or folder) or all the clients together (link). Default = %s" % (
+                                  SESSION_HEADER, throttle.MODE_SESSION)))
+    parser.add_argument('-v', '--VERBOSE', action='store_true', default=False,
+                        help="Log every request")
+
+
+def create_throttle(args):
+    """ Module to create the throttle.Throttle from the arguments. Returns None when there is no shaping """
+    if args.TRACE:
+        periods = throttle.load_trace(args.TRACE)
+        schedule_factory = lambda: throttle.TraceRate(periods)
+    elif args.SPEED_LOG:
+        periods = throttle.load_speed_log(args.SPEED_LOG)
+        schedule_factory = lambda: throttle.TraceRate(periods)
+    elif args.GAUSS:
+        schedule_factory = lambda: throttle.GaussianRate(args.GAUSS[0], args.GAUSS[1], args.INTERVAL)
+    elif args.RATE:
+        schedule_factory = lambda: throttle.ConstantRate(args.RATE * 1000000 / 8)
+    elif args.LATENCY:
+        # Latency only: no token bucket, the responses are sent at full speed
+        schedule_factory = None
+    else:
+        return None
+    return throttle.Throttle(schedule_factory, args.THROTTLE_MODE, args.LATENCY / 1000.0)
 
 
 def update_config(args):
@@ -252,8 +499,10 @@ def main():
     parser = ArgumentParser(description='Process server parameters')
     create_arguments(parser)
     args = parser.parse_args()
-    #print "Len of args", len(args)
     update_config(args)
+    globals()['THROTTLE'] = create_throttle(args)
+    logging.basicConfig(level=logging.DEBUG if VERBOSE else logging.WARNING,
+                        format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
     start_server()
 
 
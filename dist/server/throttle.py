@@ -0,0 +1,453 @@
+"""
+Token bucket rate shaping for dash_server.py.
+
+Replaces tc (bandwidth_changer.py) and the mod_python ThrottleServer.py:
+the bandwidth seen by the clients is shaped by the server itself, without
+root privileges, per connection, per playback session or for the whole
+server (link).
+
+The bandwidth follows a RateSchedule (period_at() and volume(), the bytes
+allowed since the start of the schedule):
+    ConstantRate(rate)                  fixed rate
+    TraceRate(periods)                  replay of a bandwidth trace, see load_trace()
+    GaussianRate(mu, sigma, interval)   the Gaussian process of bandwidth_changer.py
+and every request can be delayed by a fixed latency.
+
+A TokenBucket does not sleep per block: a sender reserves a chunk of
+tokens and gets back the time at which the chunk may go out. The tokens
+may go negative (debt), so the timing errors of the sender do not add up
+and the average rate stays exact at high rates. The chunk size grows with
+the rate so that a throttled transfer sends about 1 / SEND_QUANTUM chunks
+per second whatever its rate.
+
+The chunks of all the throttled transfers are sent by a single Pacer
+thread, from a heap of ready times and a selector on the sockets whose
+send buffer is full. The handler thread of a request only waits for the
+end of its transfer, it does not wake up for every chunk.
+
+    throttle = Throttle(lambda: TraceRate.from_file("trace.txt"), mode=MODE_SESSION, latency=0.05)
+    bucket = throttle.get_bucket(client_address, session)
+    throttle.pacer.send(bucket, connection, byte_count, send_chunk)
+"""
+from __future__ import division
+import time
+import errno
+import heapq
+import random
+import socket
+import itertools
+from bisect import bisect_right
+import threading
+import logging
+try:
+    import selectors  # working for Python3
+except ImportError:
+    import selectors34 as selectors
+
+try:
+    clock = time.monotonic  # working for Python3
+except AttributeError:
+    clock = time.time
+
+# Parameters of bandwidth_changer.py
+GAUSS_MU = 3  # Mbps
+GAUSS_SIGMA = 0.6  # Mbps
+GAUSS_INTERVAL = 5  # seconds
+# tc does not accept negative rates: keep a minimum bandwidth (bytes per second)
+MIN_RATE = 1250
+# Seconds of data sent at once by a throttled connection
+SEND_QUANTUM = 0.01
+MIN_CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# Seconds of tokens a bucket can save when it is idle
+DEFAULT_BURST = 0.05
+# Shortest step of the walk over the periods of a schedule (seconds). The period boundaries are floats:
+# elapsed + period_left can round to a time just before the boundary, with a period_left of almost 0
+MIN_PERIOD_STEP = 1e-6
+# Seconds between two checks of the send timeouts by the Pacer
+TIMEOUT_CHECK_INTERVAL = 1
+
+MODE_CONNECTION = 'connection'
+MODE_SESSION = 'session'
+MODE_LINK = 'link'
+THROTTLE_MODES = [MODE_CONNECTION, MODE_SESSION, MODE_LINK]
+
+LOG = logging.getLogger('dash_server')
+
+
+class ConstantRate:
+    """ Fixed bandwidth """
+    def __init__(self, rate, latency=0):
+        """
+        :param rate: bandwidth in bytes per second
+        :param latency: latency of the requests in seconds
+        """
+        self.rate = max(rate, MIN_RATE)
+        self.latency = latency
+
+    def period_at(self, elapsed):
+        """ :return: (rate in bytes per second, latency in seconds, seconds until the next change) """
+        return self.rate, self.latency, float('inf')
+
+    def volume(self, elapsed):
+        """ :return: bytes allowed from the start of the schedule to elapsed seconds """
+        return self.rate * elapsed
+
+
+class TraceRate:
+    """ Bandwidth trace replayed in a loop """
+    def __init__(self, periods):
+        """
+        :param periods: list of (duration in seconds, rate in bytes per second, latency in seconds)
+        """
+        self.periods = [(duration, max(rate, MIN_RATE), latency) for duration, rate, latency in periods
+                        if duration > 0]
+        if not self.periods:
+            raise ValueError("Empty bandwidth trace")
+        self.duration = sum(period[0] for period in self.periods)
+        # Start time and bytes allowed before every period of a turn of the trace
+        self.period_starts = [0]
+        self.period_volumes = [0]
+        for duration, rate, _ in self.periods:
+            self.period_starts.append(self.period_starts[-1] + duration)
+            self.period_volumes.append(self.period_volumes[-1] + rate * duration)
+
+    @classmethod
+    def from_file(cls, trace_file):
+        return cls(load_trace(trace_file))
+
+    def period_at(self, elapsed):
+        """ :return: (rate in bytes per second, latency in seconds, seconds until the next change) """
+        position = elapsed % self.duration
+        index = min(bisect_right(self.period_starts, position), len(self.periods)) - 1
+        _, rate, latency = self.periods[index]
+        return rate, latency, self.period_starts[index + 1] - position
+
+    def volume(self, elapsed):
+        """ :return: bytes allowed from the start of the schedule to elapsed seconds """
+        turns, position = divmod(elapsed, self.duration)
+        index = min(bisect_right(self.period_starts, position), len(self.periods)) - 1
+        return (turns * self.period_volumes[-1] + self.period_volumes[index] +
+                self.periods[index][1] * (position - self.period_starts[index]))
+
+
+class GaussianRate:
+    """ Bandwidth drawn from N(mu, sigma) every interval seconds, as bandwidth_changer.py """
+    def __init__(self, mu=GAUSS_MU, sigma=GAUSS_SIGMA, interval=GAUSS_INTERVAL, seed=None, latency=0):
+        """
+        :param mu: Mean bandwidth in Mbps
+        :param sigma: Standard deviation in Mbps
+        :param interval: Seconds between two changes of the bandwidth
+        """
+        self.mu = mu
+        self.sigma = sigma
+        self.interval = interval
+        self.latency = latency
+        self.generator = random.Random(seed)
+        self.rates = []
+        # Bytes allowed before every interval
+        self.volumes = [0]
+
+    def get_index(self, elapsed):
+        """ Index of the interval of elapsed. The rates are drawn up to it """
+        index = int(elapsed // self.interval)
+        while len(self.rates) <= index:
+            self.rates.append(max(self.generator.gauss(self.mu, self.sigma) * 1000000 / 8, MIN_RATE))
+            self.volumes.append(self.volumes[-1] + self.rates[-1] * self.interval)
+        return index
+
+    def period_at(self, elapsed):
+        """ :return: (rate in bytes per second, latency in seconds, seconds until the next change) """
+        index = self.get_index(elapsed)
+        return self.rates[index], self.latency, (index + 1) * self.interval - elapsed
+
+    def volume(self, elapsed):
+        """ :return: bytes allowed from the start of the schedule to elapsed seconds """
+        index = self.get_index(elapsed)
+        return self.volumes[index] + self.rates[index] * (elapsed - index * self.interval)
+
+
+def load_trace(trace_file):
+    """ Module to read a bandwidth trace. Same format as the traces of client/simulation.py:
+        one '<duration in s> <bandwidth in Mbps> [<latency in ms>]' line per period, '#' for comments.
+        :return: list of (duration in seconds, rate in bytes per second, latency in seconds)
+    """
+    periods = []
+    with open(trace_file) as trace_handle:
+        for line in trace_handle:
+            line = line.split('#')[0].split()
+            if not line:
+                continue
+            latency = float(line[2]) / 1000 if len(line) > 2 else 0
+            periods.append((float(line[0]), float(line[1]) * 1000000 / 8, latency))
+    return periods
+
+
+def load_speed_log(speed_log_file):
+    """ Module to read the speed log of ThrottleServer.py: one rate in bytes per second per line,
+        each line lasting one second.
+        :return: list of (duration in seconds, rate in bytes per second, latency in seconds)
+    """
+    with open(speed_log_file) as speed_handle:
+        return [(1, int(line.strip()), 0) for line in speed_handle if line.strip()]
+
+
+class TokenBucket:
+    """ Token bucket refilled at the rate of a RateSchedule. Thread safe. """
+    def __init__(self, schedule, burst=DEFAULT_BURST):
+        """
+        :param schedule: ConstantRate, TraceRate or GaussianRate
+        :param burst: seconds of tokens saved when the bucket is idle
+        """
+        self.schedule = schedule
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.start_time = self.last_update = clock()
+        self.tokens = 0
+        self.last_used = self.start_time
+
+    def _refill(self, now):
+        """ Add the tokens earned since the last update. Must be called with the lock held """
+        if now > self.last_update:
+            # The schedule gives the bytes allowed since its start: no walk over the periods of a long idle
+            self.tokens += (self.schedule.volume(now - self.start_time) -
+                            self.schedule.volume(self.last_update - self.start_time))
+        self.tokens = min(self.tokens, rate_now(self.schedule, now - self.start_time) * self.burst)
+        self.last_update = now
+
+    def chunk_size(self):
+        """ Number of bytes to send at once: SEND_QUANTUM seconds of data at the current rate """
+        with self.lock:
+            rate = rate_now(self.schedule, clock() - self.start_time)
+        return int(min(max(rate * SEND_QUANTUM, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE))
+
+    def latency(self):
+        """ Latency of a new request in seconds """
+        with self.lock:
+            return self.schedule.period_at(clock() - self.start_time)[1]
+
+    def reserve(self, size):
+        """ Take size tokens from the bucket.
+            :return: the time (see clock) at which the size bytes may be sent
+        """
+        with self.lock:
+            now = clock()
+            self.last_used = now
+            self._refill(now)
+            self.tokens -= size
+            if self.tokens >= 0:
+                return now
+            # Time to earn the missing tokens
+            debt = -self.tokens
+            elapsed = now - self.start_time
+            ready_time = now
+            while debt > 0:
+                rate, _, period_left = self.schedule.period_at(elapsed)
+                step = min(debt / rate, max(period_left, MIN_PERIOD_STEP))
+                debt -= rate * step
+                elapsed += step
+                ready_time += step
+            return ready_time
+
+
+def rate_now(schedule, elapsed):
+    return schedule.period_at(elapsed)[0]
+
+
+class Throttle:
+    """ Token buckets of the clients of the server """
+    def __init__(self, schedule_factory, mode=MODE_SESSION, latency=0, burst=DEFAULT_BURST):
+        """
+        :param schedule_factory: function returning a new RateSchedule for each bucket.
+                                 None when only the latency is added: there is no bucket
+        :param mode: MODE_CONNECTION (one bucket per TCP connection), MODE_SESSION (one bucket per
+                     (client IP address, session path), the key of the sessions of dash_server.py)
+                     or MODE_LINK (one bucket shared by all the clients)
+        :param latency: seconds added before every response (on top of the trace latency)
+        """
+        if mode not in THROTTLE_MODES:
+            raise ValueError("Unknown throttle mode {}".format(mode))
+        self.schedule_factory = schedule_factory
+        self.mode = mode
+        self.latency = latency
+        self.burst = burst
+        self.buckets = dict()
+        self.lock = threading.Lock()
+        self.pacer = Pacer() if schedule_factory else None
+
+    def bucket_key(self, client_address, session=None):
+        if self.mode == MODE_CONNECTION:
+            return tuple(client_address)
+        if self.mode == MODE_SESSION:
+            return client_address[0], session
+        return None
+
+    def get_bucket(self, client_address, session=None):
+        """ Return the bucket of the client, created on the first request
+        :param client_address: (IP address, port) of the connection
+        :param session: session of the request on the client (see dash_server.get_session_path)
+        :return: TokenBucket or None when the bandwidth is not limited
+        """
+        if self.schedule_factory is None:
+            return None
+        key = self.bucket_key(client_address, session)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.schedule_factory(), self.burst)
+                LOG.info("New token bucket for {}".format(key))
+        return bucket
+
+    def request_latency(self, bucket):
+        """ Seconds to wait before answering a request """
+        if bucket is None:
+            return self.latency
+        return self.latency + bucket.latency()
+
+    def release(self, client_address):
+        """ Forget the bucket of a closed connection (MODE_CONNECTION only) """
+        if self.mode == MODE_CONNECTION:
+            with self.lock:
+                self.buckets.pop(self.bucket_key(client_address), None)
+
+    def expire(self, timeout):
+        """ Forget the buckets unused for more than timeout seconds """
+        now = clock()
+        with self.lock:
+            for key in [key for key, bucket in self.buckets.items() if now - bucket.last_used > timeout]:
+                del self.buckets[key]
+
+
+class Transfer:
+    """ Body of a response sent by the Pacer """
+    def __init__(self, bucket, connection, count, send_chunk, timeout):
+        self.bucket = bucket
+        self.connection = connection
+        self.count = count
+        self.send_chunk = send_chunk
+        self.timeout = timeout
+        self.sent = 0
+        # Bytes reserved in the bucket and not sent yet
+        self.pending = 0
+        # Time (see clock) after which a transfer waiting for the socket fails
+        self.deadline = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Pacer:
+    """ Thread sending the chunks of all the throttled transfers at the time given by their bucket """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Transfers added by the handler threads, picked up by the pacer thread
+        self.incoming = list()
+        # (ready time, sequence number, transfer) of the transfers waiting for tokens
+        self.heap = list()
+        self.sequence = itertools.count()
+        # Transfers waiting for room in the send buffer of their socket
+        self.writers = set()
+        self.next_timeout_check = clock()
+        self.selector = selectors.DefaultSelector()
+        self.wake_receiver, self.wake_sender = socket.socketpair()
+        self.wake_receiver.setblocking(False)
+        self.selector.register(self.wake_receiver, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, bucket, connection, count, send_chunk, timeout=None):
+        """ Send count bytes at the rate of the bucket. Blocks until the transfer is done.
+        :param connection: socket of the client. It is non-blocking during the transfer
+        :param send_chunk: function(offset, length) sending at most length bytes from offset on the
+                           non-blocking connection. Returns the number of bytes sent
+        :param timeout: seconds the socket may stay full before the transfer fails with socket.timeout
+        :return: number of bytes sent
+        """
+        transfer = Transfer(bucket, connection, count, send_chunk, timeout)
+        previous_timeout = connection.gettimeout()
+        connection.settimeout(0)
+        try:
+            with self.lock:
+                self.incoming.append(transfer)
+            self.wake_sender.send(b'\0')
+            transfer.done.wait()
+        finally:
+            connection.settimeout(previous_timeout)
+        if transfer.error:
+            raise transfer.error
+        return transfer.sent
+
+    def run(self):
+        while True:
+            timeout = None
+            if self.heap:
+                timeout = max(self.heap[0][0] - clock(), 0)
+            if self.writers:
+                timeout = max(min(timeout if timeout is not None else TIMEOUT_CHECK_INTERVAL,
+                                  self.next_timeout_check - clock()), 0)
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self.wake_receiver:
+                    self.take_incoming()
+                else:
+                    self.selector.unregister(key.fileobj)
+                    self.writers.discard(key.data)
+                    self.advance(key.data)
+            while self.heap and self.heap[0][0] <= clock():
+                self.advance(heapq.heappop(self.heap)[2])
+            if self.writers and clock() >= self.next_timeout_check:
+                self.check_timeouts()
+
+    def take_incoming(self):
+        try:
+            while self.wake_receiver.recv(4096):
+                pass
+        except (IOError, OSError):
+            pass
+        with self.lock:
+            incoming, self.incoming = self.incoming, list()
+        for transfer in incoming:
+            self.advance(transfer)
+
+    def check_timeouts(self):
+        now = clock()
+        self.next_timeout_check = now + TIMEOUT_CHECK_INTERVAL
+        for transfer in [transfer for transfer in self.writers if transfer.deadline and now > transfer.deadline]:
+            self.selector.unregister(transfer.connection)
+            self.writers.discard(transfer)
+            self.finish(transfer, socket.timeout("timed out"))
+
+    def advance(self, transfer):
+        """ Send the chunks of the transfer until it has to wait for tokens or for the socket """
+        try:
+            while True:
+                if not transfer.pending:
+                    if transfer.sent >= transfer.count:
+                        self.finish(transfer)
+                        return
+                    transfer.pending = min(transfer.bucket.chunk_size(), transfer.count - transfer.sent)
+                    ready_time = transfer.bucket.reserve(transfer.pending)
+                    if ready_time > clock():
+                        heapq.heappush(self.heap, (ready_time, next(self.sequence), transfer))
+                        return
+                sent = transfer.send_chunk(transfer.sent, transfer.pending)
+                if not sent:
+                    raise IOError("Nothing left to send after {} of {} bytes".format(transfer.sent, transfer.count))
+                transfer.sent += sent
+                transfer.pending -= sent
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.finish(transfer, e)
+                return
+        except Exception as e:
+            LOG.exception("Unexpected error while sending to {}".format(transfer.connection))
+            self.finish(transfer, e)
+            return
+        # The send buffer of the socket is full
+        if transfer.timeout:
+            transfer.deadline = clock() + transfer.timeout
+        self.selector.register(transfer.connection, selectors.EVENT_WRITE, transfer)
+        self.writers.add(transfer)
+
+    def finish(self, transfer, error=None):
+        transfer.error = error
+        transfer.done.set()
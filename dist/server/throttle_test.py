@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Check of throttle.py: the schedules are compared with a naive walk over
+their periods, and the bytes sent by the Pacer through a socket pair are
+compared with the volume() of the schedule of the bucket.
+
+From commandline:
+    python3 throttle_test.py
+"""
+from __future__ import print_function, division
+import random
+import socket
+import threading
+import throttle
+
+# Bandwidth trace of the accuracy checks: (duration in seconds, rate in bytes per second, latency in seconds)
+TEST_PERIODS = [(0.3, 4000000, 0), (0.2, 1000000, 0.01), (0.25, 2500000, 0)]
+# Tolerated error on the duration of a shaped transfer (fraction of the expected duration)
+DURATION_TOLERANCE = 0.1
+
+
+def naive_period_at(periods, elapsed):
+    """ Linear walk over the periods of a trace played in a loop """
+    position = elapsed % sum(period[0] for period in periods)
+    for duration, rate, latency in periods:
+        if position < duration:
+            return rate, latency, duration - position
+        position -= duration
+    duration, rate, latency = periods[-1]
+    return rate, latency, duration
+
+
+def naive_volume(periods, elapsed):
+    """ Bytes allowed by a trace played in a loop, summed period by period """
+    volume = 0
+    start = 0
+    while True:
+        for duration, rate, _ in periods:
+            if elapsed <= start + duration:
+                return volume + rate * (elapsed - start)
+            volume += rate * duration
+            start += duration
+
+
+def test_trace_rate():
+    trace = throttle.TraceRate(TEST_PERIODS)
+    generator = random.Random(1)
+    times = [generator.uniform(0, 10) for _ in range(1000)] + [0, 0.3, 0.5, 0.75, 1.5, 7.5]
+    for elapsed in times:
+        rate, latency, period_left = trace.period_at(elapsed)
+        expected = naive_period_at(TEST_PERIODS, elapsed)
+        assert (rate, latency) == expected[:2], "period_at({}) = {} instead of {}".format(
+            elapsed, (rate, latency), expected[:2])
+        assert abs(period_left - expected[2]) < 1e-9
+        assert abs(trace.volume(elapsed) - naive_volume(TEST_PERIODS, elapsed)) < 1e-3
+
+
+def test_latency_only():
+    shaper = throttle.Throttle(None, throttle.MODE_SESSION, latency=0.04)
+    bucket = shaper.get_bucket(('127.0.0.1', 1234), '/media')
+    assert bucket is None
+    assert shaper.request_latency(bucket) == 0.04
+
+
+def read_all(connection, count, progress):
+    """ Read count bytes, recording (clock, total bytes received) after every read """
+    received = 0
+    while received < count:
+        data = connection.recv(256 * 1024)
+        if not data:
+            break
+        received += len(data)
+        progress.append((throttle.clock(), received))
+
+
+def shaped_transfer(pacer, bucket, count):
+    """ Send count bytes through a socket pair.
+        :return: (seconds from the start of the bucket to the last byte, list of (clock, bytes received))
+    """
+    sender, receiver = socket.socketpair()
+    progress = list()
+    reader = threading.Thread(target=read_all, args=(receiver, count, progress))
+    reader.start()
+    data = memoryview(bytearray(count))
+    try:
+        pacer.send(bucket, sender, count, lambda offset, length: sender.send(data[offset:offset + length]))
+        reader.join()
+    finally:
+        sender.close()
+        receiver.close()
+    assert progress and progress[-1][1] == count
+    return progress[-1][0] - bucket.start_time, progress
+
+
+def test_shaper_accuracy():
+    """ The bytes received never exceed volume() (plus the burst and one chunk) and the transfer ends in time """
+    pacer = throttle.Pacer()
+    schedule = throttle.TraceRate(TEST_PERIODS)
+    bucket = throttle.TokenBucket(schedule)
+    duration = 1.6
+    count = int(schedule.volume(duration))
+    elapsed, progress = shaped_transfer(pacer, bucket, count)
+    assert abs(elapsed - duration) < duration * DURATION_TOLERANCE, \
+        "{} bytes sent in {} seconds instead of {}".format(count, elapsed, duration)
+    max_rate = max(period[1] for period in TEST_PERIODS)
+    margin = max_rate * (bucket.burst + throttle.SEND_QUANTUM)
+    for receive_time, received in progress:
+        allowed = schedule.volume(receive_time - bucket.start_time)
+        assert received <= allowed + margin, "{} bytes received when {} are allowed".format(received, allowed)
+
+
+def test_shared_bucket():
+    """ Concurrent transfers on one bucket (MODE_LINK) share its rate """
+    pacer = throttle.Pacer()
+    rate = 2000000
+    bucket = throttle.TokenBucket(throttle.ConstantRate(rate))
+    results = list()
+    transfers = [threading.Thread(target=lambda: results.append(shaped_transfer(pacer, bucket, rate // 8)[0]))
+                 for _ in range(8)]
+    for transfer in transfers:
+        transfer.start()
+    for transfer in transfers:
+        transfer.join()
+    assert len(results) == 8
+    assert abs(max(results) - 1) < DURATION_TOLERANCE, "{} bytes sent in {} seconds instead of 1".format(
+        rate, max(results))
+
+
+def test_send_timeout():
+    """ A client that does not read fails the transfer after the timeout instead of blocking the Pacer """
+    pacer = throttle.Pacer()
+    bucket = throttle.TokenBucket(throttle.ConstantRate(100000000))
+    sender, receiver = socket.socketpair()
+    data = memoryview(bytearray(64 * 1024 * 1024))
+    start_time = throttle.clock()
+    try:
+        pacer.send(bucket, sender, len(data), lambda offset, length: sender.send(data[offset:offset + length]),
+                   timeout=0.5)
+        assert False, "The transfer did not time out"
+    except socket.timeout:
+        pass
+    finally:
+        sender.close()
+        receiver.close()
+    assert throttle.clock() - start_time < 0.5 + 2 * throttle.TIMEOUT_CHECK_INTERVAL
+
+
+if __name__ == "__main__":
+    for test in (test_trace_rate, test_latency_only, test_shaper_accuracy, test_shared_bucket, test_send_timeout):
+        test()
+        print("{}: OK".format(test.__name__))